@@ -1,12 +1,64 @@
+from functools import cached_property
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
 from rest_framework.exceptions import ValidationError
 from django import forms
 
+from .filters import search_reports
 from .models import User, Task
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of unfiltered changelists from the planner
+    statistics (`pg_class.reltuples`, SQLite's `sqlite_stat1` as of the
+    last ANALYZE) instead of counting the whole table. Small or never
+    analyzed tables, and filtered or searched changelists, are counted.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            estimate = table_row_estimate(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+def table_row_estimate(model, using):
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                # -1 until the table is first vacuumed or analyzed.
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                # The first number of each index's stat is its row count; a
+                # partial index counts fewer rows than the table.
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+                counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                return max(counts, default=None)
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE has run.
+        pass
+    return None
+
+
+def prefix_q(field, term):
+    # An index range rather than LIKE, which SQLite indexes cannot serve.
+    return Q(**{f'{field}__gte': term, f'{field}__lt': term + '\U0010ffff'})
+
+
 class CustomUserChangeForm(UserChangeForm):
     class Meta:
         model = User
@@ -50,9 +102,12 @@ class CustomUserAdmin(UserAdmin):
     form = CustomUserChangeForm
     add_form = CustomUserCreationForm
 
-    search_fields = ('email',)
-    list_display = ('username', 'email', 'first_name', 'last_name', 'phone', 'is_staff',)
-    list_filter = ('is_staff', 'is_active',)
+    search_fields = ('username', 'email', 'phone')
+    search_help_text = 'Start of the username, email or phone number (case-sensitive).'
+    list_display = ('username', 'email', 'first_name', 'last_name', 'phone', 'role', 'is_staff',)
+    list_filter = ('role', 'is_staff', 'is_active',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('username', 'email')}),
         ('Personal info', {'fields': ('first_name', 'last_name', 'phone', 'role')}),
@@ -66,6 +121,14 @@ class CustomUserAdmin(UserAdmin):
         ('Groups and Permissions', {'fields': ('user_permissions',)}),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Prefix matches on the indexed username, email and phone columns
+        # instead of a substring scan over all three.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(prefix_q('username', term) | prefix_q('email', term) | prefix_q('phone', term)), False
+
 
 class TaskForm(forms.ModelForm):
     class Meta:
@@ -96,4 +159,25 @@ class TaskForm(forms.ModelForm):
 class TaskAdmin(admin.ModelAdmin):
     form = TaskForm
     fields = ['customer', 'employee', 'status', 'report']
+    autocomplete_fields = ['customer', 'employee']
+    list_display = ('id', 'customer', 'employee', 'status', 'created_at', 'closed_at')
+    list_select_related = ('customer', 'employee')
+    list_filter = ('status',)
+    # Orders the task indexes serve, with or without the status filter.
+    ordering = ('-created_at', '-id')
+    sortable_by = ('id', 'created_at', 'closed_at')
+    search_fields = ('report',)
+    search_help_text = 'Task id, username prefix of the customer or employee, or words of the report.'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        users = User.objects.filter(prefix_q('username', term)).values('pk')
+        matches = queryset.filter(Q(customer__in=users) | Q(employee__in=users)) | search_reports(queryset, term)
+        return matches, False
 
@@ -0,0 +1,37 @@
+from django.db import connections, transaction
+
+from .models import ArchivedTask, Task
+
+ARCHIVE_FIELDS = ('id', 'customer_id', 'employee_id', 'created_at', 'updated_at', 'closed_at', 'status', 'report')
+
+
+def archive_tasks(before, batch_size=1000):
+    """
+    Moves tasks completed before `before` from `Task` to `ArchivedTask`,
+    `batch_size` at a time and each batch in its own transaction, so writers
+    are never held up for long. Returns the number of tasks moved.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(Task.objects.filter(status=Task.COMPLETED, closed_at__lt=before).order_by('closed_at')
+                        .select_for_update().values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            ArchivedTask.objects.bulk_create(ArchivedTask(**row) for row in rows)
+            delete_tasks([row['id'] for row in rows])
+        moved += len(rows)
+
+
+def delete_tasks(pks):
+    # A move rather than a deletion: plain SQL skips the post_delete
+    # receivers, which would take the tasks out of the stats and send
+    # deleted events, and the collector's per-object work.
+    connection = connections[Task.objects.db]
+    table = connection.ops.quote_name(Task._meta.db_table)
+    column = connection.ops.quote_name(Task._meta.pk.column)
+    batch_size = connection.ops.bulk_batch_size([Task._meta.pk], pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(batch))})', batch)
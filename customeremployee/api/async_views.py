@@ -0,0 +1,185 @@
+import heapq
+import time
+from itertools import islice
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+
+from .directory import adirectory_page_key, directory_cache
+from .events import event_data, task_event_bus
+from .models import TaskEvent
+from .routers import read_from_primary
+from .views import CurrentUserView, EmployeeListView, TaskViewSet
+
+
+async def aiterate(queryset, chunk_size):
+    """
+    Like `QuerySet.aiterator()`, which on Django 5.0 runs values_list()
+    queries in the event loop: every chunk is fetched in a worker thread.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    fetch_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await fetch_chunk():
+        for row in chunk:
+            yield row
+
+
+async def amerge(iterators, key):
+    """
+    `heapq.merge()` for async iterators of rows, none of which is None.
+    """
+    heap = []
+    for index, iterator in enumerate(iterators):
+        row = await anext(iterator, None)
+        if row is not None:
+            heap.append((key(row), index, row))
+    heapq.heapify(heap)
+    while heap:
+        _, index, row = heap[0]
+        yield row
+        row = await anext(iterators[index], None)
+        if row is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(row), index, row))
+
+
+class AsyncReadMixin:
+    """
+    Serves GET and HEAD from async handlers named after the action (`alist`,
+    `aretrieve`) or `aget`, reading through the async ORM so an ASGI worker
+    is not blocked on the database. Other methods, and reads without an
+    async handler, run as sync code in a worker thread.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        markcoroutinefunction(view)
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication and permission checks may still hit the database
+            # or the cache for tokens without claims.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f'a{getattr(self, "action", None) or "get"}', None)
+            if handler is not None:
+                response = await handler(request, *args, **kwargs)
+            else:
+                # Reads without an async variant run as sync code in a thread.
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_queryset(self):
+        # Building the queryset may check permissions, which can query.
+        return await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+
+    async def aget_object(self):
+        queryset = await self.aget_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.aget_queryset()
+        values = self.fingerprint_values(queryset)
+        rows = await self.paginator.apaginate_queryset(values, request, view=self)
+        if rows is None:
+            rows = [row async for row in values]
+        etag = self.list_etag(request, rows)
+
+        response = self.not_modified(request, etag)
+        if response is None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            response = self.get_paginated_response(self.get_read_serializer(page, many=True).data)
+        return self.set_validators(response, etag)
+
+
+class AsyncTaskViewSet(AsyncReadMixin, TaskViewSet):
+    async def aretrieve(self, request, *args, **kwargs):
+        try:
+            task = await self.aget_object()
+        except Http404:
+            task = await sync_to_async(self.get_archived_object)()
+        return self.conditional_response(request, lambda: Response(self.get_read_serializer(task).data),
+                                         self.task_etag(task), task.updated_at)
+
+    async def aexport(self, request, *args, **kwargs):
+        querysets = await sync_to_async(self.export_querysets)()
+        rows = amerge([aiterate(self.export_rows(queryset), self.export_chunk_size) for queryset in querysets],
+                      self.export_key())
+        return self.export_response(request, request.accepted_renderer.astream(self.export_columns(), rows))
+
+    async def aevent_stream(self, renderer, events, last_id):
+        # event_stream() with the waits on the event loop instead of a thread.
+        deadline = time.monotonic() + self.events_stream_seconds
+        yield renderer.retry(self.events_retry_milliseconds)
+        reset_id = await sync_to_async(self.events_reset_id)(last_id)
+        if reset_id is not None:
+            last_id = reset_id
+            yield renderer.event(last_id, 'reset', {})
+        while True:
+            version = task_event_bus.version
+            batch = await sync_to_async(self.events_batch)(events, last_id)
+            for event in batch:
+                yield renderer.event(event.stream_id, event.kind, event_data(event))
+            if batch:
+                last_id = batch[-1].stream_id
+            if len(batch) == self.events_batch_size:
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not await task_event_bus.await_change(version, min(self.events_poll_seconds, remaining)):
+                yield renderer.comment('keep-alive')
+
+    async def aevents(self, request, *args, **kwargs):
+        last_id = await sync_to_async(self.events_start)(request)
+        events = await sync_to_async(lambda: TaskEvent.objects.visible_to(request.user).streamed())()
+        return self.events_response(self.aevent_stream(request.accepted_renderer, events, last_id))
+
+
+class AsyncEmployeeListView(AsyncReadMixin, EmployeeListView):
+    async def aget(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        cache = directory_cache()
+        key = await adirectory_page_key(self.page_url(request))
+        entry = await cache.aget(key)
+        if entry is None:
+            with read_from_primary():
+                queryset = await self.aget_queryset()
+                page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+                data = self.get_paginated_response(self.get_read_serializer(page, many=True).data).data
+            entry = (self.fingerprint(data), data)
+            await cache.aset(key, entry, settings.EMPLOYEE_DIRECTORY_CACHE_TIMEOUT)
+        etag, data = entry
+        return self.conditional_response(request, lambda: Response(data), etag)
+
+
+class AsyncCurrentUserView(AsyncReadMixin, CurrentUserView):
+    async def aget(self, request):
+        return self.get(request)
@@ -0,0 +1,41 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .backends import load_permissions
+from .models import ClaimsUser
+
+VERSION_CLAIM = 'ver'
+PERMISSIONS_CLAIM = 'perms'
+PROFILE_CLAIMS = ('username', 'first_name', 'last_name', 'email', 'phone', 'role', 'is_superuser', 'is_staff')
+
+
+def add_user_claims(token, user):
+    for claim in PROFILE_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token[PERMISSIONS_CLAIM] = sorted(
+        permission.split('.', 1)[1] for permission in load_permissions(user) if permission.startswith('api.')
+    )
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Authenticates from the role, profile and permission claims embedded in the
+    access token instead of loading the user row on every request.
+
+    Tokens issued without those claims fall back to the database lookup.
+    """
+
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        user = ClaimsUser(
+            pk=validated_token[api_settings.USER_ID_CLAIM],
+            token_version=validated_token[VERSION_CLAIM],
+            **{claim: validated_token[claim] for claim in PROFILE_CLAIMS},
+        )
+        user._state.adding = False
+        user._perm_cache = {f'api.{codename}' for codename in validated_token[PERMISSIONS_CLAIM]}
+        return user
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+def permission_cache_key(user_id):
+    return f'api:permissions:{user_id}'
+
+
+def invalidate_permissions(user_ids):
+    keys = [permission_cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # A request running before the change commits may have cached the old
+    # permissions in the meantime, so drop them once more after the commit.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def load_permissions(user_obj):
+    """
+    The permission set of `user_obj` read from the database rather than the
+    cache, for copies that outlive the cache entry, such as token claims.
+    """
+    if not user_obj.is_active or user_obj.is_anonymous:
+        return set()
+    backend = ModelBackend()
+    return {*backend.get_user_permissions(user_obj), *backend.get_group_permissions(user_obj)}
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    `ModelBackend` that keeps each user's permission set in the Django cache,
+    so that only the first request after a change loads it from the database.
+    Entries are invalidated by the receivers in `signals.py`.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, settings.PERMISSION_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
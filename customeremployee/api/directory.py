@@ -0,0 +1,34 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'api:employees:generation'
+
+
+def directory_cache():
+    return caches[settings.EMPLOYEE_DIRECTORY_CACHE]
+
+
+def page_key(generation, url):
+    # Pages are keyed by the directory generation, so a new generation drops
+    # every cached page at once and stale ones simply expire.
+    digest = hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+    return f'api:employees:{generation}:{digest}'
+
+
+def directory_page_key(url):
+    return page_key(directory_cache().get_or_set(GENERATION_KEY, time.time_ns, None), url)
+
+
+async def adirectory_page_key(url):
+    return page_key(await directory_cache().aget_or_set(GENERATION_KEY, time.time_ns, None), url)
+
+
+def invalidate_employee_directory():
+    directory_cache().set(GENERATION_KEY, time.time_ns(), None)
+    # A request running before the change commits may have cached the old
+    # page under the new generation, so start another one after the commit.
+    transaction.on_commit(lambda: directory_cache().set(GENERATION_KEY, time.time_ns(), None))
@@ -0,0 +1,50 @@
+import heapq
+from collections import Counter
+
+from .models import EmployeeTaskStats, Task, User
+
+
+def least_loaded_employees(limit, max_open=None):
+    """
+    The `limit` active employees with the fewest tasks in progress, as
+    `(open task count, pk)` pairs, read from `EmployeeTaskStats` rather than
+    counted from the task table. Every employee has a stats row, and the
+    rows are read in the order of their `in_progress` index, so a round
+    reads about `limit` of them however many employees there are.
+    """
+    stats = EmployeeTaskStats.objects.filter(employee__role=User.EMPLOYEE, employee__is_active=True)
+    if max_open is not None:
+        stats = stats.filter(in_progress__lt=max_open)
+    return list(stats.order_by('in_progress', 'pk').values_list('in_progress', 'pk')[:limit])
+
+
+def dispatch_tasks(batch_size=100, max_open=None):
+    """
+    Assigns up to `batch_size` of the oldest pending tasks, each to the
+    employee with the fewest tasks in progress at that point, and returns
+    `{employee pk: number of tasks assigned}`. Employees with `max_open`
+    tasks in progress get no more.
+
+    Tasks are claimed with `TaskQuerySet.claim_each()` in one update, so
+    tasks claimed by someone else in the meantime are skipped and the
+    counters, statistics and events follow as for any other claim.
+    """
+    tasks = list(Task.objects.pending().order_by('created_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not tasks:
+        return {}
+    # No round assigns more tasks than this, so it never reaches further
+    # down the load order than the len(tasks) least loaded employees.
+    heap = least_loaded_employees(len(tasks), max_open)
+    assignments = {}
+    for pk in tasks:
+        if not heap:
+            break
+        open_tasks, employee = heap[0]
+        assignments[pk] = employee
+        if max_open is not None and open_tasks + 1 >= max_open:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (open_tasks + 1, employee))
+    if not assignments:
+        return {}
+    return dict(Counter(assignments[pk] for pk in Task.objects.claim_each(assignments)))
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+from django.db import transaction
+
+from .models import Task, TaskEvent
+
+
+class TaskEventBus:
+    """
+    In-process wake-up for event streams. The TaskEvent table is the source
+    of truth; the bus only tells streams in this process to query it right
+    away instead of at their next poll, which also picks up events written
+    by other processes.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.condition = threading.Condition()
+        self.waiters = set()
+
+    def publish(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+            waiters = list(self.waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def wait(self, version, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.version != version, timeout)
+
+    async def await_change(self, version, timeout):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.condition:
+            if self.version != version:
+                return True
+            self.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self.condition:
+                self.waiters.discard(waiter)
+
+
+task_event_bus = TaskEventBus()
+
+EVENT_LOCK_KEY = 0x7461736b  # 'task'
+
+# Numbers committed events without a position in id order. Rows of
+# transactions still in flight are invisible to it and numbered by a later
+# run, so positions follow commit order.
+NUMBER_EVENTS_SQL = """
+    UPDATE api_taskevent AS event SET position = numbered.position
+    FROM (SELECT id, nextval('api_taskevent_position_seq') AS position
+          FROM (SELECT id FROM api_taskevent WHERE position IS NULL ORDER BY id) AS unnumbered) AS numbered
+    WHERE event.id = numbered.id
+"""
+
+
+def event_kind(old, new):
+    if old is None:
+        return TaskEvent.CREATED
+    if new is None:
+        return TaskEvent.DELETED
+    if new.status == Task.COMPLETED and old.status != Task.COMPLETED:
+        return TaskEvent.COMPLETED
+    if new.employee_id is not None and new.employee_id != old.employee_id:
+        return TaskEvent.ASSIGNED
+    return TaskEvent.UPDATED
+
+
+def record_task_events(changes):
+    events = []
+    for old, new in changes:
+        state = new or old
+        events.append(TaskEvent(task_id=state.id, kind=event_kind(old, new), status=state.status,
+                                customer_id=state.customer_id, employee_id=state.employee_id,
+                                previous_employee_id=(old or new).employee_id))
+    TaskEvent.objects.bulk_create(events)
+    transaction.on_commit(publish_task_events)
+
+
+def number_task_events():
+    """
+    Gives committed events their stream position on backends other than
+    SQLite. Streams resume from the highest position they have seen, so
+    positions are handed out after commit, by one short transaction at a
+    time, rather than making every task write wait for the others.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor == 'sqlite':
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [EVENT_LOCK_KEY])
+        cursor.execute(NUMBER_EVENTS_SQL)
+
+
+def publish_task_events():
+    number_task_events()
+    task_event_bus.publish()
+
+
+def event_data(event):
+    return {'task': event.task_id, 'status': event.status, 'customer': event.customer_id,
+            'employee': event.employee_id, 'time': event.created_at}
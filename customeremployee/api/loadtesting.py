@@ -0,0 +1,187 @@
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.core.management.base import CommandError
+
+SERVERS = {
+    'wsgi': ['-m', 'gunicorn', 'customeremployee.wsgi:application', '--bind', '127.0.0.1:{port}',
+             '--workers', '{workers}'],
+    'asgi': ['-m', 'uvicorn', 'customeremployee.asgi:application', '--host', '127.0.0.1', '--port', '{port}',
+             '--workers', '{workers}', '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f'Server did not start listening on port {port}')
+
+
+@contextmanager
+def run_server(mode, workers, **env):
+    """
+    Serves the API under gunicorn (`wsgi`) or uvicorn (`asgi`) on a free
+    local port, which it yields, with `env` added to the environment.
+    """
+    port = free_port()
+    command = [sys.executable] + [part.format(port=port, workers=workers) for part in SERVERS[mode]]
+    server = subprocess.Popen(command, env={**os.environ, **env})
+    try:
+        wait_for_port(port)
+        yield port
+    finally:
+        server.terminate()
+        server.wait()
+
+
+class Operation:
+    """
+    A request benchmark clients make `weight` times per round. `path` and
+    `body` may be functions of the client; a path of None skips the request,
+    e.g. completing a task before one was claimed. `after(client, data)`
+    reads the JSON response of successful requests into the client's state.
+    """
+
+    def __init__(self, name, method, path, body=None, weight=1, after=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.weight = weight
+        self.after = after
+
+
+class BenchmarkClient:
+    """
+    One authenticated user issuing a shuffled round of `operations` over a
+    keep-alive connection until the deadline, recording the latency and
+    status of each request by operation name.
+    """
+
+    def __init__(self, host, port, role, user, token, operations, rng, password=None):
+        self.host = host
+        self.port = port
+        self.role = role
+        self.user = user
+        self.token = token
+        self.password = password
+        self.rng = rng
+        self.rounds = [operation for operation in operations for _ in range(operation.weight)]
+        self.state = defaultdict(list)
+        self.samples = defaultdict(list)
+        self.paths = {}
+        self.access_token = None
+        self.access_token_renewed = 0
+
+    def authorization(self):
+        # Access tokens expire after ACCESS_TOKEN_LIFETIME; renew them well
+        # before that rather than signing one per request.
+        if time.monotonic() - self.access_token_renewed > 60:
+            self.access_token = str(self.token.access_token)
+            self.access_token_renewed = time.monotonic()
+        return f'Bearer {self.access_token}'
+
+    def request(self, connection, operation):
+        path = operation.path(self) if callable(operation.path) else operation.path
+        if path is None:
+            return
+        body = operation.body(self) if callable(operation.body) else operation.body
+        headers = {'Authorization': self.authorization(), 'Host': 'localhost'}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(body)
+        started = time.perf_counter()
+        connection.request(operation.method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        content = response.read()
+        self.samples[operation.name].append((time.perf_counter() - started, response.status))
+        self.paths.setdefault(operation.name, path)
+        if operation.after and 200 <= response.status < 300 and content:
+            operation.after(self, json.loads(content))
+
+    def run(self, deadline):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            while time.monotonic() < deadline:
+                self.rng.shuffle(self.rounds)
+                for operation in self.rounds:
+                    if time.monotonic() >= deadline:
+                        break
+                    try:
+                        self.request(connection, operation)
+                    except (OSError, http.client.HTTPException):
+                        self.samples[operation.name].append((None, 'connection error'))
+                        connection.close()
+                        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        finally:
+            connection.close()
+
+
+def run_clients(clients, duration):
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client.run, args=(deadline,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(seconds for seconds, _ in samples if seconds is not None)
+    summary = {
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 2),
+        'statuses': dict(Counter(str(status) for _, status in samples)),
+    }
+    if latencies:
+        # quantiles() needs two points; a single sample is every percentile.
+        percentiles = (statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1
+                       else latencies * 99)
+        summary.update({f'p{n}_ms': round(percentiles[n - 1] * 1000, 2) for n in (50, 95, 99)})
+    return summary
+
+
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    """
+    Reads Prometheus text into `{(sample name, frozenset of labels): value}`.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, _, value = line.rpartition(' ')
+            name, _, labels = sample.partition('{')
+            samples[name, frozenset(LABEL.findall(labels))] = float(value)
+    return samples
+
+
+def queries_per_request(before, after, route, method):
+    labels = frozenset([('route', route), ('method', method)])
+    count = after.get(('http_request_db_queries_count', labels), 0) - before.get(
+        ('http_request_db_queries_count', labels), 0)
+    total = after.get(('http_request_db_queries_sum', labels), 0) - before.get(
+        ('http_request_db_queries_sum', labels), 0)
+    return round(total / count, 2) if count else None
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from customeremployee.api.archive import archive_tasks
+
+
+class Command(BaseCommand):
+    help = ('Move tasks completed more than --older-than days ago to the archive table. Task details and exports '
+            'still include them; task lists do not.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='DAYS')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['older_than'])
+        moved = archive_tasks(before, options['batch_size'])
+        self.stdout.write(f'Archived {moved} tasks.')
@@ -0,0 +1,272 @@
+import http.client
+import json
+import random
+import subprocess
+import tempfile
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from django.utils import timezone
+
+from customeremployee.api.loadtesting import (BenchmarkClient, Operation, parse_metrics, queries_per_request,
+                                              run_clients, run_server, summarize)
+from customeremployee.api.management.commands.seed_data import SEED_PASSWORD
+from customeremployee.api.models import ArchivedTask, Task, User
+from customeremployee.api.serializers import ClaimsTokenObtainPairSerializer
+
+
+def own_task(client):
+    return f'/tasks/{client.rng.choice(client.state["tasks"])}/' if client.state['tasks'] else None
+
+
+def remember_task(client, data):
+    client.state['tasks'].append(data['id'])
+
+
+def remember_pending(client, data):
+    client.state['pending'] = [task['id'] for task in data['results']]
+
+
+def pop_path(key, template):
+    def path(client):
+        return template.format(client.state[key].pop()) if client.state[key] else None
+    return path
+
+
+def new_user(client):
+    suffix = uuid.UUID(int=client.rng.getrandbits(128)).hex[:12]
+    return {'username': f'bench_{suffix}', 'password': SEED_PASSWORD, 'email': f'bench_{suffix}@example.com',
+            'phone': f'+8{client.rng.randrange(10 ** 12):012d}'}
+
+
+def remember_claimed(client, data):
+    client.state['claimed'].append(data['id'])
+
+
+def batch_path(key, path):
+    return lambda client: path if client.state[key] else None
+
+
+def pop_batch(key, item):
+    def body(client):
+        pks, client.state[key] = client.state[key], []
+        return [item(pk) for pk in pks]
+    return body
+
+
+def remember_tasks(client, data):
+    client.state['tasks'].extend(task['id'] for task in data)
+
+
+def remember_claimed_batch(client, data):
+    client.state['claimed'].extend(result['id'] for result in data if result['status'] == 200)
+
+
+# Every endpoint in api/urls.py except /tasks/events/, whose streams stay
+# open for minutes, and task deletion, which is always refused.
+OPERATIONS = {
+    User.CUSTOMER: [
+        Operation('tasks.list', 'GET', '/tasks/', weight=4),
+        Operation('tasks.list.filtered', 'GET', '/tasks/?status=completed&fields=id,status,created_at', weight=2),
+        Operation('tasks.retrieve', 'GET', own_task, weight=4),
+        Operation('tasks.create', 'POST', '/tasks/', body={}, after=remember_task),
+        Operation('tasks.export', 'GET', '/tasks/export/?format=csv'),
+        Operation('employees.list', 'GET', '/employees/', weight=2),
+        Operation('me', 'GET', '/me/', weight=2),
+        Operation('token.obtain', 'POST', '/api/token/',
+                  body=lambda client: {'username': client.user.username, 'password': client.password}),
+        Operation('token.refresh', 'POST', '/api/token/refresh/', body=lambda client: {'refresh': str(client.token)}),
+    ],
+    User.EMPLOYEE: [
+        Operation('tasks.list', 'GET', '/tasks/', weight=3),
+        Operation('tasks.list.pending', 'GET', '/tasks/?status=pending', weight=2, after=remember_pending),
+        Operation('tasks.assign', 'PATCH', pop_path('pending', '/tasks/{}/assign/'), after=remember_claimed),
+        Operation('tasks.claim', 'POST', '/tasks/claim/', after=remember_claimed),
+        Operation('tasks.complete', 'PATCH', pop_path('claimed', '/tasks/{}/complete/'), weight=2,
+                  body={'report': 'done'}),
+        Operation('tasks.assign.batch', 'POST', batch_path('pending', '/tasks/assign/'),
+                  body=pop_batch('pending', lambda pk: {'id': pk}), after=remember_claimed_batch),
+        Operation('tasks.complete.batch', 'POST', batch_path('claimed', '/tasks/complete/'),
+                  body=pop_batch('claimed', lambda pk: {'id': pk, 'report': 'done'})),
+        Operation('me', 'GET', '/me/'),
+    ],
+    'manager': [
+        Operation('tasks.list', 'GET', '/tasks/', weight=3),
+        Operation('tasks.search', 'GET', '/tasks/?search=printer'),
+        Operation('tasks.stats', 'GET', '/tasks/stats/', weight=2),
+        Operation('tasks.create', 'POST', '/tasks/', after=remember_task,
+                  body=lambda client: {'customer_id': client.rng.choice(client.state['customers'])}),
+        Operation('tasks.create.batch', 'POST', '/tasks/', after=remember_tasks,
+                  body=lambda client: [{'customer_id': client.rng.choice(client.state['customers'])}
+                                       for _ in range(20)]),
+        Operation('tasks.update', 'PATCH', own_task,
+                  body=lambda client: {'customer_id': client.rng.choice(client.state['customers'])}),
+        Operation('register.customer', 'POST', '/register/customer/', body=new_user),
+        Operation('register.employee', 'POST', '/register/employee/', body=new_user),
+    ],
+    'admin': [
+        Operation('metrics', 'GET', '/metrics/'),
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = ('Drive the API with concurrent clients per role (customers, employees, managers and an admin) made '
+            'of the users created by seed_data, and write throughput, p50/p95/p99 latency and queries per '
+            'request of every operation as JSON. Queries per request come from /metrics/ and are per route, '
+            'whichever role made the request. Starts gunicorn or uvicorn against the configured database '
+            'unless --url is given; DEBUG must be on for the Host header to pass.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Benchmark a running server instead of starting one.')
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent clients per role.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of measured load.')
+        parser.add_argument('--warmup', type=float, default=5, help='Seconds of load before measuring.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix given to seed_data.')
+        parser.add_argument('--password', default=SEED_PASSWORD, help='Password given to seed_data.')
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--compare', help='A previous JSON report to print the changes against.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        users = self.seeded_users()
+        if options['url']:
+            url = urlsplit(options['url'])
+            report = self.benchmark(url.hostname, url.port or 80, users, {'url': options['url']})
+        else:
+            with tempfile.TemporaryDirectory() as metrics_dir, \
+                    run_server(options['mode'], options['workers'], METRICS_DIR=metrics_dir) as port:
+                report = self.benchmark('127.0.0.1', port, users,
+                                        {'mode': options['mode'], 'workers': options['workers']})
+
+        data = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(data + '\n')
+        else:
+            self.stdout.write(data)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), report)
+
+    def seeded_users(self):
+        prefix, count = self.options['prefix'], self.options['clients']
+        users = {
+            User.CUSTOMER: User.customer.filter(username__startswith=f'{prefix}_customer_'),
+            User.EMPLOYEE: User.employee.filter(username__startswith=f'{prefix}_employee_'),
+            'manager': User.employee.filter(username__startswith=f'{prefix}_manager_'),
+            'admin': User.objects.filter(username=f'{prefix}_admin'),
+        }
+        users = {role: list(queryset.order_by('pk')[:count]) for role, queryset in users.items()}
+        missing = [role for role, found in users.items() if not found]
+        if missing:
+            raise CommandError(f'No seeded {", ".join(missing)} users named {prefix}_*; run seed_data first.')
+        return users
+
+    def make_clients(self, host, port, users):
+        rng = random.Random(self.options['random_seed'])
+        customers = [user.pk for user in users[User.CUSTOMER]]
+        clients = []
+        for role, role_users in users.items():
+            for user in role_users:
+                client = BenchmarkClient(host, port, role, user, ClaimsTokenObtainPairSerializer.get_token(user),
+                                         OPERATIONS[role], random.Random(rng.random()), self.options['password'])
+                if role == User.CUSTOMER:
+                    client.state['tasks'] = list(Task.objects.filter(customer=user).order_by('-created_at')
+                                                 .values_list('pk', flat=True)[:100])
+                client.state['customers'] = customers
+                clients.append(client)
+        return clients
+
+    def scrape(self, client):
+        # Workers write their counts at most every METRICS_FLUSH_SECONDS, and
+        # only while serving requests: wait that long, then ask each worker
+        # at least once so that every one of them flushes.
+        time.sleep(settings.METRICS_FLUSH_SECONDS + 0.2)
+        connection = http.client.HTTPConnection(client.host, client.port, timeout=60)
+        try:
+            for _ in range(4 * self.options['workers']):
+                # A new connection each time, so that other workers accept it.
+                connection.close()
+                connection.request('GET', '/metrics/', headers={'Authorization': client.authorization(),
+                                                               'Host': 'localhost'})
+                response = connection.getresponse()
+                text = response.read().decode()
+                if response.status != 200:
+                    raise CommandError(f'GET /metrics/ returned {response.status}: {text[:200]}')
+        finally:
+            connection.close()
+        return parse_metrics(text)
+
+    def benchmark(self, host, port, users, server):
+        clients = self.make_clients(host, port, users)
+        if self.options['warmup']:
+            run_clients(clients, self.options['warmup'])
+        for client in clients:
+            client.samples.clear()
+            client.paths.clear()
+
+        scraper = BenchmarkClient(host, port, 'admin', users['admin'][0],
+                                  ClaimsTokenObtainPairSerializer.get_token(users['admin'][0]), [],
+                                  random.Random(0))
+        before = self.scrape(scraper)
+        started = time.perf_counter()
+        run_clients(clients, self.options['duration'])
+        elapsed = time.perf_counter() - started
+        after = self.scrape(scraper)
+
+        samples, paths = {}, {}
+        for client in clients:
+            for name, client_samples in client.samples.items():
+                key = f'{client.role} {name}'
+                samples.setdefault(key, []).extend(client_samples)
+                paths.setdefault(key, client.paths[name])
+        operations = {}
+        for key in sorted(samples):
+            role, name = key.split(' ')
+            method = next(operation.method for operation in OPERATIONS[role] if operation.name == name)
+            route = resolve(urlsplit(paths[key]).path).view_name
+            operations[key] = {'method': method, 'route': route, **summarize(samples[key], elapsed),
+                               'queries_per_request': queries_per_request(before, after, route, method)}
+
+        return {
+            'commit': self.commit(),
+            'started_at': timezone.now().isoformat(),
+            'server': server,
+            'clients_per_role': self.options['clients'],
+            'duration': self.options['duration'],
+            'dataset': {'users': User.objects.count(), 'tasks': Task.objects.count(),
+                        'archived_tasks': ArchivedTask.objects.count()},
+            'total': summarize([sample for role_samples in samples.values() for sample in role_samples], elapsed),
+            'operations': operations,
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, baseline, report):
+        def change(old, new):
+            if old is None or new is None:
+                return f'{old} -> {new}'
+            return f'{old} -> {new} ({(new - old) / old * 100:+.0f}%)' if old else f'{old} -> {new}'
+
+        self.stdout.write(f'Compared with {baseline.get("commit")}:')
+        for key, new in report['operations'].items():
+            old = baseline['operations'].get(key)
+            if old is None:
+                self.stdout.write(f'{key}: new')
+                continue
+            self.stdout.write(f'{key}: throughput {change(old["throughput"], new["throughput"])}, '
+                              f'p95 ms {change(old.get("p95_ms"), new.get("p95_ms"))}, '
+                              f'queries {change(old["queries_per_request"], new["queries_per_request"])}')
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from customeremployee.api.dispatch import dispatch_tasks
+
+
+class Command(BaseCommand):
+    help = ('Assign pending tasks, oldest first, to the active employees with the fewest tasks in progress, '
+            '--batch-size per round. Rounds follow each other while tasks get assigned; then the command waits '
+            '--interval seconds, or exits with --once. Run a single dispatcher at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-open', type=int, help='Tasks in progress above which an employee gets no more.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when nothing was assigned.')
+        parser.add_argument('--once', action='store_true', help='Exit once no task can be assigned.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            assigned = dispatch_tasks(options['batch_size'], options['max_open'])
+            if assigned:
+                count = sum(assigned.values())
+                total += count
+                self.stdout.write(f'Assigned {count} tasks to {len(assigned)} employees.')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Assigned {total} tasks.')
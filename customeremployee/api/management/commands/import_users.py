@@ -0,0 +1,103 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.settings import api_settings
+
+from customeremployee.api.models import User
+from customeremployee.api.passwords import password_process_pool
+from customeremployee.api.serializers import RegisterSerializer
+
+ROLES = (User.CUSTOMER, User.EMPLOYEE)
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users from a CSV or JSON Lines file with the fields accepted by /register/ and an '
+        'optional "role". Rows are validated like RegisterSerializer, passwords are hashed in a '
+        'process pool and users are inserted in batches. Progress is checkpointed to '
+        '<path>.checkpoint after every batch, so an interrupted import can be resumed with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format; guessed from the file extension by default.')
+        parser.add_argument('--role', choices=ROLES, default=User.CUSTOMER,
+                            help='Role given to rows without a "role" field.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Password hashing processes; all CPUs by default.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows committed by a previous run over the same file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        checkpoint = f'{path}.checkpoint'
+        processed = 0
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                processed = int(f.read())
+            self.stdout.write(f'Resuming after row {processed}')
+
+        imported = rejected = 0
+        try:
+            with open(path, newline='') as f, password_process_pool(options['workers']) as executor:
+                rows = enumerate(self.read_rows(f, file_format), start=1)
+                for _ in islice(rows, processed):
+                    pass
+                while batch := list(islice(rows, options['batch_size'])):
+                    created, errors = self.import_batch(batch, options['role'], executor)
+                    imported += created
+                    rejected += len(errors)
+                    for row_number, error in errors:
+                        self.stderr.write(f'Row {row_number}: {json.dumps(error)}')
+
+                    processed = batch[-1][0]
+                    with open(checkpoint, 'w') as checkpoint_file:
+                        checkpoint_file.write(str(processed))
+                    self.stdout.write(f'{processed} rows processed: {imported} imported, {rejected} rejected')
+        except (OSError, csv.Error, ValueError) as e:
+            raise CommandError(f'Import stopped after row {processed}: {e}')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} users, rejected {rejected}.'))
+
+    def read_rows(self, f, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def import_batch(self, batch, default_role, executor):
+        errors, valid = [], []
+        for row_number, row in batch:
+            if not isinstance(row, dict):
+                errors.append((row_number, {api_settings.NON_FIELD_ERRORS_KEY: [
+                    f'Invalid data. Expected a dictionary, but got {type(row).__name__}.']}))
+            elif row.get('role') and row['role'] not in ROLES:
+                errors.append((row_number, {'role': [f'"{row["role"]}" is not a valid choice.']}))
+            else:
+                valid.append((row_number, row))
+        batch = valid
+
+        context = {'password_executor': executor}
+        serializer = RegisterSerializer(data=[row for _, row in batch], many=True, context=context)
+        # Validate again without the rejected rows, which may have claimed a
+        # username or phone number that a later row in the batch also uses,
+        # until the remaining rows are valid. Each pass rejects at least one.
+        while not serializer.is_valid():
+            errors += [(row_number, error) for (row_number, _), error in zip(batch, serializer.errors) if error]
+            batch = [item for item, error in zip(batch, serializer.errors) if not error]
+            serializer = RegisterSerializer(data=[row for _, row in batch], many=True, context=context)
+
+        if batch:
+            serializer.create([{**attrs, 'role': row.get('role') or default_role}
+                               for attrs, (_, row) in zip(serializer.validated_data, batch)])
+        return len(batch), sorted(errors, key=lambda item: item[0])
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customeremployee.api.loadtesting import BenchmarkClient, Operation, run_clients, run_server, summarize
+from customeremployee.api.models import User
+from customeremployee.api.serializers import ClaimsTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = ('Starts the API under gunicorn (WSGI) and/or uvicorn (ASGI) with the same number of workers, '
+            'loads the read endpoints and reports requests per second and latency percentiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32, help='Parallel client connections.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server.')
+        parser.add_argument('--warmup', type=float, default=2, help='Seconds of load before measuring.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Endpoint to request; repeat for several. Defaults to /tasks/, /me/ and '
+                                 '/employees/.')
+        parser.add_argument('--username', help='User to authenticate as. Defaults to the first superuser.')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to authenticate as; pass --username or create a superuser.')
+
+        operations = [Operation(path, 'GET', path) for path in options['paths'] or ['/tasks/', '/me/', '/employees/']]
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+
+        for mode in modes:
+            rng = random.Random(options['random_seed'])
+            with run_server(mode, options['workers']) as port:
+                clients = [BenchmarkClient('127.0.0.1', port, 'load', user,
+                                           ClaimsTokenObtainPairSerializer.get_token(user), operations,
+                                           random.Random(rng.random()))
+                           for _ in range(options['concurrency'])]
+                run_clients(clients, options['warmup'])
+                for client in clients:
+                    client.samples.clear()
+                started = time.perf_counter()
+                run_clients(clients, options['duration'])
+                elapsed = time.perf_counter() - started
+
+            summary = summarize([sample for client in clients for samples in client.samples.values()
+                                 for sample in samples], elapsed)
+            errors = summary['requests'] - summary['statuses'].get('200', 0)
+            if errors == summary['requests']:
+                raise CommandError(f'{mode}: no successful requests ({errors} errors)')
+            self.stdout.write(
+                f'{mode}: {options["workers"]} workers, {options["concurrency"]} connections, '
+                f'{summary["throughput"]:.0f} req/s, p50 {summary["p50_ms"]:.1f} ms, '
+                f'p99 {summary["p99_ms"]:.1f} ms, {errors} errors'
+            )
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from customeremployee.api.models import TaskEvent
+
+
+class Command(BaseCommand):
+    help = ('Delete task events older than --days. Event streams resuming from a pruned event get a reset event '
+            'and reload the task list.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = TaskEvent.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(f'Deleted {deleted} task events.')
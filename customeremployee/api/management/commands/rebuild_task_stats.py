@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from customeremployee.api.models import CustomerTaskStats, DailyTaskStats, EmployeeTaskStats
+from customeremployee.api.stats import rebuild_task_stats
+
+
+class Command(BaseCommand):
+    help = ('Recompute the per-customer, per-employee and per-day task summary tables from the task table. '
+            'They are kept current incrementally; run this after writes that bypass the ORM.')
+
+    def handle(self, *args, **options):
+        rebuild_task_stats()
+        self.stdout.write(f'Rebuilt stats for {CustomerTaskStats.objects.count()} customers, '
+                          f'{EmployeeTaskStats.objects.count()} employees and '
+                          f'{DailyTaskStats.objects.count()} days.')
@@ -0,0 +1,139 @@
+import random
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from customeremployee.api.directory import invalidate_employee_directory
+from customeremployee.api.models import Task, TaskState, User
+from customeremployee.api.stats import apply_deltas, create_employee_stats, task_deltas
+
+SEED_PASSWORD = 'seed-password'
+
+FIRST_NAMES = ['Anna', 'Boris', 'Clara', 'Dmitry', 'Elena', 'Fedor', 'Galina', 'Igor', 'Maria', 'Oleg']
+LAST_NAMES = ['Ivanova', 'Petrov', 'Smirnova', 'Kuznetsov', 'Popova', 'Volkov', 'Sokolova', 'Lebedev']
+REPORT_WORDS = ['printer', 'network', 'invoice', 'password', 'replaced', 'cable', 'update', 'refund', 'laptop',
+                'monitor', 'license', 'backup', 'restored', 'configured', 'installed', 'delivered']
+
+CUSTOMER_PERMISSIONS = ['can_view_employees']
+MANAGER_PERMISSIONS = ['can_view_all_tasks', 'can_create_task', 'can_add_customer', 'can_add_employee']
+
+
+class Command(BaseCommand):
+    help = ('Generate users and tasks for load tests: customers, employees, managers (employees who see every '
+            'task) and one superuser named <prefix>_admin, all with the password given by --password, plus '
+            'tasks spread over the last --days days. Older tasks are mostly completed; recent ones are pending, '
+            'in progress or completed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--employees', type=int, default=1000)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--tasks', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help='Age of the oldest task.')
+        parser.add_argument('--password', default=SEED_PASSWORD)
+        parser.add_argument('--prefix', default='seed', help='Prefix of the generated usernames.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Users named {prefix}_* already exist; pass another --prefix.')
+        if options['tasks'] and not options['customers']:
+            raise CommandError('Tasks need at least one customer.')
+        self.rng = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+        # Hashed once: every seeded user shares the same password hash.
+        self.password = make_password(options['password'])
+        # Phone numbers are unique; derive their range from the prefix.
+        self.phone_prefix = f'+7{zlib.crc32(prefix.encode()) % 1000:03d}'
+        self.phones = iter(range(10 ** 10))
+
+        User.objects.create(username=f'{prefix}_admin', password=self.password, phone=self.next_phone(),
+                            is_staff=True, is_superuser=True)
+        customers = self.create_users(f'{prefix}_customer', User.CUSTOMER, options['customers'],
+                                      permissions=CUSTOMER_PERMISSIONS)
+        managers = self.create_users(f'{prefix}_manager', User.EMPLOYEE, options['managers'],
+                                     permissions=MANAGER_PERMISSIONS)
+        employees = self.create_users(f'{prefix}_employee', User.EMPLOYEE, options['employees']) + managers
+        invalidate_employee_directory()
+
+        self.create_tasks(options['tasks'], customers, employees, timedelta(days=options['days']))
+        with connection.cursor() as cursor:
+            # Planner statistics for the new data distribution.
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(customers)} customers, {len(employees)} employees ({len(managers)} managers) '
+            f'and {options["tasks"]} tasks.'))
+
+    def next_phone(self):
+        return f'{self.phone_prefix}{next(self.phones):010d}'
+
+    def create_users(self, name, role, count, permissions=()):
+        permission_ids = list(Permission.objects.filter(content_type__app_label='api', codename__in=permissions)
+                              .values_list('pk', flat=True))
+        pks = []
+        for start in range(0, count, self.batch_size):
+            users = []
+            for i in range(start, min(count, start + self.batch_size)):
+                username = f'{name}_{i}'
+                users.append(User(username=username, password=self.password, role=role,
+                                  first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                                  email=f'{username}@example.com', phone=self.next_phone()))
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                User.user_permissions.through.objects.bulk_create(
+                    User.user_permissions.through(user_id=user.pk, permission_id=permission_id)
+                    for user in users for permission_id in permission_ids)
+                if role == User.EMPLOYEE:
+                    create_employee_stats(user.pk for user in users)
+            pks += [user.pk for user in users]
+        self.stdout.write(f'{count} users named {name}_*')
+        return pks
+
+    def create_tasks(self, count, customers, employees, history):
+        now = timezone.now()
+        start = now - history
+        stats = None
+        fields = [field for field in Task._meta.concrete_fields if not field.primary_key]
+        insert_size = max(connection.ops.bulk_batch_size(fields, [None] * self.batch_size), 1)
+        for offset in range(0, count, self.batch_size):
+            tasks = [self.make_task(start + history * (i / count), now, customers, employees)
+                     for i in range(offset, min(count, offset + self.batch_size))]
+            with transaction.atomic():
+                # Seeded tasks are history rather than changes. A raw insert,
+                # as loaddata does, keeps the generated created_at and
+                # updated_at instead of stamping auto_now(_add) fields, and
+                # skips tasks_changed and its task events.
+                for i in range(0, len(tasks), insert_size):
+                    Task.objects._insert(tasks[i:i + insert_size], fields, raw=True)
+            stats = task_deltas([(None, TaskState.of(task)) for task in tasks], stats)
+            self.stdout.write(f'{offset + len(tasks)}/{count} tasks')
+        # The stats are added once, one update per summary row; if seeding
+        # stops early, run rebuild_task_stats.
+        with transaction.atomic():
+            apply_deltas(stats or {})
+
+    def make_task(self, created_at, now, customers, employees):
+        rng = self.rng
+        # A few customers file most tasks.
+        customer = customers[int(len(customers) * rng.random() ** 3)]
+        weights = (1, 2, 97) if now - created_at > timedelta(days=7) else (30, 30, 40)
+        status = Task.PENDING
+        if employees:
+            status = rng.choices((Task.PENDING, Task.IN_PROGRESS, Task.COMPLETED), weights)[0]
+
+        employee = closed_at = None
+        report = ''
+        if status != Task.PENDING:
+            employee = rng.choice(employees)
+        if status == Task.COMPLETED:
+            closed_at = min(created_at + timedelta(hours=rng.expovariate(1 / 48)), now)
+            report = ' '.join(rng.sample(REPORT_WORDS, 4))
+        return Task(customer_id=customer, employee_id=employee, status=status, report=report,
+                    created_at=created_at, updated_at=closed_at or created_at, closed_at=closed_at)
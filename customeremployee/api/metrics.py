@@ -0,0 +1,167 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+METRICS = {
+    'http_requests_total': (COUNTER, 'Requests by route, method and status code.', None),
+    'http_request_duration_seconds': (HISTOGRAM, 'Time spent in the middleware and everything below it.',
+                                      DURATION_BUCKETS),
+    'http_request_db_queries': (HISTOGRAM, 'Database queries per request.', QUERY_BUCKETS),
+    'http_request_db_duration_seconds_total': (COUNTER, 'Time spent executing database queries.', None),
+    'http_response_size_bytes': (HISTOGRAM, 'Size of response bodies; streamed responses are not counted.',
+                                 SIZE_BUCKETS),
+}
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# The `le` label of each bucket, for histograms; the last one is +Inf.
+BUCKET_LABELS = {name: [('le', format_value(bound)) for bound in buckets] + [('le', '+Inf')]
+                 for name, (kind, _, buckets) in METRICS.items() if kind == HISTOGRAM}
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{%s}' % ','.join(f'{name}="{escape(value)}"' for name, value in labels) if labels else ''
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics, kept as flat Prometheus samples keyed by
+    `(sample name, labels)` so that the samples of several processes add up.
+
+    With `settings.METRICS_DIR` set, each process writes its samples to its
+    own file there at most every `METRICS_FLUSH_SECONDS`, and `collect()`
+    sums every file, so any worker can report for all of them. Files of
+    exited workers are kept: their counts are part of the totals.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(float)
+        self.file_name = f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        self.flushed_at = 0.0
+
+    def increment(self, name, labels, value=1):
+        self.samples[name, labels] += value
+
+    def observe(self, name, labels, value):
+        # Buckets are stored uncumulated, so each observation updates one;
+        # render() adds them up.
+        bucket = BUCKET_LABELS[name][bisect.bisect_left(METRICS[name][2], value)]
+        self.samples[f'{name}_bucket', labels + (bucket,)] += 1
+        self.samples[f'{name}_sum', labels] += value
+        self.samples[f'{name}_count', labels] += 1
+
+    def observe_request(self, route, method, status, seconds, queries, query_seconds, size):
+        labels = (('route', route), ('method', method))
+        with self.lock:
+            self.increment('http_requests_total', labels + (('status', str(status)),))
+            self.observe('http_request_duration_seconds', labels, seconds)
+            self.observe('http_request_db_queries', labels, queries)
+            self.increment('http_request_db_duration_seconds_total', labels, query_seconds)
+            if size is not None:
+                self.observe('http_response_size_bytes', labels, size)
+        if settings.METRICS_DIR and time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if not settings.METRICS_DIR:
+            return
+        path = Path(settings.METRICS_DIR) / self.file_name
+        temporary = path.with_suffix('.tmp')
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_text(json.dumps([[name, labels, value] for (name, labels), value in self.samples.items()]))
+            os.replace(temporary, path)
+
+    def collect(self):
+        if not settings.METRICS_DIR:
+            with self.lock:
+                return dict(self.samples)
+        self.flush()
+        samples = defaultdict(float)
+        for path in Path(settings.METRICS_DIR).glob('metrics-*.json'):
+            try:
+                rows = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in rows:
+                samples[name, tuple(map(tuple, labels))] += value
+        return samples
+
+    def render(self):
+        families = defaultdict(lambda: defaultdict(float))
+        for (name, labels), value in self.collect().items():
+            family = name if name in METRICS else name.rpartition('_')[0]
+            families[family][name, labels] += value
+
+        lines = []
+        for family in sorted(families):
+            kind, help, _ = METRICS[family]
+            lines += [f'# HELP {family} {help}', f'# TYPE {family} {kind}']
+            samples = families[family]
+            if kind == HISTOGRAM:
+                buckets = defaultdict(dict)
+                for name, labels in [key for key in samples if key[0].endswith('_bucket')]:
+                    buckets[labels[:-1]][labels[-1]] = samples.pop((name, labels))
+                for labels, counts in buckets.items():
+                    total = 0
+                    for bucket in BUCKET_LABELS[family]:
+                        total += counts.get(bucket, 0)
+                        samples[f'{family}_bucket', labels + (bucket,)] = total
+            lines += [f'{name}{format_labels(labels)} {format_value(value)}'
+                      for (name, labels), value in samples.items()]
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+atexit.register(metrics_registry.flush)
+# Forked workers start empty and write their own file.
+os.register_at_fork(after_in_child=metrics_registry.reset)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The QueryStats of the request being handled; context variables follow a
+# request into sync_to_async() threads, so async views are counted too.
+current_query_stats = ContextVar('current_query_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
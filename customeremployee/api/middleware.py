@@ -0,0 +1,91 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import QueryStats, current_query_stats, metrics_registry
+from .routers import pin_to_primary, read_database
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, database queries and time, response size and status of
+    every request in `metrics_registry`, labelled with the URL name of the
+    matched route. Queries are counted by `metrics.record_query`, which
+    `signals.py` installs on every database connection. Queries made while a
+    streaming response is being sent are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request, response, seconds, stats):
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        metrics_registry.observe_request(route, request.method, response.status_code, seconds, stats.count,
+                                         stats.seconds, size)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Starts every request reading from the primary, and after a write
+    request pins the user and their client to the primary for their next
+    reads (see `routers.py`). Goes after `AuthenticationMiddleware`; API views replace
+    `request.user` with the user of the token.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Left set when the response is returned, so streamed responses read
+        # from the same database; `signals.reset_read_database` clears it.
+        read_database.set(None)
+        response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        read_database.set(None)
+        response = await self.get_response(request)
+        await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS:
+            pin_to_primary(request, response)
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='customer',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'customer'}, on_delete=django.db.models.deletion.CASCADE, related_name='created_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='employee',
+            field=models.ForeignKey(blank=True, db_index=False, limit_choices_to={'role': 'employee'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='task_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['employee', 'status', 'created_at', 'id'], name='task_employee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('employee__isnull', True), ('status', 'pending')), fields=['created_at', 'id'], name='task_pending_unassigned_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:25
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def rebuild_stats(apps, schema_editor):
+    # `stats.rebuild_task_stats()` as of this migration, on the historical
+    # models, so later changes to the models or to stats.py do not affect it.
+    Task = apps.get_model('api', 'Task')
+    completed = models.Q(status='completed', closed_at__isnull=False)
+    duration = models.ExpressionWrapper(models.F('closed_at') - models.F('created_at'),
+                                        output_field=models.DurationField())
+    counters = {
+        **{status: models.Count('pk', filter=models.Q(status=status))
+           for status in ('pending', 'in_progress', 'completed')},
+        'completion_count': models.Count('pk', filter=completed),
+        'completion_duration': models.Sum(duration, filter=completed),
+    }
+    for model_name, key, filters in (('CustomerTaskStats', 'customer_id', {}),
+                                     ('EmployeeTaskStats', 'employee_id', {'employee__isnull': False})):
+        model = apps.get_model('api', model_name)
+        rows = []
+        for values in Task.objects.filter(**filters).order_by().values(key).annotate(**counters):
+            pk = values.pop(key)
+            values['completion_seconds'] = (values.pop('completion_duration') or timedelta()).total_seconds()
+            rows.append(model(pk=pk, **values))
+        model.objects.bulk_create(rows)
+
+    daily = defaultdict(Counter)
+    for row in Task.objects.order_by().values(day=TruncDate('created_at')).annotate(created=models.Count('pk')):
+        daily[row['day']]['created'] += row['created']
+    for row in (Task.objects.filter(completed).order_by().values(day=TruncDate('closed_at'))
+                .annotate(completed=models.Count('pk'), duration=models.Sum(duration))):
+        daily[row['day']].update(completed=row['completed'], completion_seconds=row['duration'].total_seconds())
+    DailyTaskStats = apps.get_model('api', 'DailyTaskStats')
+    DailyTaskStats.objects.bulk_create(DailyTaskStats(date=day, **values) for day, values in daily.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_token_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerTaskStats',
+            fields=[
+                ('pending', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('completion_count', models.IntegerField(default=0)),
+                ('completion_seconds', models.FloatField(default=0)),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='customer_task_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTaskStats',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('created', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('completion_seconds', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmployeeTaskStats',
+            fields=[
+                ('pending', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('completion_count', models.IntegerField(default=0)),
+                ('completion_seconds', models.FloatField(default=0)),
+                ('employee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='employee_task_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(rebuild_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+# An external-content FTS5 index over api_task.report, kept in step by
+# triggers (see filters.py).
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE api_task_fts USING fts5(report, content='api_task', content_rowid='id')",
+    """CREATE TRIGGER api_task_fts_insert AFTER INSERT ON api_task BEGIN
+        INSERT INTO api_task_fts(rowid, report) VALUES (new.id, new.report);
+    END""",
+    """CREATE TRIGGER api_task_fts_delete AFTER DELETE ON api_task BEGIN
+        INSERT INTO api_task_fts(api_task_fts, rowid, report) VALUES ('delete', old.id, old.report);
+    END""",
+    """CREATE TRIGGER api_task_fts_update AFTER UPDATE OF report ON api_task BEGIN
+        INSERT INTO api_task_fts(api_task_fts, rowid, report) VALUES ('delete', old.id, old.report);
+        INSERT INTO api_task_fts(rowid, report) VALUES (new.id, new.report);
+    END""",
+    "INSERT INTO api_task_fts(api_task_fts) VALUES ('rebuild')",
+]
+FTS_DROP_SQL = [
+    'DROP TRIGGER IF EXISTS api_task_fts_insert',
+    'DROP TRIGGER IF EXISTS api_task_fts_delete',
+    'DROP TRIGGER IF EXISTS api_task_fts_update',
+    'DROP TABLE IF EXISTS api_task_fts',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_task_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['employee', 'created_at', 'id'], name='task_employee_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='task_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['closed_at'], name='task_closed_idx'),
+        ),
+        migrations.RunPython(run_on_sqlite(FTS_SQL), run_on_sqlite(FTS_DROP_SQL)),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_task_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('created', 'created'), ('assigned', 'assigned'), ('completed', 'completed'), ('updated', 'updated'), ('deleted', 'deleted')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает исполнителя'), ('in_progress', 'В процессе'), ('completed', 'Выполнена')], max_length=20)),
+                ('customer_id', models.BigIntegerField()),
+                ('employee_id', models.BigIntegerField(null=True)),
+                ('previous_employee_id', models.BigIntegerField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:10
+
+from django.db import migrations
+
+
+def set_journal_mode(mode):
+    def run(apps, schema_editor):
+        # Stored in the database file, so it only needs setting once.
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute(f'PRAGMA journal_mode = {mode}')
+    return run
+
+
+class Migration(migrations.Migration):
+    # SQLite cannot change into WAL mode within a transaction.
+    atomic = False
+
+    dependencies = [
+        ('api', '0009_user_email_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode('WAL'), set_journal_mode('DELETE')),
+    ]
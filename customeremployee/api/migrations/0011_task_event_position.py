@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+def create_position_sequence(apps, schema_editor):
+    # SQLite streams events by id and leaves position empty.
+    if schema_editor.connection.vendor == 'sqlite':
+        return
+    schema_editor.execute('CREATE SEQUENCE api_taskevent_position_seq')
+    # Every existing event has committed, so it keeps its id as its position.
+    schema_editor.execute('UPDATE api_taskevent SET position = id')
+    schema_editor.execute("SELECT setval('api_taskevent_position_seq', COALESCE(MAX(position), 0) + 1, false) "
+                          "FROM api_taskevent")
+    schema_editor.execute('CREATE INDEX task_event_unnumbered_idx ON api_taskevent (id) WHERE position IS NULL')
+
+
+def drop_position_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        return
+    schema_editor.execute('DROP INDEX task_event_unnumbered_idx')
+    schema_editor.execute('DROP SEQUENCE api_taskevent_position_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sqlite_wal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskevent',
+            name='position',
+            field=models.BigIntegerField(null=True, unique=True),
+        ),
+        migrations.RunPython(create_position_sequence, drop_position_sequence),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+def create_employee_stats(apps, schema_editor):
+    # Dispatch only reads employees that have a stats row.
+    User = apps.get_model('api', 'User')
+    EmployeeTaskStats = apps.get_model('api', 'EmployeeTaskStats')
+    EmployeeTaskStats.objects.bulk_create(
+        [EmployeeTaskStats(pk=pk) for pk in User.objects.filter(role='employee').values_list('pk', flat=True)],
+        ignore_conflicts=True, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_task_event_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employeetaskstats',
+            index=models.Index(fields=['in_progress', 'employee'], name='employee_load_idx'),
+        ),
+        migrations.RunPython(create_employee_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:56
+
+import django.contrib.auth.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_employee_load_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('object', django.contrib.auth.models.UserManager()),
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+    ]
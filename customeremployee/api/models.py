@@ -1,6 +1,10 @@
+from collections import namedtuple
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
-from django.db import models
+from django.db import connections, models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
 employee_permissions = (
@@ -36,6 +40,9 @@ class User(AbstractUser):
 
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     phone = models.CharField(max_length=15, unique=True)
+    # Bumped whenever the user or their permissions change; refreshing a token
+    # issued for an older version reloads its claims from the database.
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     object = UserManager()
     employee = EmployeeUserManager()
@@ -43,6 +50,10 @@ class User(AbstractUser):
 
     class Meta:
         permissions = employee_permissions + customer_permissions
+        indexes = [
+            models.Index(fields=['role', 'id'], name='user_role_id_idx'),
+            models.Index(fields=['email'], name='user_email_idx'),
+        ]
 
     def validate_user_permission(self, permission):
         if self.role == self.CUSTOMER:
@@ -55,6 +66,182 @@ class User(AbstractUser):
                 raise ValidationError('Employees cannot have customer-specific permissions.')
 
 
+class ReadOnlyUserError(TypeError):
+    pass
+
+
+class ClaimsUser(User):
+    """
+    A user rebuilt from access token claims without touching the database.
+
+    It compares equal to the `User` with the same pk and can be used in
+    queries and relations, but only carries the fields stored in the token,
+    so it must never be written back.
+    """
+
+    class Meta:
+        proxy = True
+        default_permissions = ()
+
+    def save(self, *args, **kwargs):
+        raise ReadOnlyUserError('Users built from token claims are read-only.')
+
+    def delete(self, *args, **kwargs):
+        raise ReadOnlyUserError('Users built from token claims are read-only.')
+
+
+# Sent inside the writing transaction with `changes`, a list of
+# `(old, new)` TaskState pairs; `old` is None for created tasks and `new` is
+# None for deleted ones.
+tasks_changed = Signal()
+
+
+class TaskState(namedtuple('TaskState', ['id', 'customer_id', 'employee_id', 'status', 'created_at', 'closed_at'])):
+    @classmethod
+    def of(cls, task):
+        return cls(task.pk, task.customer_id, task.employee_id, task.status, task.created_at, task.closed_at)
+
+
+class TaskQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(status=Task.PENDING, employee=None)
+
+    def lock_for_write(self):
+        """
+        Takes the write lock of an SQLite database for the rest of the current
+        transaction, waiting busy_timeout for it. SQLite transactions start
+        deferred: once one has read, its first write fails at once with
+        "database is locked" if another connection committed in between.
+        Other backends lock the rows read with SELECT ... FOR UPDATE.
+        """
+        connection = transaction.get_connection(self.db)
+        if connection.vendor == 'sqlite':
+            pk = connection.ops.quote_name(Task._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {connection.ops.quote_name(Task._meta.db_table)} SET {pk} = {pk} WHERE 0')
+
+    def compare_and_set(self, expected, changes):
+        """
+        Applies `changes` in one UPDATE to the tasks of this queryset whose
+        fields still hold the `expected` values, and returns those tasks with
+        the `TaskState` fields loaded. The UPDATE checks the expected values
+        itself, so of several concurrent transitions of a task exactly one
+        applies, with no read before the write.
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        candidates, params = self.values('pk').query.sql_with_params()
+        assignments, conditions, values = [], [], []
+        for name, value in changes.items():
+            field = Task._meta.get_field(name)
+            assignments.append(f'{quote_name(field.column)} = %s')
+            values.append(field.get_db_prep_save(value, connection))
+        values += params
+        for name, value in expected.items():
+            field = Task._meta.get_field(name)
+            if value is None:
+                conditions.append(f'{quote_name(field.column)} IS NULL')
+            else:
+                conditions.append(f'{quote_name(field.column)} = %s')
+                values.append(field.get_db_prep_value(value, connection))
+        returning = ', '.join(quote_name(Task._meta.get_field(name).column) for name in TaskState._fields)
+        sql = (f'UPDATE {quote_name(Task._meta.db_table)} SET {", ".join(assignments)} '
+               f'WHERE {quote_name(Task._meta.pk.column)} IN ({candidates}) AND {" AND ".join(conditions)} '
+               f'RETURNING {returning}')
+        # raw() converts the returned columns as a query would.
+        return list(Task.objects.db_manager(self.db).raw(sql, values))
+
+    def claim(self, employee):
+        # A single conditional UPDATE: of several concurrent claims for the
+        # same task exactly one gets it.
+        with transaction.atomic(using=self.db):
+            tasks = self.compare_and_set({'status': Task.PENDING, 'employee_id': None},
+                                         {'status': Task.IN_PROGRESS, 'employee_id': employee.pk,
+                                          'updated_at': timezone.now()})
+            if tasks:
+                tasks_changed.send(sender=Task, changes=[
+                    (TaskState.of(task)._replace(status=Task.PENDING, employee_id=None), TaskState.of(task))
+                    for task in tasks
+                ])
+        return len(tasks)
+
+    def complete(self, employee_id, report):
+        """
+        Completes the tasks of this queryset still in progress for
+        `employee_id` with `report`, in one conditional UPDATE. Returns the
+        completion time, or None if no task was completed.
+        """
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            tasks = self.compare_and_set({'status': Task.IN_PROGRESS, 'employee_id': employee_id},
+                                         {'status': Task.COMPLETED, 'report': report, 'closed_at': now,
+                                          'updated_at': now})
+            if not tasks:
+                return None
+            tasks_changed.send(sender=Task, changes=[
+                (TaskState.of(task)._replace(status=Task.IN_PROGRESS, closed_at=None), TaskState.of(task))
+                for task in tasks
+            ])
+        return now
+
+    def claim_each(self, assignments):
+        """
+        `claim()` for several employees in one update: claims each task of
+        `assignments`, a `{task pk: employee pk}` mapping, for its employee if
+        it is still pending and unassigned. Returns the pks claimed.
+        """
+        with transaction.atomic(using=self.db):
+            self.lock_for_write()
+            rows = list(self.filter(pk__in=assignments).pending().select_for_update()
+                        .values_list('pk', 'customer_id', 'created_at'))
+            if not rows:
+                return []
+            employee = models.Case(*[models.When(pk=pk, then=models.Value(assignments[pk])) for pk, _, _ in rows])
+            Task.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+                employee_id=employee, status=Task.IN_PROGRESS, updated_at=timezone.now())
+            tasks_changed.send(sender=Task, changes=[
+                (TaskState(pk, customer_id, None, Task.PENDING, created_at, None),
+                 TaskState(pk, customer_id, assignments[pk], Task.IN_PROGRESS, created_at, None))
+                for pk, customer_id, created_at in rows
+            ])
+        return [pk for pk, _, _ in rows]
+
+    def complete_each(self, reports):
+        """
+        Completes each task of `reports`, a `{task pk: report}` mapping, with
+        its report in one update, if it is still in progress. Returns the pks
+        completed.
+        """
+        with transaction.atomic(using=self.db):
+            self.lock_for_write()
+            rows = list(self.filter(pk__in=reports, status=Task.IN_PROGRESS).select_for_update()
+                        .values_list('pk', 'customer_id', 'employee_id', 'created_at'))
+            if not rows:
+                return []
+            now = timezone.now()
+            report = models.Case(*[models.When(pk=pk, then=models.Value(reports[pk])) for pk, _, _, _ in rows],
+                                 output_field=models.TextField())
+            Task.objects.filter(pk__in=[pk for pk, _, _, _ in rows]).update(
+                status=Task.COMPLETED, report=report, closed_at=now, updated_at=now)
+            tasks_changed.send(sender=Task, changes=[
+                (TaskState(pk, customer_id, employee_id, Task.IN_PROGRESS, created_at, None),
+                 TaskState(pk, customer_id, employee_id, Task.COMPLETED, created_at, now))
+                for pk, customer_id, employee_id, created_at in rows
+            ])
+        return [pk for pk, _, _, _ in rows]
+
+    def bulk_create(self, objs, *args, send_signal=True, **kwargs):
+        """
+        Sends `tasks_changed` for the created tasks unless `send_signal` is
+        false, e.g. for seeded history that should not become task events.
+        """
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if send_signal:
+                tasks_changed.send(sender=Task, changes=[(None, TaskState.of(task)) for task in objs])
+        return objs
+
+
 class Task(models.Model):
     PENDING = 'pending'
     IN_PROGRESS = 'in_progress'
@@ -69,12 +256,14 @@ class Task(models.Model):
     customer = models.ForeignKey(settings.AUTH_USER_MODEL,
                                  related_name='created_tasks',
                                  on_delete=models.CASCADE,
+                                 db_index=False,
                                  limit_choices_to={'role': 'customer'}
                                  )
     employee = models.ForeignKey(settings.AUTH_USER_MODEL,
                                  related_name='assigned_tasks',
                                  on_delete=models.SET_NULL,
                                  null=True, blank=True,
+                                 db_index=False,
                                  limit_choices_to={'role': 'employee'}
                                  )
     created_at = models.DateTimeField(auto_now_add=True)
@@ -86,5 +275,190 @@ class Task(models.Model):
                               )
     report = models.TextField(blank=True)
 
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='task_created_id_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='task_customer_created_idx'),
+            models.Index(fields=['employee', 'status', 'created_at', 'id'], name='task_employee_status_idx'),
+            models.Index(fields=['employee', 'created_at', 'id'], name='task_employee_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='task_status_created_idx'),
+            models.Index(fields=['closed_at'], name='task_closed_idx'),
+            models.Index(fields=['created_at', 'id'], name='task_pending_unassigned_idx',
+                         condition=models.Q(status='pending', employee__isnull=True)),
+        ]
+
     def __str__(self):
         return f'Task: {self.customer} - {self.employee}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        task = super().from_db(db, field_names, values)
+        if not task.get_deferred_fields():
+            task.saved_state = TaskState.of(task)
+        return task
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        if fields is None and not self.get_deferred_fields():
+            self.saved_state = TaskState.of(self)
+        else:
+            # Unrefreshed fields may hold unsaved changes; save() refetches.
+            self.__dict__.pop('saved_state', None)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            old = None
+        elif hasattr(self, 'saved_state'):
+            old = self.saved_state
+        else:
+            old = next((TaskState.of(task) for task in Task.objects.filter(pk=self.pk)), None)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            new = TaskState.of(self)
+            if new != old:
+                tasks_changed.send(sender=Task, changes=[(old, new)])
+        self.saved_state = new
+
+
+class ArchivedTask(models.Model):
+    """
+    A completed task moved out of `Task` by `archive.archive_tasks`, under
+    its original id, so the hot table and its indexes only hold recent work.
+    Archived tasks are read-only; task details and exports fall back to them.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL,
+                                 related_name='archived_created_tasks',
+                                 on_delete=models.CASCADE,
+                                 db_index=False,
+                                 )
+    employee = models.ForeignKey(settings.AUTH_USER_MODEL,
+                                 related_name='archived_assigned_tasks',
+                                 on_delete=models.SET_NULL,
+                                 null=True, blank=True,
+                                 db_index=False,
+                                 )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    report = models.TextField(blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='archived_created_id_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='archived_customer_created_idx'),
+            models.Index(fields=['employee', 'created_at', 'id'], name='archived_employee_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Archived task: {self.customer} - {self.employee}'
+
+
+class TaskCounts(models.Model):
+    """
+    Task counts by status plus the number and total duration of completed
+    tasks with a `closed_at`, kept current by `stats.apply_task_changes`.
+    """
+    pending = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    completion_count = models.IntegerField(default=0)
+    completion_seconds = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mean_completion_seconds(self):
+        return self.completion_seconds / self.completion_count if self.completion_count else None
+
+
+class CustomerTaskStats(TaskCounts):
+    customer = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, on_delete=models.CASCADE,
+                                    related_name='customer_task_stats')
+
+
+class EmployeeTaskStats(TaskCounts):
+    """
+    Every employee has a row, created along with the employee, so that
+    dispatch reads the least loaded employees off the `in_progress` index.
+    """
+    employee = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, on_delete=models.CASCADE,
+                                    related_name='employee_task_stats')
+
+    class Meta:
+        indexes = [models.Index(fields=['in_progress', 'employee'], name='employee_load_idx')]
+
+
+class DailyTaskStats(models.Model):
+    """
+    Tasks created on `date`, and tasks completed on `date` with their total
+    duration from creation.
+    """
+    date = models.DateField(primary_key=True)
+    created = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    completion_seconds = models.FloatField(default=0)
+
+    @property
+    def mean_completion_seconds(self):
+        return self.completion_seconds / self.completed if self.completed else None
+
+
+class TaskEventQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        # The scoping of TaskViewSet lists and CanViewTask: employees see
+        # their own tasks, including one leaving them, and unassigned ones,
+        # but not another employee taking a task from the pool.
+        if user.has_perm('api.can_view_all_tasks'):
+            return self
+        elif user.role == User.EMPLOYEE:
+            return self.filter(models.Q(employee_id=user.pk) | models.Q(previous_employee_id=user.pk)
+                               | models.Q(employee_id=None, previous_employee_id=None))
+        elif user.role == User.CUSTOMER:
+            return self.filter(customer_id=user.pk)
+        return self.none()
+
+    def streamed(self):
+        """
+        The events streams may send, annotated with the `stream_id` clients
+        resume from. SQLite has a single writer, so events commit in id
+        order. Elsewhere concurrent transactions commit ids out of order, and
+        `events.number_task_events` gives committed events a `position`
+        after commit; events without one are held back until then.
+        """
+        if connections[self.db].vendor == 'sqlite':
+            return self.annotate(stream_id=models.F('id'))
+        return self.filter(position__isnull=False).annotate(stream_id=models.F('position'))
+
+
+class TaskEvent(models.Model):
+    """
+    Change log behind the task event stream: one row per task change, whose
+    stream id (see `TaskEventQuerySet.streamed`) is the SSE event id clients
+    resume from. Rows carry only what scoping and clients need; the task
+    itself is read from `/tasks/<id>/`.
+    """
+    CREATED = 'created'
+    ASSIGNED = 'assigned'
+    COMPLETED = 'completed'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+    KIND_CHOICES = [(kind, kind) for kind in (CREATED, ASSIGNED, COMPLETED, UPDATED, DELETED)]
+
+    task_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    customer_id = models.BigIntegerField()
+    employee_id = models.BigIntegerField(null=True)
+    previous_employee_id = models.BigIntegerField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Commit order outside SQLite, numbered after commit.
+    position = models.BigIntegerField(null=True, unique=True)
+
+    objects = TaskEventQuerySet.as_manager()
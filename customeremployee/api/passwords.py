@@ -0,0 +1,26 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+
+
+def setup_worker(settings_module):
+    # Forked workers inherit the configured settings; spawned ones start empty.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def password_process_pool(workers=None):
+    return ProcessPoolExecutor(max_workers=workers, initializer=setup_worker,
+                               initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'customeremployee.settings'),))
+
+
+def hash_passwords(passwords, executor=None):
+    """
+    Hash `passwords` with the default hasher, spreading the work over
+    `executor` when given. Hashing dominates the cost of creating users.
+    """
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    return list(executor.map(make_password, passwords, chunksize=16))
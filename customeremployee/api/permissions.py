@@ -12,6 +12,11 @@ class CanViewEmployees(BasePermission):
         return request.user.has_perm('api.can_view_employees')
 
 
+class CanViewAllTasks(BasePermission):
+    def has_permission(self, request, view):
+        return request.user.has_perm('api.can_view_all_tasks')
+
+
 class CanAddEmployee(BasePermission):
     def has_permission(self, request, view):
         return request.user.has_perm('api.can_add_employee')
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+
+def export_value(value):
+    # Same datetime format as the serializers' output.
+    if isinstance(value, datetime):
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return value
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Renders rows lazily for `StreamingHttpResponse`: `stream()` turns an
+    iterator of value tuples into text chunks of `rows_per_chunk` rows, so
+    memory stays flat however many rows there are. `render()` is only used
+    for error payloads.
+    """
+    charset = 'utf-8'
+    rows_per_chunk = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
+
+    def stream(self, columns, rows):
+        buffer = io.StringIO()
+        write_row = self.get_row_writer(buffer, columns)
+        for count, row in enumerate(rows, 1):
+            write_row([export_value(value) for value in row])
+            if count % self.rows_per_chunk == 0:
+                yield self.flush(buffer)
+        yield buffer.getvalue()
+
+    async def astream(self, columns, rows):
+        # ASGI would buffer a sync iterator whole, so async views need this.
+        buffer = io.StringIO()
+        write_row = self.get_row_writer(buffer, columns)
+        count = 0
+        async for row in rows:
+            write_row([export_value(value) for value in row])
+            count += 1
+            if count % self.rows_per_chunk == 0:
+                yield self.flush(buffer)
+        yield buffer.getvalue()
+
+    def flush(self, buffer):
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    def get_row_writer(self, buffer, columns):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def get_row_writer(self, buffer, columns):
+        def write_row(values):
+            buffer.write(json.dumps(dict(zip(columns, values))))
+            buffer.write('\n')
+        return write_row
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def get_row_writer(self, buffer, columns):
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        return writer.writerow
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Formats Server-Sent Events for streaming views; `render()` is only used
+    for error payloads.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
+
+    def event(self, id, event, data):
+        return f'id: {id}\nevent: {event}\ndata: {json.dumps(data, cls=encoders.JSONEncoder)}\n\n'
+
+    def comment(self, text):
+        return f': {text}\n\n'
+
+    def retry(self, milliseconds):
+        return f'retry: {milliseconds}\n\n'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    Passes Prometheus text exposition through; `render()` only encodes other
+    payloads, i.e. errors, as JSON.
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, str) else json.dumps(data)
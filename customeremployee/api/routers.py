@@ -0,0 +1,79 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# The alias reads of the current request go to; None for the primary. Only
+# `ReplicaReadMixin` sets it, after authentication; it is cleared when a
+# request starts and when it finishes.
+read_database = ContextVar('read_database', default=None)
+
+
+# Also sent to the client that wrote, so its next requests stay pinned even if
+# the cache entry is missing.
+PIN_COOKIE = 'replica_pin'
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(request, response):
+    """
+    Sends the reads of the user of `request` to the primary for
+    REPLICA_PIN_SECONDS, so they see their own writes before the replicas
+    catch up.
+    """
+    if settings.REPLICA_DATABASES and request.user.is_authenticated:
+        cache.set(pin_key(request.user.pk), True, settings.REPLICA_PIN_SECONDS)
+        response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, secure=request.is_secure(),
+                            httponly=True, samesite='Lax')
+
+
+def read_from_replica(request):
+    """
+    Routes the rest of the request's reads to a random replica, unless its
+    client or user is pinned to the primary.
+    """
+    if not settings.REPLICA_DATABASES or PIN_COOKIE in request.COOKIES:
+        return
+    if request.user.is_authenticated and cache.get(pin_key(request.user.pk)):
+        return
+    read_database.set(random.choice(settings.REPLICA_DATABASES))
+
+
+@contextmanager
+def read_from_primary():
+    token = read_database.set(None)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Reads go where `read_database` says, the primary unless a view chose a
+    replica; writes always go to the primary, including saves of objects
+    loaded from a replica. Replicas are not migrated: they copy the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
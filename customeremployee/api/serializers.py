@@ -1,6 +1,72 @@
+import json
+from functools import partial
+from operator import attrgetter
+
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
-from rest_framework import serializers
-from .models import User, Task
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import VERSION_CLAIM, add_user_claims
+from .directory import invalidate_employee_directory
+from .models import CustomerTaskStats, DailyTaskStats, EmployeeTaskStats, User, Task
+from .passwords import hash_passwords
+from .stats import create_employee_stats
+
+
+class RegisterListSerializer(serializers.ListSerializer):
+    """
+    Registers many users at once: uniqueness is checked with one query per
+    unique field for the whole batch, passwords are hashed on
+    `context['password_executor']` when given, and rows are bulk inserted.
+    """
+    unique_fields = ('username', 'phone')
+
+    def to_internal_value(self, data):
+        self.taken = {field: set() for field in self.unique_fields}
+        if isinstance(data, list):
+            for field in self.unique_fields:
+                values = {item.get(field) for item in data if isinstance(item, dict)} - {None}
+                self.taken[field] = set(User.objects.filter(**{f'{field}__in': values})
+                                        .values_list(field, flat=True))
+            # The batch-wide check above replaces the per-item UniqueValidator queries.
+            for field in self.unique_fields:
+                child_field = self.child.fields[field]
+                child_field.validators = [validator for validator in child_field.validators
+                                          if not isinstance(validator, UniqueValidator)]
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        attrs = super().run_child_validation(data)
+        errors = {}
+        for field in self.unique_fields:
+            if attrs[field] in self.taken[field]:
+                errors[field] = [f'A user with that {field} already exists.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        for field in self.unique_fields:
+            self.taken[field].add(attrs[field])
+        return attrs
+
+    def create(self, validated_data):
+        passwords = hash_passwords([attrs['password'] for attrs in validated_data],
+                                   self.context.get('password_executor'))
+        users = [User(**{**attrs, 'password': password}) for attrs, password in zip(validated_data, passwords)]
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            # bulk_create sends no post_save for the directory and stats
+            # receivers.
+            employees = [user.pk for user in users if user.role == User.EMPLOYEE]
+            if employees:
+                create_employee_stats(employees)
+                invalidate_employee_directory()
+        return users
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -9,28 +75,183 @@ class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'password', 'first_name', 'last_name', 'email', 'phone']
+        list_serializer_class = RegisterListSerializer
 
     def create(self, validated_data):
         validated_data['password'] = make_password(validated_data['password'])
         return super().create(validated_data)
 
 
-class UserSerializer(serializers.ModelSerializer):
+# In a field selection, a relation rendered as its primary key.
+PK_ONLY = 'pk'
+
+
+class SparseFieldsMixin:
+    """
+    Narrows the representation to the field selection in
+    `context['field_selection']`, built by `parse_field_selection()` from the
+    `?fields=` and `?expand=` query parameters.
+
+    A selection maps readable field names to None (the whole field), PK_ONLY
+    (a nested serializer rendered as its primary key) or the selection of a
+    nested serializer. Write-only fields are never dropped.
+    """
+
+    @classmethod
+    def parse_field_selection(cls, query_params):
+        """
+        `fields` is a comma-separated list of names, with dotted names for
+        nested fields (`employee.id`); `expand` lists the relations rendered
+        as objects, all of them when it is absent, and the others are
+        rendered as primary keys. Returns None when neither is given.
+        """
+        fields, expand = query_params.get('fields'), query_params.get('expand')
+        if fields is None and expand is None:
+            return None
+        paths = [path.strip() for path in fields.split(',') if path.strip()] if fields is not None else None
+        expand = {name.strip() for name in expand.split(',') if name.strip()} if expand is not None else None
+        return cls().build_field_selection(paths, expand)
+
+    def build_field_selection(self, paths, expand):
+        readable = {field.field_name: field for field in self._readable_fields}
+        relations = {name for name, field in readable.items() if isinstance(field, SparseFieldsMixin)}
+        names, nested_paths = [], {}
+        for path in paths if paths is not None else readable:
+            name, _, rest = path.partition('.')
+            if name not in names:
+                names.append(name)
+            if rest:
+                nested_paths.setdefault(name, []).append(rest)
+
+        errors = {}
+        unknown = [name for name in names if name not in readable]
+        unknown += [name for name in nested_paths if name in readable and name not in relations]
+        if unknown:
+            errors['fields'] = [f'Unknown field: {name}.' for name in unknown]
+        unknown = sorted({name.partition('.')[0] for name in expand or ()} - relations)
+        if unknown:
+            errors['expand'] = [f'Unknown relation: {name}.' for name in unknown]
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        selection = {}
+        for name in names:
+            if name not in relations:
+                selection[name] = None
+            elif name in nested_paths or expand is None or name in expand:
+                nested_expand = None if expand is None else {
+                    path.partition('.')[2] for path in expand if path.startswith(f'{name}.')}
+                selection[name] = readable[name].build_field_selection(nested_paths.get(name), nested_expand)
+            else:
+                selection[name] = PK_ONLY
+        return selection
+
+    def get_field_selection(self):
+        # Nested serializers get theirs from the parent's get_fields().
+        if self.parent is None or isinstance(self.parent, serializers.ListSerializer):
+            return self.context.get('field_selection')
+        return getattr(self, 'field_selection', None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_field_selection()
+        if selection is None:
+            return fields
+
+        selected = {}
+        for name, field in fields.items():
+            if field.write_only:
+                selected[name] = field
+            elif name in selection:
+                if selection[name] == PK_ONLY:
+                    field = serializers.PrimaryKeyRelatedField(
+                        read_only=True, **({'source': field.source} if field.source else {}))
+                elif selection[name] is not None:
+                    field.field_selection = selection[name]
+                selected[name] = field
+        return selected
+
+    def get_field_paths(self):
+        """
+        Returns the `only()` and `select_related()` paths that cover the
+        selected fields: relations rendered as primary keys, or as objects
+        with only their primary key, read the foreign key without a join.
+        """
+        only, related = [], []
+        for field in self._readable_fields:
+            source = '__'.join(field.source_attrs)
+            if isinstance(field, SparseFieldsMixin):
+                nested_only, nested_related = field.get_field_paths()
+                if nested_only == [field.Meta.model._meta.pk.name] and not nested_related:
+                    only.append(source)
+                    continue
+                related += [source] + [f'{source}__{path}' for path in nested_related]
+                only += [f'{source}__{path}' for path in nested_only]
+            else:
+                only.append(source)
+        return only, related
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'phone', 'role']
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves primary keys from `prefetched`, a pk -> instance map filled by the
+    parent list serializer, instead of running one query per item.
+    """
+    prefetched = None
+
+    def to_internal_value(self, data):
+        if self.prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            instance = self.prefetched.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class TaskListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        related_fields = [field for field in self.child.fields.values()
+                          if isinstance(field, PrefetchedPrimaryKeyRelatedField) and not field.read_only]
+        if isinstance(data, list):
+            for field in related_fields:
+                pks = set()
+                for item in data:
+                    value = item.get(field.field_name) if isinstance(item, dict) else None
+                    if isinstance(value, (int, str)) and str(value).isdigit():
+                        pks.add(int(value))
+                field.prefetched = field.get_queryset().in_bulk(pks)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for field in related_fields:
+                field.prefetched = None
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            return Task.objects.bulk_create([Task(**attrs) for attrs in validated_data])
+
+
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = UserSerializer(read_only=True)
-    customer_id = serializers.PrimaryKeyRelatedField(
+    customer_id = PrefetchedPrimaryKeyRelatedField(
         queryset=User.customer.all(),
         source='customer',
         write_only=True,
         required=False
     )
     employee = UserSerializer(read_only=True)
-    employee_id = serializers.PrimaryKeyRelatedField(
+    employee_id = PrefetchedPrimaryKeyRelatedField(
         queryset=User.employee.all(),
         source='employee',
         write_only=True,
@@ -42,23 +263,222 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer', 'customer_id', 'employee', 'employee_id', 'status', 'created_at',
                   'updated_at', 'closed_at', 'report']
         read_only_fields = ['created_at', 'updated_at', 'closed_at', 'customer', 'report']
+        list_serializer_class = TaskListSerializer
 
-    def create(self, validated_data):
-        validated_data['status'] = Task.PENDING
+    def validate(self, attrs):
+        if self.instance is not None:
+            return attrs
+
+        attrs['status'] = Task.PENDING
         user = self.context['request'].user
 
         if user.role == User.CUSTOMER:
-            if user.has_perm('api.can_create_task') and ('customer' in validated_data):
-                validated_data['customer'] = validated_data['customer']
-            else:
-                validated_data['customer'] = user
-            if 'employee' in validated_data:
+            if not (user.has_perm('api.can_create_task') and 'customer' in attrs):
+                attrs['customer'] = user
+            if 'employee' in attrs:
                 raise serializers.ValidationError("Customers cannot assign employees to tasks.")
         elif user.role == User.EMPLOYEE:
-            if 'employee' in validated_data:
+            if 'employee' in attrs:
                 raise serializers.ValidationError("You can assign a employee only after creation.")
         if user.has_perm('api.can_create_task'):
-            if 'customer' not in validated_data:
+            if 'customer' not in attrs:
                 raise serializers.ValidationError("Not customers must provide customer id to assign to the task.")
 
+        return attrs
+
+    def create(self, validated_data):
         return Task.objects.create(**validated_data)
+
+
+class CompiledReadSerializer:
+    """
+    Read-only stand-in for `serializer_class` on hot GET paths, producing the
+    same representation. The serializer's readable fields are compiled once
+    into `(name, getter, kind, field)` steps, so an object costs a few
+    attribute reads instead of binding fields, instantiating nested
+    serializers and building the related-field querysets that only writes
+    need. Fields whose `to_representation` returns model values unchanged are
+    copied as is, and ISO 8601 datetimes are formatted with the current time
+    zone looked up once per call rather than once per value.
+
+    A `context['field_selection']` is honoured like `SparseFieldsMixin` does,
+    with one plan compiled per selection. Relations rendered as a primary key,
+    or as an object holding only it, read the foreign key column, so they
+    need neither a join nor a query.
+    """
+    serializer_class = None
+    passthrough_fields = (serializers.IntegerField, serializers.CharField, serializers.ChoiceField,
+                          serializers.BooleanField)
+    max_plans = 256
+    COPY, NESTED, NESTED_PK, DATETIME, FIELD = range(5)
+    _plans = None
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def get_plan(cls, selection=None):
+        if cls.__dict__.get('_plans') is None:
+            cls._plans = {}
+        key = json.dumps(selection, sort_keys=True)
+        plan = cls._plans.get(key)
+        if plan is None:
+            if len(cls._plans) >= cls.max_plans:
+                cls._plans.clear()
+            plan = cls._plans[key] = cls.compile(cls.serializer_class(context={'field_selection': selection}))
+        return plan
+
+    @classmethod
+    def compile(cls, serializer):
+        plan = []
+        model = serializer.Meta.model
+        for field in serializer._readable_fields:
+            if not field.source_attrs or isinstance(field, serializers.ListSerializer):
+                raise TypeError(f'{cls.__name__} cannot compile {field.field_name!r}.')
+            if len(field.source_attrs) == 1:
+                get = attrgetter(field.source_attrs[0])
+            else:
+                get = partial(cls.get_attribute, field.source_attrs)
+
+            if isinstance(field, serializers.BaseSerializer):
+                kind, arg = cls.NESTED, cls.compile(field)
+                pk_name = field.Meta.model._meta.pk.name
+                if len(field.source_attrs) == 1 and [step[0] for step in arg] == [pk_name]:
+                    kind, arg = cls.NESTED_PK, pk_name
+                    get = attrgetter(model._meta.get_field(field.source).attname)
+            elif (isinstance(field, serializers.PrimaryKeyRelatedField) and len(field.source_attrs) == 1
+                  and field.pk_field is None):
+                kind, arg = cls.COPY, None
+                get = attrgetter(model._meta.get_field(field.source).attname)
+            elif isinstance(field, cls.passthrough_fields):
+                kind, arg = cls.COPY, None
+            elif (isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone')
+                  and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601):
+                kind, arg = cls.DATETIME, field
+            else:
+                kind, arg = cls.FIELD, field
+            plan.append((field.field_name, get, kind, arg))
+        return plan
+
+    @staticmethod
+    def get_attribute(attrs, instance):
+        for attr in attrs:
+            instance = getattr(instance, attr)
+            if instance is None:
+                return None
+        return instance
+
+    @classmethod
+    def represent(cls, plan, instance, tz):
+        data = {}
+        for name, get, kind, arg in plan:
+            value = get(instance)
+            if value is None or kind == cls.COPY:
+                data[name] = value
+            elif kind == cls.NESTED:
+                data[name] = cls.represent(arg, value, tz)
+            elif kind == cls.NESTED_PK:
+                data[name] = {arg: value}
+            elif kind == cls.DATETIME and tz is not None and value.tzinfo is not None:
+                # DateTimeField.to_representation() for aware values.
+                value = value.astimezone(tz).isoformat()
+                data[name] = value[:-6] + 'Z' if value.endswith('+00:00') else value
+            else:
+                data[name] = arg.to_representation(value)
+        return data
+
+    @property
+    def data(self):
+        plan = self.get_plan(self.context.get('field_selection'))
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        if self.many:
+            return [self.represent(plan, instance, tz) for instance in self.instance]
+        return self.represent(plan, self.instance, tz)
+
+
+class TaskReadSerializer(CompiledReadSerializer):
+    serializer_class = TaskSerializer
+
+
+class TaskIdSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+
+
+class TaskCompletionSerializer(TaskIdSerializer):
+    # Checked per task, like the single endpoint does.
+    report = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+
+
+class TaskFilterSerializer(serializers.Serializer):
+    status = serializers.MultipleChoiceField(choices=Task.STATUS_CHOICES, required=False)
+    customer = serializers.IntegerField(required=False)
+    employee = serializers.IntegerField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    closed_after = serializers.DateTimeField(required=False)
+    closed_before = serializers.DateTimeField(required=False)
+    search = serializers.CharField(required=False, max_length=200)
+
+
+class TaskStatsQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(default=30, min_value=1, max_value=366)
+    limit = serializers.IntegerField(default=50, min_value=1, max_value=500)
+
+
+class EmployeeTaskStatsSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='employee.username')
+    mean_completion_seconds = serializers.FloatField()
+
+    class Meta:
+        model = EmployeeTaskStats
+        fields = ['employee', 'username', 'in_progress', 'completed', 'mean_completion_seconds']
+
+
+class CustomerTaskStatsSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='customer.username')
+    mean_completion_seconds = serializers.FloatField()
+
+    class Meta:
+        model = CustomerTaskStats
+        fields = ['customer', 'username', 'pending', 'in_progress', 'completed', 'mean_completion_seconds']
+
+
+class DailyTaskStatsSerializer(serializers.ModelSerializer):
+    mean_completion_seconds = serializers.FloatField()
+
+    class Meta:
+        model = DailyTaskStats
+        fields = ['date', 'created', 'completed', 'mean_completion_seconds']
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh[jwt_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('User not found or inactive', code='user_not_found')
+        if refresh.get(VERSION_CLAIM) != user.token_version:
+            add_user_claims(refresh, user)
+
+        data = {'access': str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .backends import invalidate_permissions
+from .directory import invalidate_employee_directory
+from .events import record_task_events
+from .filters import FTS_TABLE
+from .metrics import record_query
+from .models import Task, TaskState, User, tasks_changed
+from .routers import read_database
+from .serializers import UserSerializer
+from .stats import apply_task_changes, create_employee_stats
+
+
+DIRECTORY_FIELDS = frozenset(UserSerializer.Meta.fields)
+
+
+def permissions_changed(user_ids):
+    invalidate_permissions(user_ids)
+    User.objects.filter(pk__in=user_ids).update(token_version=F('token_version') + 1)
+
+
+def group_member_ids(groups):
+    return set(User.objects.filter(groups__in=groups).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # On the forward side `instance` is the user; on the reverse side it is the
+    # permission or group and `pk_set` holds the users.
+    if action in ('post_add', 'post_remove'):
+        permissions_changed(pk_set if reverse else {instance.pk})
+    elif action == 'pre_clear':
+        permissions_changed(set(instance.user_set.values_list('pk', flat=True)) if reverse else {instance.pk})
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        permissions_changed(group_member_ids(pk_set if reverse else [instance]))
+    elif action == 'pre_clear':
+        permissions_changed(group_member_ids(instance.group_set.all() if reverse else [instance]))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    permissions_changed(group_member_ids([instance]))
+
+
+@receiver(pre_save, sender=User)
+def bump_token_version(sender, instance, update_fields=None, **kwargs):
+    if not instance._state.adding and update_fields is None:
+        instance.token_version += 1
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Role, superuser and active flags all feed into permission checks.
+    invalidate_permissions({instance.pk})
+
+
+@receiver(pre_save, sender=User)
+def remember_employee_role(sender, instance, update_fields=None, **kwargs):
+    # Only a save moving a user out of the employee role needs the stored
+    # role; saves of employees invalidate anyway and customers never show.
+    if instance.pk is None or instance.role == User.EMPLOYEE:
+        return
+    if update_fields is not None and not DIRECTORY_FIELDS.intersection(update_fields):
+        return
+    instance._was_employee = User.objects.filter(pk=instance.pk, role=User.EMPLOYEE).exists()
+
+
+@receiver(post_save, sender=User)
+def employee_saved(sender, instance, update_fields=None, **kwargs):
+    was_employee = instance.__dict__.pop('_was_employee', False)
+    if update_fields is not None and not DIRECTORY_FIELDS.intersection(update_fields):
+        return
+    if instance.role == User.EMPLOYEE or was_employee:
+        invalidate_employee_directory()
+
+
+@receiver(post_save, sender=User)
+def employee_stats_row(sender, instance, created, update_fields=None, **kwargs):
+    if instance.role == User.EMPLOYEE and (created or update_fields is None or 'role' in update_fields):
+        create_employee_stats([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def employee_deleted(sender, instance, **kwargs):
+    if instance.role == User.EMPLOYEE:
+        invalidate_employee_directory()
+
+
+@receiver(tasks_changed, sender=Task)
+def update_task_stats(sender, changes, **kwargs):
+    apply_task_changes(changes)
+
+
+@receiver(tasks_changed, sender=Task)
+def log_task_events(sender, changes, **kwargs):
+    record_task_events(changes)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, **kwargs):
+    tasks_changed.send(sender=Task, changes=[(TaskState.of(instance), None)])
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    # Sent again on every reconnect of the same connection object.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        # FTS5 loads its configuration on the first access of a connection.
+        # If that access is a write, made by the triggers of an insert or
+        # update, SQLite reports "database is locked" at once when another
+        # connection is writing, instead of waiting busy_timeout: read first.
+        try:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE} WHERE rowid = 0')
+        except DatabaseError:
+            # Not migrated yet.
+            pass
+
+
+@receiver(request_finished)
+def reset_read_database(sender, **kwargs):
+    # Sent once the response, streamed or not, has been sent; code running
+    # on the same thread afterwards reads from the primary again.
+    read_database.set(None)
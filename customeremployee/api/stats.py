@@ -0,0 +1,124 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedTask, CustomerTaskStats, DailyTaskStats, EmployeeTaskStats, Task, User
+
+STATUS_FIELDS = (Task.PENDING, Task.IN_PROGRESS, Task.COMPLETED)
+
+
+def completion_seconds(state):
+    if state.status == Task.COMPLETED and state.closed_at is not None:
+        return (state.closed_at - state.created_at).total_seconds()
+    return None
+
+
+def contributions(state):
+    """
+    Yields the `(model, pk, counters)` a task in `state` adds to the summary
+    tables; a change subtracts those of the old state and adds the new ones.
+    """
+    counts = {state.status: 1}
+    seconds = completion_seconds(state)
+    if seconds is not None:
+        counts.update(completion_count=1, completion_seconds=seconds)
+
+    yield CustomerTaskStats, state.customer_id, counts
+    if state.employee_id is not None:
+        yield EmployeeTaskStats, state.employee_id, counts
+    yield DailyTaskStats, timezone.localdate(state.created_at), {'created': 1}
+    if seconds is not None:
+        yield DailyTaskStats, timezone.localdate(state.closed_at), {'completed': 1, 'completion_seconds': seconds}
+
+
+def task_deltas(changes, deltas=None):
+    """
+    Adds what `changes` add to and subtract from each summary row to
+    `deltas`, a `{(model, pk): Counter}` mapping, and returns it.
+    """
+    if deltas is None:
+        deltas = defaultdict(Counter)
+    for old, new in changes:
+        for sign, state in ((-1, old), (1, new)):
+            if state is not None:
+                for model, pk, counts in contributions(state):
+                    for field, value in counts.items():
+                        deltas[model, pk][field] += sign * value
+    return deltas
+
+
+def apply_deltas(deltas):
+    for (model, pk), counts in deltas.items():
+        counts = {field: value for field, value in counts.items() if value}
+        if not counts:
+            continue
+        updates = {field: F(field) + value for field, value in counts.items()}
+        if model.objects.filter(pk=pk).update(**updates):
+            continue
+        # Rows are created by the first task that adds to them. Pure
+        # decrements skip creation: they come from deletes, possibly of the
+        # user the row belongs to.
+        if any(value > 0 for value in counts.values()):
+            try:
+                with transaction.atomic():
+                    model.objects.create(pk=pk, **counts)
+            except IntegrityError:
+                model.objects.filter(pk=pk).update(**updates)
+
+
+def apply_task_changes(changes):
+    apply_deltas(task_deltas(changes))
+
+
+def create_employee_stats(pks):
+    """
+    Creates empty stats rows for the employees `pks` that have none.
+    """
+    EmployeeTaskStats.objects.bulk_create([EmployeeTaskStats(pk=pk) for pk in pks], ignore_conflicts=True)
+
+
+def rebuild_task_stats(tables=(Task, ArchivedTask)):
+    """
+    Recomputes every summary table with aggregates over the task models in
+    `tables`, by default the live and archived tasks.
+    """
+    completed = Q(status=Task.COMPLETED, closed_at__isnull=False)
+    duration = ExpressionWrapper(F('closed_at') - F('created_at'), output_field=DurationField())
+    counters = {
+        **{status: Count('pk', filter=Q(status=status)) for status in STATUS_FIELDS},
+        'completion_count': Count('pk', filter=completed),
+        'completion_duration': Sum(duration, filter=completed),
+    }
+
+    def rows(model, key, filters):
+        totals = defaultdict(Counter)
+        for task_model in tables:
+            for values in task_model.objects.filter(**filters).order_by().values(key).annotate(**counters):
+                pk = values.pop(key)
+                values['completion_seconds'] = (values.pop('completion_duration') or timedelta()).total_seconds()
+                totals[pk].update(values)
+        return [model(pk=pk, **values) for pk, values in totals.items()]
+
+    with transaction.atomic():
+        CustomerTaskStats.objects.all().delete()
+        CustomerTaskStats.objects.bulk_create(rows(CustomerTaskStats, 'customer_id', {}))
+
+        EmployeeTaskStats.objects.all().delete()
+        EmployeeTaskStats.objects.bulk_create(rows(EmployeeTaskStats, 'employee_id', {'employee__isnull': False}))
+        create_employee_stats(User.employee.values_list('pk', flat=True))
+
+        daily = defaultdict(Counter)
+        for task_model in tables:
+            for row in (task_model.objects.order_by().values(day=TruncDate('created_at'))
+                        .annotate(created=Count('pk'))):
+                daily[row['day']]['created'] += row['created']
+            for row in (task_model.objects.filter(completed).order_by().values(day=TruncDate('closed_at'))
+                        .annotate(completed=Count('pk'), duration=Sum(duration))):
+                daily[row['day']].update(completed=row['completed'],
+                                         completion_seconds=row['duration'].total_seconds())
+        DailyTaskStats.objects.all().delete()
+        DailyTaskStats.objects.bulk_create(DailyTaskStats(date=day, **values) for day, values in daily.items())
@@ -1,3 +1,2631 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import count
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import urlencode, urlsplit
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, router, transaction
+from django.db.models import F, Sum
+from django.http import HttpResponse, QueryDict
+from django.test import (Client, LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .archive import archive_tasks
+from .async_views import AsyncCurrentUserView, AsyncEmployeeListView, AsyncTaskViewSet
+from .authentication import ClaimsJWTAuthentication
+from .backends import permission_cache_key
+from .dispatch import dispatch_tasks, least_loaded_employees
+from .events import TaskEventBus
+from .filters import FTS_TRIGGERS, TaskFilterBackend, search_reports
+from .management.commands.seed_data import SEED_PASSWORD
+from .metrics import MetricsRegistry, metrics_registry
+from .middleware import RequestMetricsMiddleware
+from .models import (ArchivedTask, CustomerTaskStats, DailyTaskStats, EmployeeTaskStats, ReadOnlyUserError, User,
+                     Task, TaskEvent, TaskQuerySet)
+from .pagination import TaskPagination
+from .routers import PIN_COOKIE, read_database
+from .serializers import RegisterListSerializer, TaskReadSerializer, TaskSerializer
+from .stats import rebuild_task_stats
+from .views import TaskViewSet
+
+phone_numbers = count(100000000)
+
+
+def create_user(username, role='', is_superuser=False, perms=(), password=None):
+    user = User.objects.create_user(username=username, password=password, role=role,
+                                    phone=f'+{next(phone_numbers)}', is_superuser=is_superuser)
+    if perms:
+        user.user_permissions.set(Permission.objects.filter(content_type__app_label='api', codename__in=perms))
+    return user
+
+
+class CacheIsolationMixin:
+    # Permissions are cached across requests and user ids are reused between
+    # tests, so every test starts from an empty cache.
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class QueryBudgetMixin(CacheIsolationMixin):
+    task_count = 10
+    # Writes include the summary-table updates, plus a savepoint and an
+    # INSERT the first time a stats row is created, and the task event.
+    budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'assign': 10,
+        'complete': 8,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = create_user('root', is_superuser=True)
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        cls.customer = create_user('customer', User.CUSTOMER)
+        other_customer = create_user('other_customer', User.CUSTOMER)
+        other_employee = create_user('other_employee', User.EMPLOYEE)
+
+        tasks = []
+        for i in range(cls.task_count):
+            customer = cls.customer if i % 2 else other_customer
+            if i % 3 == 0:
+                tasks.append(Task(customer=customer, status=Task.PENDING))
+            elif i % 3 == 1:
+                tasks.append(Task(customer=customer, employee=cls.employee, status=Task.IN_PROGRESS))
+            else:
+                tasks.append(Task(customer=customer, employee=other_employee, status=Task.IN_PROGRESS))
+        Task.objects.bulk_create(tasks)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def assertWithinBudget(self, endpoint, func):
+        with CaptureQueriesContext(connection) as ctx:
+            response = func()
+        self.assertLessEqual(
+            len(ctx), self.budgets[endpoint],
+            f'{endpoint} ran {len(ctx)} queries with {self.task_count} tasks:\n'
+            + '\n'.join(q['sql'] for q in ctx.captured_queries)
+        )
+        return response
+
+    def test_list(self):
+        for user in (self.superuser, self.manager, self.employee, self.customer):
+            with self.subTest(user=user.username):
+                client = self.client_for(user)
+                response = self.assertWithinBudget('list', lambda: client.get('/tasks/'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_retrieve(self):
+        task = Task.objects.filter(customer=self.customer, employee=None).first()
+        for user in (self.superuser, self.manager, self.employee, self.customer):
+            with self.subTest(user=user.username):
+                client = self.client_for(user)
+                response = self.assertWithinBudget('retrieve', lambda: client.get(f'/tasks/{task.pk}/'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['customer']['id'], self.customer.pk)
+
+    def test_assign_and_complete(self):
+        for user in (self.superuser, self.manager, self.employee):
+            with self.subTest(user=user.username):
+                task = Task.objects.filter(status=Task.PENDING).first()
+                client = self.client_for(user)
+                response = self.assertWithinBudget(
+                    'assign', lambda: client.patch(f'/tasks/{task.pk}/assign/'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['employee']['id'], user.pk)
+
+                response = self.assertWithinBudget(
+                    'complete', lambda: client.patch(f'/tasks/{task.pk}/complete/', {'report': 'done'}))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['status'], Task.COMPLETED)
+
+
+class QueryBudget10TasksTest(QueryBudgetMixin, TestCase):
+    task_count = 10
+
+
+class QueryBudget1000TasksTest(QueryBudgetMixin, TestCase):
+    task_count = 1000
+
+
+class QueryBudget10000TasksTest(QueryBudgetMixin, TestCase):
+    task_count = 10000
+
+
+class KeysetPaginationTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = create_user('root', is_superuser=True)
+        cls.customer = create_user('customer', User.CUSTOMER, perms=['can_view_employees'])
+        cls.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(7)]
+        Task.objects.bulk_create(Task(customer=cls.customer) for _ in range(23))
+        # Tasks sharing a created_at must still be ordered by id and never skipped.
+        now = timezone.now()
+        Task.objects.filter(pk__in=Task.objects.order_by('id').values('pk')[5:9]).update(created_at=now)
+        Task.objects.filter(pk__in=Task.objects.order_by('id').values('pk')[:5]).update(
+            created_at=now - timedelta(days=1))
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.superuser)
+
+    def expected_task_ids(self):
+        return list(Task.objects.order_by('created_at', 'id').values_list('id', flat=True))
+
+    def walk(self, url, direction='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data[direction]
+        return pages
+
+    def test_pages_cover_tasks_in_order(self):
+        pages = self.walk('/tasks/?page_size=5')
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), self.expected_task_ids())
+
+    def test_previous_links_walk_back(self):
+        pages = self.walk('/tasks/?page_size=5')
+        last = self.client.get('/tasks/?page_size=5')
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backwards = self.walk(last.data['previous'], direction='previous')
+        self.assertEqual(backwards, list(reversed(pages[:-1])))
+
+    def test_stable_under_concurrent_inserts(self):
+        expected = self.expected_task_ids()
+        response = self.client.get('/tasks/?page_size=10')
+        seen = [item['id'] for item in response.data['results']]
+        Task.objects.bulk_create(Task(customer=self.customer) for _ in range(3))
+        url = response.data['next']
+        while url:
+            response = self.client.get(url)
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen[:len(expected)], expected)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), len(expected) + 3)
+
+    def test_no_count_query(self):
+        first = self.client.get('/tasks/?page_size=5')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first.data['next'])
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_page_size_is_capped(self):
+        Task.objects.bulk_create(Task(customer=self.customer) for _ in range(600))
+        response = self.client.get('/tasks/?page_size=100000')
+        self.assertEqual(len(response.data['results']), 500)
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'eyJwIjpbMV19', 'eyJwIjpbImJhZCIsMV19'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/tasks/?cursor={cursor}').status_code, 404)
+
+    def test_employee_pages(self):
+        self.client.force_authenticate(self.customer)
+        pages = self.walk('/employees/?page_size=3')
+        self.assertEqual(sum(pages, []), [employee.pk for employee in self.employees])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class TaskIndexPlanTest(TestCase):
+    """
+    Checks that every branch of `TaskViewSet.get_queryset` and every task
+    filter is served by an index.
+
+    Runs against a small table by default; set BENCHMARK_TASKS=1000000 to seed
+    a production-sized table and print the plans and timings.
+    """
+    task_count = int(os.environ.get('BENCHMARK_TASKS', 3000))
+    report_words = ['printer', 'network', 'invoice', 'password', 'replaced', 'cable', 'update', 'refund']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = create_user('root', is_superuser=True)
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(50)]
+        employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(50)]
+        cls.customer, cls.employee = customers[0], employees[0]
+
+        rng = random.Random(0)
+        tasks = []
+        for _ in range(cls.task_count):
+            status = rng.choices([Task.PENDING, Task.IN_PROGRESS, Task.COMPLETED], [1, 2, 7])[0]
+            employee = None if status == Task.PENDING else rng.choice(employees)
+            closed_at = report = None
+            if status == Task.COMPLETED:
+                closed_at = timezone.now() - timedelta(minutes=rng.randrange(525600))
+                report = ' '.join(rng.sample(cls.report_words, 3)) + f' ticket{rng.randrange(100000)}'
+            tasks.append(Task(customer=rng.choice(customers), employee=employee, status=status,
+                              closed_at=closed_at, report=report or ''))
+        Task.objects.bulk_create(tasks, batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def list_queryset(self, user, cursor_from=None):
+        view = TaskViewSet(action='list', request=SimpleNamespace(user=User.objects.get(pk=user.pk),
+                                                                  query_params=QueryDict()))
+        queryset = view.get_queryset().order_by(*TaskPagination.ordering)
+        if cursor_from is not None:
+            pagination = TaskPagination()
+            position = pagination.get_position(cursor_from)
+            queryset = queryset.filter(pagination.seek(SimpleNamespace(position=position, reverse=False)))
+        return queryset[:TaskPagination.page_size + 1]
+
+    def assertUsesIndex(self, label, queryset, index, sorts=False):
+        plan = queryset.explain()
+        started = time.perf_counter()
+        list(queryset)
+        elapsed = time.perf_counter() - started
+        if 'BENCHMARK_TASKS' in os.environ:
+            print(f'\n{label} ({self.task_count} tasks, {elapsed * 1000:.2f} ms)\n{plan}')
+        self.assertIn(f'USING INDEX {index}', plan, label)
+        self.assertNotIn('SCAN api_task\n', plan + '\n', label)
+        if not sorts:
+            self.assertNotIn('TEMP B-TREE', plan, label)
+
+    def test_view_all_branch(self):
+        for user in (self.superuser, self.manager):
+            self.assertUsesIndex(f'list as {user.username}', self.list_queryset(user), 'task_created_id_idx')
+
+    def test_view_all_branch_later_page(self):
+        middle = Task.objects.order_by('created_at', 'id')[self.task_count // 2]
+        self.assertUsesIndex('list page N as root', self.list_queryset(self.superuser, middle),
+                             'task_created_id_idx (created_at>?)')
+
+    def test_employee_branch(self):
+        # Both arms of the OR are index seeks; only their union is sorted.
+        self.assertUsesIndex('list as employee', self.list_queryset(self.employee),
+                             'task_employee_created_idx', sorts=True)
+
+    def test_customer_branch(self):
+        self.assertUsesIndex('list as customer', self.list_queryset(self.customer), 'task_customer_created_idx')
+
+    def filtered_queryset(self, params, user=None):
+        request = SimpleNamespace(user=User.objects.get(pk=(user or self.superuser).pk), query_params=QueryDict(params))
+        view = TaskViewSet(action='list', request=request)
+        queryset = TaskFilterBackend().filter_queryset(request, view.get_queryset(), view)
+        return queryset.order_by(*TaskPagination.ordering)[:TaskPagination.page_size + 1]
+
+    def test_filters(self):
+        ticket = Task.objects.filter(status=Task.COMPLETED).first().report.split()[-1]
+        for params, index, sorts in [
+            (f'status={Task.IN_PROGRESS}', 'task_status_created_idx', False),
+            (f'customer={self.customer.pk}', 'task_customer_created_idx', False),
+            (f'employee={self.employee.pk}', 'task_employee_created_idx', False),
+            (f'employee={self.employee.pk}&status={Task.COMPLETED}', 'task_employee_status_idx', False),
+            (urlencode({'created_after': timezone.now()}), 'task_created_id_idx (created_at>?)', False),
+            (urlencode({'closed_after': timezone.now() - timedelta(days=1), 'closed_before': timezone.now()}),
+             'task_closed_idx (closed_at>? AND closed_at<?)', True),
+        ]:
+            with self.subTest(params):
+                self.assertUsesIndex(f'list ?{params}', self.filtered_queryset(params), index, sorts)
+        self.assertUsesIndex(f'list as customer ?status={Task.COMPLETED}',
+                             self.filtered_queryset(f'status={Task.COMPLETED}', self.customer),
+                             'task_customer_created_idx')
+        # A rare word is looked up in the FTS index and only its rows sorted.
+        queryset = self.filtered_queryset(f'search={ticket}')
+        plan = queryset.explain()
+        started = time.perf_counter()
+        found = list(queryset)
+        elapsed = time.perf_counter() - started
+        if 'BENCHMARK_TASKS' in os.environ:
+            print(f'\nlist ?search={ticket} ({self.task_count} tasks, {elapsed * 1000:.2f} ms)\n{plan}')
+        self.assertEqual(len(found), Task.objects.filter(report__contains=ticket).count())
+        self.assertIn('SCAN api_task_fts VIRTUAL TABLE INDEX', plan)
+        self.assertIn('SEARCH api_task USING INTEGER PRIMARY KEY', plan)
+
+    def test_pending_unassigned(self):
+        queryset = Task.objects.filter(status=Task.PENDING, employee=None).order_by('created_at', 'id')[:1]
+        plan = queryset.explain()
+        self.assertTrue('task_pending_unassigned_idx' in plan or 'task_employee_status_idx' in plan, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_status_check_by_pk(self):
+        task = Task.objects.order_by('id').last()
+        queryset = Task.objects.filter(pk=task.pk, status=Task.PENDING, employee=None)
+        self.assertIn('USING INTEGER PRIMARY KEY', queryset.explain())
+
+
+class TaskClaimTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER)
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        cls.other_employee = create_user('other_employee', User.EMPLOYEE)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee)
+
+    def test_assign_claims_pending_task(self):
+        task = Task.objects.create(customer=self.customer)
+        response = self.client.patch(f'/tasks/{task.pk}/assign/')
+        self.assertEqual(response.status_code, 200)
+        task.refresh_from_db()
+        self.assertEqual((task.employee, task.status), (self.employee, Task.IN_PROGRESS))
+
+    def test_assign_conflict(self):
+        task = Task.objects.create(customer=self.customer, employee=self.other_employee, status=Task.IN_PROGRESS)
+        response = self.client.patch(f'/tasks/{task.pk}/assign/')
+        self.assertEqual(response.status_code, 409)
+        task.refresh_from_db()
+        self.assertEqual(task.employee, self.other_employee)
+
+    def test_complete_conflict(self):
+        task = Task.objects.create(customer=self.customer, employee=self.employee, status=Task.IN_PROGRESS)
+        get_object = TaskViewSet.get_object
+
+        def completed_after_read(view):
+            stale = get_object(view)
+            Task.objects.filter(pk=task.pk).complete(self.employee.pk, 'first')
+            return stale
+
+        with mock.patch.object(TaskViewSet, 'get_object', completed_after_read):
+            response = self.client.patch(f'/tasks/{task.pk}/complete/', {'report': 'second'})
+        self.assertEqual(response.status_code, 409)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.report), (Task.COMPLETED, 'first'))
+        self.assertEqual(EmployeeTaskStats.objects.get(employee=self.employee).completed, 1)
+
+    def test_assign_missing_task(self):
+        self.assertEqual(self.client.patch('/tasks/999999/assign/').status_code, 404)
+
+    def test_claim_oldest_pending(self):
+        old, new = Task.objects.bulk_create([Task(customer=self.customer), Task(customer=self.customer)])
+        Task.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        Task.objects.create(customer=self.customer, employee=self.other_employee, status=Task.IN_PROGRESS)
+
+        response = self.client.post('/tasks/claim/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], old.pk)
+        self.assertEqual(response.data['employee']['id'], self.employee.pk)
+        self.assertEqual(self.client.post('/tasks/claim/').data['id'], new.pk)
+        self.assertEqual(self.client.post('/tasks/claim/').status_code, 204)
+
+    def test_claim_requires_employee(self):
+        Task.objects.create(customer=self.customer)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.post('/tasks/claim/').status_code, 403)
+
+
+class TaskClaimConcurrencyTest(CacheIsolationMixin, TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        super().setUp()
+        self.customer = create_user('customer', User.CUSTOMER)
+        self.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(self.threads)]
+
+    def run_concurrently(self, request):
+        barrier = threading.Barrier(self.threads)
+        results = {}
+
+        def worker(employee):
+            client = APIClient()
+            client.force_authenticate(employee)
+            barrier.wait()
+            try:
+                results[employee.pk] = request(client)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(employee,)) for employee in self.employees]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+
+    def test_exactly_one_assign_wins(self):
+        for _ in range(5):
+            task = Task.objects.create(customer=self.customer)
+            results = self.run_concurrently(lambda client: client.patch(f'/tasks/{task.pk}/assign/').status_code)
+            winners = [pk for pk, code in results.items() if code == 200]
+            self.assertEqual(len(winners), 1, results)
+            self.assertEqual(sorted(results.values()), [200] + [409] * (self.threads - 1))
+            task.refresh_from_db()
+            self.assertEqual(task.employee_id, winners[0])
+
+    def test_claim_hands_out_each_task_once(self):
+        Task.objects.bulk_create(Task(customer=self.customer) for _ in range(self.threads * 3))
+
+        def claim_all(client):
+            claimed = []
+            while True:
+                response = client.post('/tasks/claim/')
+                if response.status_code == 204:
+                    return claimed
+                if response.status_code == 200:
+                    claimed.append(response.data['id'])
+
+        results = self.run_concurrently(claim_all)
+        claimed = sum(results.values(), [])
+        self.assertEqual(len(claimed), self.threads * 3)
+        self.assertEqual(len(set(claimed)), len(claimed))
+        for employee_pk, task_ids in results.items():
+            self.assertEqual(set(Task.objects.filter(employee_id=employee_pk).values_list('pk', flat=True)),
+                             set(task_ids))
+
+
+class PermissionCacheTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER)
+        cls.employee = create_user('employee', User.EMPLOYEE, perms=['can_create_task'])
+        cls.task = Task.objects.create(customer=cls.customer)
+
+    def request(self, user, method, url, data=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(client, method)(url, data, format='json')
+        permission_queries = [q['sql'] for q in ctx.captured_queries
+                              if 'auth_permission' in q['sql'] or 'auth_group' in q['sql']]
+        return response, permission_queries
+
+    def test_warm_requests_run_no_permission_queries(self):
+        for user, method, url, data in (
+            (self.employee, 'post', '/tasks/', {'customer_id': self.customer.pk}),
+            (self.employee, 'get', '/tasks/', None),
+            (self.employee, 'get', f'/tasks/{self.task.pk}/', None),
+            (self.customer, 'get', '/employees/', None),
+        ):
+            with self.subTest(method=method, url=url):
+                self.request(user, method, url, data)
+                response, queries = self.request(user, method, url, data)
+                self.assertEqual(queries, [])
+
+    def test_user_permission_change_invalidates(self):
+        self.assertEqual(self.request(self.customer, 'get', '/employees/')[0].status_code, 403)
+        permission = Permission.objects.get(codename='can_view_employees')
+        self.customer.user_permissions.add(permission)
+        self.assertEqual(self.request(self.customer, 'get', '/employees/')[0].status_code, 200)
+        permission.user_set.remove(self.customer)
+        self.assertEqual(self.request(self.customer, 'get', '/employees/')[0].status_code, 403)
+
+    def test_group_changes_invalidate(self):
+        group = Group.objects.create(name='viewers')
+        self.customer.groups.add(group)
+        self.assertEqual(self.request(self.customer, 'get', '/employees/')[0].status_code, 403)
+        group.permissions.add(Permission.objects.get(codename='can_view_employees'))
+        self.assertEqual(self.request(self.customer, 'get', '/employees/')[0].status_code, 200)
+        group.user_set.clear()
+        self.assertEqual(self.request(self.customer, 'get', '/employees/')[0].status_code, 403)
+
+    def test_user_save_invalidates(self):
+        self.request(self.employee, 'get', '/tasks/')
+        self.assertIsNotNone(cache.get(permission_cache_key(self.employee.pk)))
+        self.employee.role = User.CUSTOMER
+        self.employee.save()
+        self.assertIsNone(cache.get(permission_cache_key(self.employee.pk)))
+
+
+class ClaimsAuthenticationTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER, password='password')
+        cls.employee = create_user('employee', User.EMPLOYEE, perms=['can_create_task'], password='password')
+
+    def obtain(self, user):
+        response = APIClient().post('/api/token/', {'username': user.username, 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def refresh(self, tokens):
+        return APIClient().post('/api/token/refresh/', {'refresh': tokens['refresh']})
+
+    def client_with(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def test_access_token_carries_claims(self):
+        token = AccessToken(self.obtain(self.employee)['access'])
+        self.assertEqual(token['role'], User.EMPLOYEE)
+        self.assertEqual(token['perms'], ['can_create_task'])
+        self.assertFalse(token['is_superuser'])
+
+    def test_me_runs_no_queries(self):
+        client = self.client_with(self.obtain(self.customer)['access'])
+        with self.assertNumQueries(0):
+            response = client.get('/me/')
+        self.assertEqual(response.data['username'], 'customer')
+        self.assertEqual(response.data['phone'], self.customer.phone)
+
+    def test_requests_do_not_load_the_user(self):
+        employee = self.client_with(self.obtain(self.employee)['access'])
+        with CaptureQueriesContext(connection) as ctx:
+            response = employee.post('/tasks/', {'customer_id': self.customer.pk})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['customer']['id'], self.customer.pk)
+            employee.get('/tasks/')
+            employee.patch(f'/tasks/{response.data["id"]}/assign/')
+        user_lookups = [q['sql'] for q in ctx.captured_queries
+                        if f'WHERE "api_user"."id" = {self.employee.pk} LIMIT' in q['sql']]
+        self.assertEqual(user_lookups, [])
+
+        customer = self.client_with(self.obtain(self.customer)['access'])
+        response = customer.post('/tasks/', {})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['customer']['username'], 'customer')
+
+    def test_permission_change_applies_on_refresh(self):
+        tokens = self.obtain(self.customer)
+        self.assertEqual(self.client_with(tokens['access']).get('/employees/').status_code, 403)
+
+        self.customer.user_permissions.add(Permission.objects.get(codename='can_view_employees'))
+        self.assertEqual(self.client_with(tokens['access']).get('/employees/').status_code, 403)
+
+        access = self.refresh(tokens).data['access']
+        self.assertEqual(AccessToken(access)['perms'], ['can_view_employees'])
+        self.assertEqual(self.client_with(access).get('/employees/').status_code, 200)
+
+    def test_claims_skip_the_permission_cache(self):
+        # Another worker's cache may still hold the permissions from before a change.
+        tokens = self.obtain(self.customer)
+        self.customer.user_permissions.add(Permission.objects.get(codename='can_view_employees'))
+        cache.set(permission_cache_key(self.customer.pk), {'api.can_add_employee'})
+        self.assertEqual(AccessToken(self.refresh(tokens).data['access'])['perms'], ['can_view_employees'])
+
+    def test_role_change_applies_on_refresh(self):
+        tokens = self.obtain(self.employee)
+        user = User.objects.get(pk=self.employee.pk)
+        user.role = User.CUSTOMER
+        user.save()
+        self.assertEqual(AccessToken(self.refresh(tokens).data['access'])['role'], User.CUSTOMER)
+
+    def test_inactive_user_cannot_refresh(self):
+        tokens = self.obtain(self.customer)
+        User.objects.filter(pk=self.customer.pk).update(is_active=False)
+        self.assertEqual(self.refresh(tokens).status_code, 401)
+
+    def test_claims_user_is_read_only(self):
+        user = ClaimsJWTAuthentication().get_user(AccessToken(self.obtain(self.customer)['access']))
+        self.assertEqual(user, self.customer)
+        with self.assertRaisesMessage(ReadOnlyUserError, 'read-only'):
+            user.save()
+        with self.assertRaises(ReadOnlyUserError):
+            user.delete()
+        self.assertTrue(User.objects.filter(pk=self.customer.pk).exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite specific')
+class SQLiteConcurrencyTest(SimpleTestCase):
+    databases = {'default'}
+    alias = 'concurrency'
+    writers = 8
+    readers = 4
+    transactions = 50
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings[self.alias] = {
+            **connections.settings['default'], 'NAME': os.path.join(directory.name, 'db.sqlite3'),
+        }
+        self.addCleanup(self.remove_alias)
+        with connections[self.alias].cursor() as cursor:
+            # Set by the api.0010_sqlite_wal migration on migrated databases.
+            cursor.execute('PRAGMA journal_mode = WAL')
+            cursor.execute('CREATE TABLE entry (id INTEGER PRIMARY KEY, writer INTEGER)')
+            cursor.execute('CREATE TABLE counter (total INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (0)')
+
+    def remove_alias(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_parallel_writers(self):
+        errors = []
+        done = threading.Event()
+
+        def write(writer):
+            try:
+                for _ in range(self.transactions):
+                    with transaction.atomic(using=self.alias):
+                        with connections[self.alias].cursor() as cursor:
+                            cursor.execute('INSERT INTO entry (writer) VALUES (%s)', [writer])
+                            cursor.execute('UPDATE counter SET total = total + 1')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[self.alias].close()
+
+        def read():
+            try:
+                while not done.is_set():
+                    with connections[self.alias].cursor() as cursor:
+                        cursor.execute('SELECT COUNT(*) FROM entry')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[self.alias].close()
+
+        writers = [threading.Thread(target=write, args=(i,)) for i in range(self.writers)]
+        readers = [threading.Thread(target=read) for _ in range(self.readers)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*), (SELECT total FROM counter) FROM entry')
+            self.assertEqual(cursor.fetchone(), (self.writers * self.transactions,) * 2)
+
+
+class TaskWriteConcurrencyTest(CacheIsolationMixin, TransactionTestCase):
+    writers = 6
+    tasks = 20
+
+    def test_first_writes_of_new_connections_wait(self):
+        customer = create_user('customer', User.CUSTOMER)
+        errors = []
+
+        def write():
+            try:
+                # Each thread opens its own connection; its first write goes
+                # through the report index triggers.
+                for _ in range(self.tasks):
+                    Task.objects.create(customer=customer, report='done')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write) for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(Task.objects.count(), self.writers * self.tasks)
+
+
+class BulkTaskCreateTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(3)]
+        cls.employee = create_user('employee', User.EMPLOYEE, perms=['can_create_task'])
+        cls.plain_employee = create_user('plain_employee', User.EMPLOYEE)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def test_creates_all_items(self):
+        payload = [{'customer_id': customer.pk} for customer in self.customers * 2]
+        response = self.client_for(self.employee).post('/tasks/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['customer']['id'] for item in response.data], [item['customer_id'] for item in payload])
+        self.assertEqual(Task.objects.filter(status=Task.PENDING).count(), 6)
+
+    def test_customer_creates_own_tasks(self):
+        response = self.client_for(self.customers[0]).post('/tasks/', [{}, {}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(Task.objects.values_list('customer_id', flat=True)), {self.customers[0].pk})
+
+    def test_per_item_errors_create_nothing(self):
+        payload = [
+            {'customer_id': self.customers[0].pk},
+            {'customer_id': self.employee.pk},
+            {},
+            {'customer_id': self.customers[1].pk, 'employee_id': self.plain_employee.pk},
+            {'customer_id': 'x'},
+        ]
+        response = self.client_for(self.employee).post('/tasks/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('customer_id', response.data[1])
+        self.assertIn('non_field_errors', response.data[2])
+        self.assertIn('non_field_errors', response.data[3])
+        self.assertIn('customer_id', response.data[4])
+        self.assertFalse(Task.objects.exists())
+
+    def test_requires_permission(self):
+        payload = [{'customer_id': self.customers[0].pk}]
+        self.assertEqual(self.client_for(self.plain_employee).post('/tasks/', payload, format='json').status_code,
+                         403)
+
+    def test_batch_limits(self):
+        client = self.client_for(self.employee)
+        self.assertEqual(client.post('/tasks/', [], format='json').status_code, 400)
+        payload = [{'customer_id': self.customers[0].pk}] * (TaskViewSet.max_bulk_create + 1)
+        self.assertEqual(client.post('/tasks/', payload, format='json').status_code, 400)
+
+    def test_query_count_does_not_grow_per_item(self):
+        client = self.client_for(self.employee)
+        counts = []
+        for size in (10, 500):
+            payload = [{'customer_id': self.customers[i % 3].pk} for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(client.post('/tasks/', payload, format='json').status_code, 201)
+            counts.append(len(ctx))
+        # Only the INSERT is split, into chunks sized by the backend's parameter limit.
+        self.assertLess(counts[1], counts[0] + 10)
+
+
+FAST_PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class BulkRegisterTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = create_user('employee', User.EMPLOYEE, perms=['can_add_customer', 'can_add_employee'])
+        cls.existing = create_user('existing', User.CUSTOMER)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.employee.pk))
+
+    def user_data(self, i):
+        return {'username': f'new{i}', 'password': f'secret{i}', 'phone': f'+7000{i}', 'email': f'new{i}@example.com'}
+
+    def test_registers_customers(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/register/customer/', [self.user_data(i) for i in range(20)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(ctx), 10)
+        users = User.objects.filter(username__startswith='new').order_by('username')
+        self.assertEqual(users.count(), 20)
+        self.assertEqual(set(users.values_list('role', flat=True)), {User.CUSTOMER})
+        self.assertTrue(check_password('secret0', users[0].password))
+        self.assertNotIn('password', response.data[0])
+
+    def test_registers_employees(self):
+        response = self.client.post('/register/employee/', [self.user_data(0)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(username='new0').role, User.EMPLOYEE)
+        # Dispatch only considers employees with a stats row.
+        self.assertTrue(EmployeeTaskStats.objects.filter(employee__username='new0').exists())
+
+    def test_rejects_duplicates(self):
+        payload = [self.user_data(0), {**self.user_data(1), 'phone': self.existing.phone},
+                   {**self.user_data(2), 'username': 'new0'}, {**self.user_data(3), 'username': 'bad name!'}]
+        response = self.client.post('/register/customer/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(list(response.data[1]), ['phone'])
+        self.assertEqual(list(response.data[2]), ['username'])
+        self.assertEqual(list(response.data[3]), ['username'])
+        self.assertFalse(User.objects.filter(username__startswith='new').exists())
+
+    def test_single_registration_still_works(self):
+        response = self.client.post('/register/customer/', self.user_data(0), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(username='new0').role, User.CUSTOMER)
+
+    def test_thread_pool_only_for_batches(self):
+        with mock.patch('customeremployee.api.views.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as pool:
+            self.client.post('/register/customer/', self.user_data(0), format='json')
+            self.client.post('/register/customer/', [self.user_data(1)], format='json')
+            self.assertFalse(pool.called)
+            self.client.post('/register/customer/', [self.user_data(2), self.user_data(3)], format='json')
+            self.assertEqual(pool.call_count, 1)
+        self.assertEqual(User.objects.filter(username__startswith='new').count(), 4)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class ImportUsersCommandTest(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        create_user('existing', User.CUSTOMER)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_users', *args, '--workers=2', stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_imports_csv(self):
+        rows = ['username,password,phone,email,role']
+        rows += [f'user{i},secret{i},+7100{i},user{i}@example.com,' for i in range(25)]
+        rows += ['boss,secret,+7200,boss@example.com,employee', 'existing,secret,+7300,,', 'bad,secret,+7400,,admin']
+        stdout, stderr = self.run_import(self.write('users.csv', '\n'.join(rows)), '--batch-size=10')
+
+        self.assertEqual(User.objects.filter(username__startswith='user', role=User.CUSTOMER).count(), 25)
+        self.assertEqual(User.objects.get(username='boss').role, User.EMPLOYEE)
+        self.assertTrue(check_password('secret3', User.objects.get(username='user3').password))
+        self.assertIn('Row 27: {"username"', stderr)
+        self.assertIn('Row 28: {"role"', stderr)
+        self.assertIn('Imported 26 users, rejected 2.', stdout)
+
+    def test_reports_rows_rejected_on_revalidation(self):
+        rows = ['username,password,phone', 'taken,secret,+7600', 'rejected,secret,', 'kept,secret,+7601']
+        to_internal_value = RegisterListSerializer.to_internal_value
+        passes = []
+
+        def register_meanwhile(serializer, data):
+            # Someone registers "taken" between the first and second pass.
+            passes.append(len(data))
+            if len(passes) == 2:
+                create_user('taken', User.CUSTOMER)
+            return to_internal_value(serializer, data)
+
+        with mock.patch.object(RegisterListSerializer, 'to_internal_value', register_meanwhile):
+            stdout, stderr = self.run_import(self.write('users.csv', '\n'.join(rows)))
+
+        self.assertEqual(passes, [3, 2, 1])
+        self.assertIn('Row 1: {"username"', stderr)
+        self.assertIn('Row 2: {"phone"', stderr)
+        self.assertIn('Imported 1 users, rejected 2.', stdout)
+        self.assertTrue(User.objects.filter(username='kept').exists())
+
+    def test_rejects_rows_that_are_not_objects(self):
+        rows = ['["user0", "secret"]', '{"username": "user1", "password": "secret"}', '"user2"', '3',
+                '{"username": "user4", "password": "secret", "phone": "+7700", "role": "admin"}',
+                '{"username": "user5", "password": "secret", "phone": "+7701"}']
+        stdout, stderr = self.run_import(self.write('users.jsonl', '\n'.join(rows)), '--batch-size=5')
+
+        self.assertEqual([line.split(':')[0] for line in stderr.splitlines()],
+                         ['Row 1', 'Row 2', 'Row 3', 'Row 4', 'Row 5'])
+        self.assertIn('Row 1: {"non_field_errors": ["Invalid data. Expected a dictionary, but got list."]}', stderr)
+        self.assertIn('Row 4: {"non_field_errors": ["Invalid data. Expected a dictionary, but got int."]}', stderr)
+        self.assertIn('Imported 1 users, rejected 5.', stdout)
+        self.assertTrue(User.objects.filter(username='user5').exists())
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('users.jsonl', '\n'.join(
+            json.dumps({'username': f'user{i}', 'password': 'secret', 'phone': f'+7500{i}'}) for i in range(30)))
+        with open(f'{path}.checkpoint', 'w') as f:
+            f.write('20')
+        stdout, _ = self.run_import(path, '--resume', '--role=employee')
+
+        self.assertIn('Resuming after row 20', stdout)
+        self.assertEqual(sorted(User.employee.values_list('username', flat=True)),
+                         sorted(f'user{i}' for i in range(20, 30)))
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+class ConditionalGetTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER, perms=['can_view_employees'])
+        cls.other_customer = create_user('other_customer', User.CUSTOMER)
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        cls.tasks = Task.objects.bulk_create(Task(customer=cls.customer) for _ in range(5))
+        cls.other_task = Task.objects.create(customer=cls.other_customer)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def assertNotModified(self, client, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertLessEqual(len(ctx), 2)
+        return response
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, headers={'If-None-Match': etag})
+
+    def test_task_list(self):
+        client = self.client_for(self.customer)
+        response = client.get('/tasks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertNotModified(client, '/tasks/', if_none_match=response['ETag'])
+
+        Task.objects.filter(pk=self.tasks[0].pk).claim(self.employee)
+        self.assertEqual(client.get('/tasks/', headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_task_list_tracks_membership_and_pages(self):
+        client = self.client_for(self.employee)
+        etag = client.get('/tasks/')['ETag']
+        Task.objects.filter(pk=self.tasks[0].pk).claim(create_user('other_employee', User.EMPLOYEE))
+        self.assertEqual(client.get('/tasks/', headers={'If-None-Match': etag}).status_code, 200)
+        self.assertNotEqual(client.get('/tasks/?page_size=2')['ETag'], client.get('/tasks/')['ETag'])
+
+    def test_task_list_tracks_nested_users(self):
+        client = self.client_for(self.customer)
+        etag = client.get('/tasks/')['ETag']
+        customer = User.objects.get(pk=self.customer.pk)
+        customer.first_name = 'Renamed'
+        customer.save()
+        self.assertEqual(self.client_for(customer).get('/tasks/', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_task_detail(self):
+        client = self.client_for(self.employee)
+        url = f'/tasks/{self.tasks[0].pk}/'
+        response = client.get(url)
+        self.assertEqual(response['Last-Modified'], http_date(int(self.tasks[0].updated_at.timestamp())))
+        self.assertNotModified(client, url, if_none_match=response['ETag'])
+        self.assertNotModified(client, url, if_modified_since=response['Last-Modified'])
+
+        client.patch(f'/tasks/{self.tasks[0].pk}/assign/')
+        self.assertEqual(self.revalidate(client, url).status_code, 304)
+        self.assertEqual(client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_task_detail_checks_permissions_first(self):
+        url = f'/tasks/{self.other_task.pk}/'
+        etag = self.client_for(self.other_customer).get(url)['ETag']
+        response = self.client_for(self.customer).get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 403)
+
+    def test_current_user(self):
+        client = self.client_for(self.customer)
+        self.assertNotModified(client, '/me/', if_none_match=client.get('/me/')['ETag'])
+
+    def test_employee_list(self):
+        client = self.client_for(self.customer)
+        etag = client.get('/employees/')['ETag']
+        self.assertNotModified(client, '/employees/', if_none_match=etag)
+
+        employee = User.objects.get(pk=self.employee.pk)
+        employee.last_name = 'Renamed'
+        employee.save()
+        self.assertEqual(client.get('/employees/', headers={'If-None-Match': etag}).status_code, 200)
+
+
+class EmployeeDirectoryCacheTest(CacheIsolationMixin, TestCase):
+    """
+    Set BENCHMARK_EMPLOYEES=10000 to time cold and warm directory walks.
+    """
+    employee_count = int(os.environ.get('BENCHMARK_EMPLOYEES', 300))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER, perms=['can_view_employees'])
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_add_employee'])
+        User.objects.bulk_create(User(username=f'employee{i}', role=User.EMPLOYEE, phone=f'+{next(phone_numbers)}')
+                                 for i in range(cls.employee_count))
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+
+    def usernames(self):
+        return [item['username'] for item in self.client.get('/employees/').data['results']]
+
+    def assertCached(self):
+        self.client.get('/employees/')
+        with self.assertNumQueries(0):
+            self.client.get('/employees/')
+
+    def test_warm_pages_run_no_queries(self):
+        self.assertCached()
+        response = self.client.get('/employees/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get(response.data['next']).data['results'][0]['username'], 'employee1')
+
+    def test_employee_save_invalidates(self):
+        self.assertCached()
+        employee = User.objects.get(username='manager')
+        employee.username = 'renamed'
+        employee.save()
+        self.assertEqual(self.usernames()[0], 'renamed')
+
+    def test_role_change_and_delete_invalidate(self):
+        self.usernames()
+        User.objects.get(username='manager').delete()
+        employee = User.objects.get(username='employee0')
+        employee.role = User.CUSTOMER
+        employee.save()
+        self.assertEqual(self.usernames()[:2], ['employee1', 'employee2'])
+
+    def test_registration_invalidates(self):
+        manager = APIClient()
+        manager.force_authenticate(User.objects.get(pk=self.manager.pk))
+        with override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS):
+            manager.post('/register/employee/', {'username': 'single', 'password': 'secret', 'phone': '+71'})
+            self.usernames()
+            manager.post('/register/employee/', [{'username': 'bulk', 'password': 'secret', 'phone': '+72'}],
+                         format='json')
+        usernames = []
+        url = '/employees/?page_size=500'
+        while url:
+            response = self.client.get(url)
+            usernames += [item['username'] for item in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(usernames[-2:], ['single', 'bulk'])
+
+    def test_unrelated_saves_keep_cache(self):
+        self.client.get('/employees/')
+        create_user('new_customer', User.CUSTOMER)
+        employee = User.objects.get(username='employee0')
+        employee.last_login = timezone.now()
+        employee.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.client.get('/employees/')
+
+    def test_customer_saves_keep_cache(self):
+        self.client.get('/employees/')
+        customer = User.objects.get(pk=self.customer.pk)
+        customer.first_name = 'Renamed'
+        customer.save()
+        with self.assertNumQueries(0):
+            self.client.get('/employees/')
+
+    def test_other_params_share_pages(self):
+        self.client.get('/employees/?page_size=2&utm=a')
+        with self.assertNumQueries(0):
+            response = self.client.get('/employees/?utm=b&page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(len(self.client.get('/employees/?page_size=3').data['results']), 3)
+
+    def test_warm_walk_runs_no_queries(self):
+        def walk():
+            url = '/employees/?page_size=500'
+            while url:
+                url = self.client.get(url).data['next']
+
+        with CaptureQueriesContext(connection) as cold:
+            walk()
+        self.assertTrue(cold)
+        with self.assertNumQueries(0):
+            walk()
+
+    @skipUnless('BENCHMARK_EMPLOYEES' in os.environ, 'set BENCHMARK_EMPLOYEES to time the directory')
+    def test_cold_and_warm_latency(self):
+        def walk():
+            started = time.perf_counter()
+            url = '/employees/?page_size=500'
+            while url:
+                url = self.client.get(url).data['next']
+            return time.perf_counter() - started
+
+        cold = walk()
+        warm = walk()
+        print(f'\n{self.employee_count} employees: cold {cold * 1000:.1f} ms, warm {warm * 1000:.1f} ms')
+        self.assertLess(warm, cold)
+
+
+class AsyncReadViewsTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER, perms=['can_view_employees'])
+        cls.other_customer = create_user('other_customer', User.CUSTOMER)
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        cls.tasks = Task.objects.bulk_create(Task(customer=cls.customer) for _ in range(7))
+        cls.other_task = Task.objects.create(customer=cls.other_customer)
+
+    def call(self, view, url, user, method='get', data=None, **headers):
+        request = getattr(APIRequestFactory(), method)(url, data, format='json', headers=headers)
+        force_authenticate(request, user)
+        response = async_to_sync(view)(request, **resolve(urlsplit(url).path).kwargs)
+        return response.render() if hasattr(response, 'render') else response
+
+    def sync_get(self, url, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client.get(url)
+
+    def test_views_are_async(self):
+        for view in (AsyncTaskViewSet.as_view({'get': 'list'}), AsyncEmployeeListView.as_view(),
+                     AsyncCurrentUserView.as_view()):
+            self.assertTrue(iscoroutinefunction(view))
+
+    def test_task_list_matches_sync(self):
+        view = AsyncTaskViewSet.as_view({'get': 'list', 'post': 'create'})
+        url = '/tasks/?page_size=3'
+        response = self.call(view, url, self.customer)
+        expected = self.sync_get(url, self.customer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, expected.data)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+        next_page = self.call(view, response.data['next'], self.customer)
+        self.assertEqual([item['id'] for item in next_page.data['results']], [task.pk for task in self.tasks[3:6]])
+        self.assertEqual(self.call(view, url, self.customer, if_none_match=response['ETag']).status_code, 304)
+
+    def test_task_detail(self):
+        view = AsyncTaskViewSet.as_view({'get': 'retrieve'})
+        url = f'/tasks/{self.tasks[0].pk}/'
+        response = self.call(view, url, self.employee)
+        self.assertEqual(response.data, self.sync_get(url, self.employee).data)
+        self.assertEqual(self.call(view, url, self.employee, if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.call(view, f'/tasks/{self.other_task.pk}/', self.customer).status_code, 403)
+        self.assertEqual(self.call(view, '/tasks/999999/', self.customer).status_code, 404)
+
+    def test_writes_run_sync(self):
+        view = AsyncTaskViewSet.as_view({'get': 'list', 'post': 'create'})
+        response = self.call(view, '/tasks/', self.customer, method='post', data={})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['customer']['id'], self.customer.pk)
+
+    def test_export_streams_asynchronously(self):
+        view = AsyncTaskViewSet.as_view({'get': 'export'}, **AsyncTaskViewSet.export.kwargs)
+        response = self.call(view, '/tasks/export/?format=csv', self.customer)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return ''.join([chunk.decode() async for chunk in response.streaming_content])
+        rows = list(csv.reader(io.StringIO(async_to_sync(read)())))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [task.pk for task in self.tasks])
+
+    def test_employee_list_and_current_user(self):
+        response = self.call(AsyncEmployeeListView.as_view(), '/employees/', self.customer)
+        self.assertEqual(response.data, self.sync_get('/employees/', self.customer).data)
+        with self.assertNumQueries(0):
+            self.call(AsyncEmployeeListView.as_view(), '/employees/', self.customer)
+
+        response = self.call(AsyncCurrentUserView.as_view(), '/me/', self.customer)
+        self.assertEqual(response.data['username'], 'customer')
+        self.assertEqual(self.call(AsyncCurrentUserView.as_view(), '/me/', self.employee).data['role'], User.EMPLOYEE)
+
+
+class TaskExportTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER)
+        cls.other_customer = create_user('other_customer', User.CUSTOMER)
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        cls.tasks = Task.objects.bulk_create(Task(customer=cls.customer) for _ in range(3))
+        Task.objects.filter(pk=cls.tasks[0].pk).claim(cls.employee)
+        Task.objects.create(customer=cls.other_customer, employee=create_user('other', User.EMPLOYEE),
+                            status=Task.IN_PROGRESS)
+
+    def export(self, user, url='/tasks/export/', **headers):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        response = client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, content = self.export(self.customer)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [task.pk for task in self.tasks])
+        task = TaskSerializer(Task.objects.get(pk=self.tasks[0].pk)).data
+        self.assertEqual(rows[0], {
+            'id': task['id'], 'status': Task.IN_PROGRESS, 'customer_id': self.customer.pk,
+            'customer_username': 'customer', 'employee_id': self.employee.pk, 'employee_username': 'employee',
+            'created_at': task['created_at'], 'updated_at': task['updated_at'], 'closed_at': None,
+            'report': task['report'],
+        })
+
+    def test_csv(self):
+        for url, headers in (('/tasks/export/?format=csv', {}), ('/tasks/export/', {'accept': 'text/csv'})):
+            with self.subTest(url=url):
+                response, content = self.export(self.customer, url, **headers)
+                self.assertEqual(response['Content-Disposition'], 'attachment; filename="tasks.csv"')
+                rows = list(csv.reader(io.StringIO(content)))
+                self.assertEqual(rows[0][:4], ['id', 'status', 'customer_id', 'customer_username'])
+                self.assertEqual([int(row[0]) for row in rows[1:]], [task.pk for task in self.tasks])
+
+    def test_role_scoping(self):
+        self.assertEqual(len(self.export(self.employee)[1].splitlines()), 3)
+        self.assertEqual(len(self.export(self.manager)[1].splitlines()), 4)
+        self.assertEqual(APIClient().get('/tasks/export/').status_code, 401)
+
+    def test_memory_stays_flat(self):
+        """
+        Set BENCHMARK_EXPORT_TASKS=5000000 to print the peak at scale.
+        """
+        large = int(os.environ.get('BENCHMARK_EXPORT_TASKS', 20000))
+        peaks = {}
+        for count in (1000, large):
+            Task.objects.bulk_create((Task(customer=self.customer) for _ in range(count - Task.objects.count())),
+                                     batch_size=5000)
+            client = APIClient()
+            client.force_authenticate(User.objects.get(pk=self.manager.pk))
+            response = client.get('/tasks/export/')
+            tracemalloc.start()
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            peaks[count] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.assertGreater(size, count * 100)
+        if 'BENCHMARK_EXPORT_TASKS' in os.environ:
+            print(f'\nexport peak memory: {peaks}')
+        self.assertLess(peaks[large], peaks[1000] * 2)
+
+
+class TaskStatsTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_superuser=True)
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks', 'can_create_task'])
+        cls.customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(3)]
+        cls.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(3)]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def snapshot(self):
+        def rows(model):
+            return sorted(tuple(round(value, 3) if isinstance(value, float) else value for value in row)
+                          for row in model.objects.values_list())
+        return {model.__name__: rows(model) for model in (CustomerTaskStats, EmployeeTaskStats, DailyTaskStats)}
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild_task_stats()
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def test_api_and_admin_changes_match_rebuild(self):
+        manager = self.client_for(self.manager)
+        manager.post('/tasks/', {'customer_id': self.customers[0].pk})
+        manager.post('/tasks/', [{'customer_id': customer.pk} for customer in self.customers * 3], format='json')
+        self.client_for(self.customers[1]).post('/tasks/', {})
+        # Writes that bypass the ORM are followed by a rebuild.
+        Task.objects.filter(pk__in=Task.objects.order_by('pk').values('pk')[:4]).update(
+            created_at=timezone.now() - timedelta(days=2))
+        rebuild_task_stats()
+
+        for i, task in enumerate(Task.objects.order_by('pk')[:6]):
+            employee = self.client_for(self.employees[i % 3])
+            self.assertEqual(employee.patch(f'/tasks/{task.pk}/assign/').status_code, 200)
+            if i % 2:
+                employee.patch(f'/tasks/{task.pk}/complete/', {'report': 'done'})
+        self.assertEqual(self.client_for(self.employees[0]).post('/tasks/claim/').status_code, 200)
+
+        admin = Client()
+        admin.force_login(User.objects.get(pk=self.admin.pk))
+        task = Task.objects.filter(status=Task.IN_PROGRESS).first()
+        response = admin.post(f'/admin/api/task/{task.pk}/change/', {
+            'customer': self.customers[2].pk, 'employee': self.employees[2].pk, 'status': Task.COMPLETED,
+            'report': 'done by admin'})
+        self.assertEqual(response.status_code, 302)
+        response = admin.post(f'/admin/api/task/{Task.objects.last().pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+
+        self.assertMatchesRebuild()
+        totals = CustomerTaskStats.objects.aggregate(pending=Sum('pending'), in_progress=Sum('in_progress'),
+                                                     completed=Sum('completed'))
+        self.assertEqual(totals, {status: Task.objects.filter(status=status).count()
+                                  for status in ('pending', 'in_progress', 'completed')})
+
+    def test_random_workload_matches_rebuild(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            operation = rng.random()
+            if operation < 0.3:
+                Task.objects.bulk_create(Task(customer=rng.choice(self.customers)) for _ in range(rng.randint(1, 5)))
+            elif operation < 0.6:
+                Task.objects.filter(pk=Task.objects.pending().values('pk')[:1]).claim(rng.choice(self.employees))
+            elif operation < 0.85:
+                task = Task.objects.filter(status=Task.IN_PROGRESS).order_by('?').first()
+                if task:
+                    task.status, task.closed_at = Task.COMPLETED, timezone.now() + timedelta(hours=rng.randint(0, 50))
+                    task.save(update_fields=['status', 'closed_at', 'updated_at'])
+            elif operation < 0.95:
+                task = Task.objects.order_by('?').first()
+                if task:
+                    task.employee = rng.choice(self.employees + [None])
+                    task.status = rng.choice([Task.PENDING, Task.IN_PROGRESS, Task.COMPLETED])
+                    task.save()
+            else:
+                Task.objects.filter(pk__in=Task.objects.order_by('?').values('pk')[:2]).delete()
+        self.assertMatchesRebuild()
+
+    def test_endpoint(self):
+        now = timezone.now()
+        for i, customer in enumerate(self.customers):
+            Task.objects.bulk_create(Task(customer=customer) for _ in range(i + 1))
+        for task, hours in zip(Task.objects.order_by('pk')[:2], (2, 4)):
+            Task.objects.filter(pk=task.pk).claim(self.employees[0])
+            task.refresh_from_db()
+            task.status, task.closed_at = Task.COMPLETED, task.created_at + timedelta(hours=hours)
+            task.save()
+        Task.objects.filter(pk=Task.objects.order_by('pk').values('pk')[2:3]).claim(self.employees[1])
+
+        # User, two permission queries, totals, employees, customers, days.
+        with self.assertNumQueries(7):
+            response = self.client_for(self.manager).get('/tasks/stats/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status_counts'], {'pending': 3, 'in_progress': 1, 'completed': 2})
+        self.assertEqual(response.data['mean_completion_seconds'], 3 * 3600)
+        self.assertEqual([(row['username'], row['completed'], row['mean_completion_seconds'])
+                          for row in response.data['employees']],
+                         [('employee0', 2, 3 * 3600), ('manager', 0, None)])
+        self.assertEqual([row['username'] for row in response.data['customers']], ['customer2', 'customer1'])
+        self.assertEqual(response.data['daily'][-1]['created'], 6)
+        self.assertEqual(str(response.data['daily'][-1]['date']), str(timezone.localdate(now)))
+
+        self.assertEqual(self.client_for(self.customers[0]).get('/tasks/stats/').status_code, 403)
+        self.assertEqual(self.client_for(self.employees[0]).get('/tasks/stats/').status_code, 403)
+        self.assertEqual(self.client_for(self.manager).get('/tasks/stats/?days=0').status_code, 400)
+
+    def test_rebuild_command(self):
+        Task.objects.bulk_create(Task(customer=customer) for customer in self.customers)
+        expected = self.snapshot()
+        CustomerTaskStats.objects.update(pending=100)
+        DailyTaskStats.objects.all().delete()
+        stdout = io.StringIO()
+        call_command('rebuild_task_stats', stdout=stdout)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertIn('3 customers, 4 employees and 1 days', stdout.getvalue())
+
+
+class TaskFilterTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        cls.customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(2)]
+        cls.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(2)]
+        now = timezone.now()
+        cls.tasks = Task.objects.bulk_create([
+            Task(customer=cls.customers[0]),
+            Task(customer=cls.customers[1], employee=cls.employees[0], status=Task.IN_PROGRESS),
+            Task(customer=cls.customers[0], employee=cls.employees[0], status=Task.COMPLETED,
+                 closed_at=now - timedelta(days=3), report='Replaced the printer cable'),
+            Task(customer=cls.customers[1], employee=cls.employees[1], status=Task.COMPLETED,
+                 closed_at=now - timedelta(hours=1), report='Printer driver updated; заменён картридж'),
+        ])
+        Task.objects.filter(pk=cls.tasks[0].pk).update(created_at=now - timedelta(days=10))
+
+    def ids(self, query, user=None):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=(user or self.manager).pk))
+        response = client.get(f'/tasks/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(task['id'] for task in response.data['results'])
+
+    def pks(self, *indexes):
+        return sorted(self.tasks[i].pk for i in indexes)
+
+    @skipUnless(connection.vendor == 'sqlite', 'The report index is SQLite specific')
+    def test_report_index_triggers_exist(self):
+        # Dropped without an error if a later migration makes SQLite rebuild api_task.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_task'")
+            self.assertEqual(sorted(name for name, in cursor.fetchall()), sorted(FTS_TRIGGERS))
+
+    def test_filters(self):
+        day_ago = urlencode({'created_after': timezone.now() - timedelta(days=1)})
+        for query, expected in [
+            ('', self.pks(0, 1, 2, 3)),
+            ('status=completed', self.pks(2, 3)),
+            ('status=pending&status=in_progress', self.pks(0, 1)),
+            (f'customer={self.customers[0].pk}', self.pks(0, 2)),
+            (f'employee={self.employees[0].pk}', self.pks(1, 2)),
+            (f'employee={self.employees[0].pk}&status=completed', self.pks(2)),
+            (day_ago, self.pks(1, 2, 3)),
+            (urlencode({'created_before': timezone.now() - timedelta(days=1)}), self.pks(0)),
+            (urlencode({'closed_after': timezone.now() - timedelta(days=1)}), self.pks(3)),
+            (urlencode({'closed_before': timezone.now() - timedelta(days=1)}), self.pks(2)),
+            (f'{day_ago}&customer={self.customers[0].pk}', self.pks(2)),
+        ]:
+            with self.subTest(query):
+                self.assertEqual(self.ids(query), expected)
+
+    def test_detail_routes_ignore_filters(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.employees[0].pk))
+        pending, in_progress = self.pks(0, 1)
+        self.assertEqual(client.get(f'/tasks/{pending}/?status=completed&search=printer').status_code, 200)
+        self.assertEqual(client.get(f'/tasks/{pending}/?employee=x').status_code, 200)
+        self.assertEqual(client.patch(f'/tasks/{pending}/assign/?status=completed').status_code, 200)
+        self.assertEqual(client.patch(f'/tasks/{in_progress}/complete/?status=pending', {'report': 'done'}).status_code,
+                         200)
+
+    def test_filters_stay_within_scope(self):
+        self.assertEqual(self.ids(f'customer={self.customers[1].pk}', self.customers[0]), [])
+        self.assertEqual(self.ids('status=completed', self.customers[0]), self.pks(2))
+        self.assertEqual(self.ids('search=printer', self.customers[1]), self.pks(3))
+
+    def test_search(self):
+        for query, expected in [
+            ('printer', self.pks(2, 3)),
+            ('PRINTER cable', self.pks(2)),
+            ('картридж', self.pks(3)),
+            ('cable "OR" driver', []),
+            ('printer*', self.pks(2, 3)),
+            ('scanner', []),
+            ('***', []),
+        ]:
+            with self.subTest(query):
+                self.assertEqual(self.ids(urlencode({'search': query})), expected)
+
+    def test_search_follows_writes(self):
+        task = Task.objects.get(pk=self.tasks[2].pk)
+        task.report = 'Router rebooted'
+        task.save()
+        self.assertEqual(self.ids('search=printer'), self.pks(3))
+        self.assertEqual(self.ids('search=router'), self.pks(2))
+        Task.objects.filter(pk=self.tasks[3].pk).update(report='Scanner jam')
+        self.assertEqual(self.ids('search=scanner'), self.pks(3))
+        Task.objects.filter(pk=self.tasks[3].pk).delete()
+        self.assertEqual(self.ids('search=scanner'), [])
+        created = Task.objects.create(customer=self.customers[0], report='Scanner again')
+        self.assertEqual(self.ids('search=scanner'), [created.pk])
+
+    def test_search_fallback(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertEqual(sorted(search_reports(Task.objects.all(), 'PRINTER cable').values_list('pk', flat=True)),
+                             self.pks(2))
+            self.assertEqual(list(search_reports(Task.objects.all(), '***')), [])
+
+    def test_invalid_parameters(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        for query in ('status=done', 'customer=x', 'created_after=yesterday', 'search=' + 'x' * 201):
+            with self.subTest(query):
+                self.assertEqual(client.get(f'/tasks/?{query}').status_code, 400)
+
+    def test_pages_and_export_keep_filters(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        response = client.get('/tasks/?status=completed&page_size=1')
+        self.assertIn('status=completed', response.data['next'])
+        self.assertEqual([task['id'] for task in client.get(response.data['next']).data['results']], self.pks(3))
+
+        response = client.get('/tasks/export/?search=printer&customer=%d' % self.customers[1].pk)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.pks(3))
+
+
+class TaskReadSerializerTest(CacheIsolationMixin, TestCase):
+    """
+    Set BENCHMARK_SERIALIZER_TASKS=10000 to time the per-row cost of both
+    serializers.
+    """
+    task_count = int(os.environ.get('BENCHMARK_SERIALIZER_TASKS', 300))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        customer = create_user('customer', User.CUSTOMER)
+        User.objects.filter(pk=customer.pk).update(first_name='Анна', email='anna@example.com')
+        employee = create_user('employee', User.EMPLOYEE)
+        now = timezone.now()
+        Task.objects.bulk_create(
+            Task(customer=customer, employee=None if i % 3 == 0 else employee,
+                 status=[Task.PENDING, Task.IN_PROGRESS, Task.COMPLETED][i % 3],
+                 closed_at=now.replace(microsecond=0) if i % 3 == 2 else None,
+                 report='Заменён "картридж"\n' * (i % 2))
+            for i in range(cls.task_count))
+
+    def tasks(self):
+        return list(Task.objects.select_related('customer', 'employee').order_by('id'))
+
+    def assertSameJSON(self, tasks, many=True):
+        expected = JSONRenderer().render(TaskSerializer(tasks, many=many).data)
+        self.assertEqual(JSONRenderer().render(TaskReadSerializer(tasks, many=many).data), expected)
+
+    def test_matches_task_serializer(self):
+        tasks = self.tasks()
+        self.assertSameJSON(tasks)
+        self.assertSameJSON(tasks[0], many=False)
+        with override_settings(TIME_ZONE='Asia/Yekaterinburg'):
+            self.assertSameJSON(tasks[:10])
+
+    def test_api_responses(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        response = client.get('/tasks/?page_size=20')
+        tasks = self.tasks()[:20]
+        self.assertEqual(json.loads(response.content)['results'],
+                         json.loads(JSONRenderer().render(TaskSerializer(tasks, many=True).data)))
+        response = client.get(f'/tasks/{tasks[2].pk}/')
+        self.assertEqual(response.content, JSONRenderer().render(TaskSerializer(tasks[2]).data))
+
+    def test_rows_reuse_the_compiled_plan(self):
+        tasks = self.tasks()
+        TaskReadSerializer(tasks[:1], many=True).data
+        # Neither the serializer nor its nested user serializers are bound again.
+        with mock.patch.object(TaskSerializer, '__init__', side_effect=AssertionError('serializer bound')), \
+                mock.patch.object(TaskReadSerializer, 'compile', side_effect=AssertionError('plan recompiled')):
+            data = TaskReadSerializer(tasks, many=True).data
+        self.assertEqual(len(data), self.task_count)
+
+    @skipUnless('BENCHMARK_SERIALIZER_TASKS' in os.environ, 'set BENCHMARK_SERIALIZER_TASKS to time serializers')
+    def test_faster_per_row(self):
+        tasks = self.tasks()
+
+        def per_row(serializer_class):
+            started = time.perf_counter()
+            serializer_class(tasks, many=True).data
+            return (time.perf_counter() - started) / len(tasks)
+
+        per_row(TaskReadSerializer)
+        slow, fast = per_row(TaskSerializer), per_row(TaskReadSerializer)
+        print(f'\n{len(tasks)} tasks: TaskSerializer {slow * 1e6:.1f} us/row, '
+              f'TaskReadSerializer {fast * 1e6:.1f} us/row ({slow / fast:.1f}x)')
+        self.assertLess(fast, slow)
+
+
+class SparseFieldsTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        cls.customer = create_user('customer', User.CUSTOMER, perms=['can_view_employees'])
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        Task.objects.bulk_create([
+            Task(customer=cls.customer, report='Long report text ' * 20),
+            Task(customer=cls.customer, employee=cls.employee, status=Task.IN_PROGRESS),
+        ])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, [query['sql'] for query in ctx.captured_queries if 'api_task' in query['sql']]
+
+    def test_fields_narrow_payload_and_sql(self):
+        full, _ = self.get('/tasks/')
+        response, queries = self.get('/tasks/?fields=id,status,employee.id')
+        self.assertEqual(response.data['results'], [
+            {'id': Task.objects.first().pk, 'status': Task.PENDING, 'employee': None},
+            {'id': Task.objects.last().pk, 'status': Task.IN_PROGRESS, 'employee': {'id': self.employee.pk}},
+        ])
+        self.assertLess(len(response.content) * 5, len(full.content))
+        self.assertEqual(len(queries), 2)
+        for sql in queries:
+            self.assertNotIn('JOIN', sql)
+            self.assertNotIn('"report"', sql)
+        select = queries[-1].split(' FROM ')[0]
+        self.assertEqual(select.count(','), 3, select)
+
+    def test_expand(self):
+        response, queries = self.get('/tasks/?expand=customer')
+        task = response.data['results'][1]
+        self.assertEqual(task['employee'], self.employee.pk)
+        self.assertEqual(task['customer']['username'], 'customer')
+        self.assertEqual(task['report'], '')
+        self.assertIn('INNER JOIN "api_user"', queries[-1])
+        self.assertNotIn('LEFT OUTER JOIN', queries[-1])
+
+        response, queries = self.get('/tasks/?expand=')
+        self.assertEqual((response.data['results'][1]['customer'], response.data['results'][1]['employee']),
+                         (self.customer.pk, self.employee.pk))
+        self.assertTrue(all('JOIN' not in sql for sql in queries))
+
+        response, queries = self.get('/tasks/?fields=id,customer.username')
+        self.assertEqual(response.data['results'][0], {'id': Task.objects.first().pk,
+                                                       'customer': {'username': 'customer'}})
+        self.assertNotIn('"email"', queries[-1])
+
+    def test_read_serializers_agree(self):
+        tasks = list(Task.objects.select_related('customer', 'employee'))
+        for query in ('fields=id,status,employee.id', 'expand=employee', 'fields=customer,employee&expand=',
+                      'fields=created_at,customer.phone,employee.username'):
+            with self.subTest(query):
+                context = {'field_selection': TaskSerializer.parse_field_selection(QueryDict(query))}
+                self.assertEqual(JSONRenderer().render(TaskReadSerializer(tasks, many=True, context=context).data),
+                                 JSONRenderer().render(TaskSerializer(tasks, many=True, context=context).data))
+
+    def test_invalid_selection(self):
+        for query in ('fields=id,secret', 'fields=status.id', 'fields=customer.password', 'expand=report'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/tasks/?{query}').status_code, 400)
+
+    def test_task_detail_and_users(self):
+        task = Task.objects.last()
+        response = self.client.get(f'/tasks/{task.pk}/?fields=id,employee.username')
+        self.assertEqual(response.data, {'id': task.pk, 'employee': {'username': 'employee'}})
+        self.assertNotEqual(response['ETag'], self.client.get(f'/tasks/{task.pk}/')['ETag'])
+
+        response = self.client.get('/me/?fields=id,username')
+        self.assertEqual(response.data, {'id': self.manager.pk, 'username': 'manager'})
+        self.assertNotEqual(response['ETag'], self.client.get('/me/')['ETag'])
+
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        response, _ = self.get('/employees/?fields=username')
+        self.assertEqual(response.data['results'], [{'username': 'manager'}, {'username': 'employee'}])
+        self.assertEqual(len(self.client.get('/employees/').data['results'][0]), 7)
+
+
+def parse_events(text):
+    events = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@mock.patch.object(TaskViewSet, 'events_stream_seconds', 0)
+@mock.patch.object(TaskViewSet, 'events_long_poll_seconds', 0)
+class TaskEventsTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_superuser=True)
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks', 'can_create_task'])
+        cls.customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(2)]
+        cls.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(2)]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def stream(self, user, last_event_id=0, **headers):
+        if last_event_id is not None:
+            headers['Last-Event-ID'] = str(last_event_id)
+        response = self.client_for(user).get('/tasks/events/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        return parse_events(b''.join(response.streaming_content).decode())
+
+    def kinds(self, user, last_event_id=0):
+        return [(kind, data['task']) for _, kind, data in self.stream(user, last_event_id)]
+
+    def test_api_and_admin_changes(self):
+        first = self.client_for(self.customers[0]).post('/tasks/', {}).data['id']
+        second = self.client_for(self.manager).post('/tasks/', {'customer_id': self.customers[1].pk}).data['id']
+        self.client_for(self.employees[0]).patch(f'/tasks/{first}/assign/')
+        self.client_for(self.employees[1]).post('/tasks/claim/')
+        self.client_for(self.employees[0]).patch(f'/tasks/{first}/complete/', {'report': 'done'})
+        admin = Client()
+        admin.force_login(User.objects.get(pk=self.admin.pk))
+        admin.post(f'/admin/api/task/{second}/change/', {
+            'customer': self.customers[1].pk, 'employee': '', 'status': Task.PENDING, 'report': ''})
+        Task.objects.filter(pk=second).delete()
+
+        self.assertEqual(self.kinds(self.manager), [
+            ('created', first), ('created', second), ('assigned', first), ('assigned', second),
+            ('completed', first), ('updated', second), ('deleted', second)])
+        self.assertEqual(self.kinds(self.customers[0]), [('created', first), ('assigned', first),
+                                                         ('completed', first)])
+        # Employees see unassigned tasks and their own, including a task
+        # leaving them, but not other employees' claims.
+        self.assertEqual(self.kinds(self.employees[0]), [
+            ('created', first), ('created', second), ('assigned', first), ('completed', first), ('deleted', second)])
+        self.assertEqual(self.kinds(self.employees[1]), [
+            ('created', first), ('created', second), ('assigned', second), ('updated', second), ('deleted', second)])
+
+        events = self.stream(self.manager)
+        _, kind, data = events[3]
+        self.assertEqual(data['status'], Task.IN_PROGRESS)
+        self.assertEqual(data['employee'], self.employees[1].pk)
+        self.assertEqual(events[5][2]['status'], Task.PENDING)
+        self.assertEqual([event[0] for event in self.stream(self.manager, events[4][0])],
+                         [event[0] for event in events[5:]])
+
+    def test_employees_do_not_see_other_claims(self):
+        task = Task.objects.create(customer=self.customers[0])
+        self.client_for(self.employees[0]).patch(f'/tasks/{task.pk}/assign/')
+        self.assertEqual(self.kinds(self.employees[0]), [('created', task.pk), ('assigned', task.pk)])
+        self.assertEqual(self.kinds(self.employees[1]), [('created', task.pk)])
+        self.assertFalse(TaskEvent.objects.visible_to(self.employees[1]).filter(employee_id=self.employees[0].pk))
+
+    def test_new_stream_starts_at_latest(self):
+        Task.objects.create(customer=self.customers[0])
+        response = self.client_for(self.manager).get('/tasks/events/')
+        text = b''.join(response.streaming_content).decode()
+        self.assertEqual(parse_events(text), [])
+        self.assertTrue(text.startswith('retry: '))
+        self.assertEqual(self.client_for(self.manager).get('/tasks/events/?last_event_id=x').status_code, 400)
+
+    def test_reset_after_pruning(self):
+        Task.objects.bulk_create(Task(customer=self.customers[0]) for _ in range(3))
+        events = self.stream(self.customers[0])
+        TaskEvent.objects.filter(pk__lte=events[1][0]).update(created_at=timezone.now() - timedelta(days=8))
+        call_command('prune_task_events', days=7, stdout=io.StringIO())
+        self.assertEqual(TaskEvent.objects.count(), 1)
+        resumed = self.stream(self.customers[0], events[0][0])
+        self.assertEqual(resumed[0], (events[1][0], 'reset', {}))
+        self.assertEqual(resumed[1:], events[2:])
+        self.assertEqual(self.stream(self.customers[0], events[1][0]), events[2:])
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get('/tasks/events/').status_code, 401)
+
+    def test_streams_hold_back_unnumbered_events(self):
+        first, second = (Task.objects.create(customer=self.customers[0]) for _ in range(2))
+        first_event, second_event = TaskEvent.objects.filter(task_id__in=[first.pk, second.pk]).order_by('id')
+        # The second transaction committed first and was numbered; the first is still in flight.
+        TaskEvent.objects.filter(pk=second_event.pk).update(position=1)
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertEqual([(event.pk, event.stream_id) for event in TaskEvent.objects.streamed()],
+                             [(second_event.pk, 1)])
+            TaskEvent.objects.filter(pk=first_event.pk).update(position=2)
+            self.assertEqual(list(TaskEvent.objects.streamed().filter(stream_id__gt=1).values_list('pk', flat=True)),
+                             [first_event.pk])
+
+    def test_async_stream(self):
+        Task.objects.create(customer=self.customers[0])
+        request = APIRequestFactory().get('/tasks/events/', headers={'Last-Event-ID': '0'})
+        force_authenticate(request, User.objects.get(pk=self.customers[0].pk))
+        response = async_to_sync(AsyncTaskViewSet.as_view({'get': 'events'}, **AsyncTaskViewSet.events.kwargs))(
+            request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertEqual([kind for _, kind, _ in parse_events(async_to_sync(read)())], ['created'])
+
+
+class TaskEventBusTest(CacheIsolationMixin, TransactionTestCase):
+    def test_commits_wake_waiting_streams(self):
+        customer = create_user('customer', User.CUSTOMER)
+        client = APIClient()
+        client.force_authenticate(customer)
+
+        def create_later():
+            time.sleep(0.3)
+            try:
+                Task.objects.create(customer=customer)
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(TaskViewSet, 'events_long_poll_seconds', 30):
+            response = client.get('/tasks/events/')
+            chunks = iter(response.streaming_content)
+            next(chunks)
+            threading.Thread(target=create_later).start()
+            started = time.monotonic()
+            event = next(chunks).decode()
+            elapsed = time.monotonic() - started
+            # A sync stream is a long poll, over once it has sent events.
+            rest = list(chunks)
+            response.close()
+        self.assertIn('event: created', event)
+        self.assertEqual(rest, [])
+        self.assertLess(elapsed, 5)
+
+    def test_sync_long_poll_ends_without_events(self):
+        client = APIClient()
+        client.force_authenticate(create_user('customer', User.CUSTOMER))
+        with mock.patch.object(TaskViewSet, 'events_long_poll_seconds', 0.2):
+            started = time.monotonic()
+            response = client.get('/tasks/events/')
+            text = b''.join(response.streaming_content).decode()
+        self.assertTrue(text.startswith('retry: '))
+        self.assertEqual(parse_events(text), [])
+        self.assertLess(time.monotonic() - started, TaskViewSet.events_long_poll_seconds)
+
+    def test_async_waiters(self):
+        bus = TaskEventBus()
+
+        async def wait():
+            version = bus.version
+            threading.Timer(0.1, bus.publish).start()
+            return await bus.await_change(version, 5), await bus.await_change(bus.version, 0.05)
+        self.assertEqual(async_to_sync(wait)(), (True, False))
+        self.assertEqual(bus.waiters, set())
+
+
+class TaskArchiveTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        cls.customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(2)]
+        cls.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(2)]
+        now = timezone.now()
+        # Old completed tasks interleave with live ones in creation order.
+        cls.tasks = Task.objects.bulk_create(
+            Task(customer=cls.customers[i % 2], employee=cls.employees[i % 2], status=Task.IN_PROGRESS)
+            for i in range(8))
+        for i, task in enumerate(cls.tasks):
+            Task.objects.filter(pk=task.pk).update(created_at=now - timedelta(days=100 - i))
+        cls.old = cls.tasks[::2]
+        for i, task in enumerate(cls.old):
+            Task.objects.filter(pk=task.pk).update(status=Task.COMPLETED, closed_at=now - timedelta(days=40 - i),
+                                                   report=f'printer fixed {i}')
+        Task.objects.filter(pk=cls.tasks[1].pk).update(status=Task.COMPLETED, closed_at=now - timedelta(days=1),
+                                                       report='printer fixed recently')
+        rebuild_task_stats()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def archive(self, **options):
+        stdout = io.StringIO()
+        call_command('archive_tasks', older_than=30, batch_size=3, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_moves_old_completed_tasks(self):
+        stats = self.client_for(self.manager).get('/tasks/stats/').data
+        events = TaskEvent.objects.count()
+        self.assertEqual(self.archive(), 'Archived 4 tasks.\n')
+        self.assertEqual(self.archive(), 'Archived 0 tasks.\n')
+
+        old_ids = [task.pk for task in self.old]
+        self.assertFalse(Task.objects.filter(pk__in=old_ids).exists())
+        self.assertEqual(Task.objects.count(), 4)
+        archived = ArchivedTask.objects.get(pk=self.old[1].pk)
+        self.assertEqual((archived.customer_id, archived.employee_id, archived.status, archived.report),
+                         (self.customers[0].pk, self.employees[0].pk, Task.COMPLETED, 'printer fixed 1'))
+
+        # A move changes neither the stats nor the event stream.
+        self.assertEqual(self.client_for(self.manager).get('/tasks/stats/').data, stats)
+        rebuild_task_stats()
+        self.assertEqual(self.client_for(self.manager).get('/tasks/stats/').data, stats)
+        self.assertEqual(TaskEvent.objects.count(), events)
+        self.assertEqual(search_reports(Task.objects.all(), 'printer').count(), 1)
+
+    def test_deletes_within_parameter_limit(self):
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=3):
+            self.assertEqual(self.archive(), 'Archived 4 tasks.\n')
+        self.assertFalse(Task.objects.filter(pk__in=[task.pk for task in self.old]).exists())
+        self.assertEqual(ArchivedTask.objects.count(), 4)
+
+    def test_lists_skip_archive_and_details_fall_back(self):
+        self.archive()
+        customer = self.client_for(self.customers[0])
+        self.assertEqual([task['id'] for task in self.client_for(self.manager).get('/tasks/').data['results']],
+                         [task.pk for task in self.tasks[1::2]])
+
+        response = customer.get(f'/tasks/{self.old[1].pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['id'], response.data['report'], response.data['customer']['username']),
+                         (self.old[1].pk, 'printer fixed 1', 'customer0'))
+        self.assertEqual(customer.get(f'/tasks/{self.old[1].pk}/', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         304)
+        self.assertEqual(customer.get(f'/tasks/{self.old[1].pk}/?fields=id,status').data,
+                         {'id': self.old[1].pk, 'status': Task.COMPLETED})
+        self.assertEqual(self.client_for(self.customers[1]).get(f'/tasks/{self.old[1].pk}/').status_code, 403)
+        self.assertEqual(customer.get('/tasks/999999/').status_code, 404)
+        self.assertEqual(self.client_for(self.employees[0]).patch(f'/tasks/{self.old[1].pk}/complete/',
+                                                                  {'report': 'x'}).status_code, 404)
+
+    def test_exports_merge_archive(self):
+        self.archive()
+
+        def export(user, query=''):
+            response = self.client_for(user).get(f'/tasks/export/{query}')
+            return [json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(export(self.manager), [task.pk for task in self.tasks])
+        self.assertEqual(export(self.customers[0]), [task.pk for task in self.tasks[::2]])
+        self.assertEqual(export(self.manager, '?status=completed&search=printer'),
+                         [task.pk for task in self.tasks[:3]] + [self.old[2].pk, self.old[3].pk])
+        self.assertEqual(export(self.employees[1], '?search=printer'), [self.tasks[1].pk])
+
+    def test_async_detail_and_export(self):
+        self.archive()
+        request = APIRequestFactory().get(f'/tasks/{self.old[0].pk}/')
+        force_authenticate(request, User.objects.get(pk=self.customers[0].pk))
+        response = async_to_sync(AsyncTaskViewSet.as_view({'get': 'retrieve'}))(request, pk=str(self.old[0].pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['report'], 'printer fixed 0')
+
+        request = APIRequestFactory().get('/tasks/export/')
+        force_authenticate(request, User.objects.get(pk=self.manager.pk))
+        response = async_to_sync(AsyncTaskViewSet.as_view({'get': 'export'}, **AsyncTaskViewSet.export.kwargs))(
+            request)
+
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line)['id'] for line in async_to_sync(read)().splitlines()],
+                         [task.pk for task in self.tasks])
+
+
+class TaskArchiveBenchmarkTest(CacheIsolationMixin, TestCase):
+    """
+    Archiving the 90% of tasks that were completed long ago leaves the first
+    task list page with the same queries for every role.
+
+    Set BENCHMARK_ARCHIVE_TASKS=1000000 to seed a production-sized table and
+    time the first list pages before and after archiving.
+    """
+    task_count = int(os.environ.get('BENCHMARK_ARCHIVE_TASKS', 2000))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', User.EMPLOYEE, perms=['can_view_all_tasks'])
+        customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(50)]
+        employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(50)]
+        cls.users = {'manager': cls.manager, 'customer': customers[0], 'employee': employees[0]}
+
+        rng = random.Random(0)
+        now = timezone.now()
+        tasks = []
+        for i in range(cls.task_count):
+            if i % 10:
+                status, closed_at = Task.COMPLETED, now - timedelta(days=rng.randrange(31, 365))
+            else:
+                status, closed_at = rng.choice([Task.PENDING, Task.IN_PROGRESS]), None
+            employee = None if status == Task.PENDING else rng.choice(employees)
+            tasks.append(Task(customer=rng.choice(customers), employee=employee, status=status,
+                              closed_at=closed_at, report='done' if closed_at else ''))
+        Task.objects.bulk_create(tasks, batch_size=5000)
+
+    def clients(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        for name, user in self.users.items():
+            client = APIClient()
+            client.force_authenticate(User.objects.get(pk=user.pk))
+            client.get('/tasks/')
+            yield name, client
+
+    def archive(self):
+        moved = archive_tasks(timezone.now() - timedelta(days=30), batch_size=5000)
+        self.assertEqual(moved, self.task_count * 9 // 10)
+        self.assertEqual(Task.objects.count() + ArchivedTask.objects.count(), self.task_count)
+        return moved
+
+    def list_queries(self):
+        counts = {}
+        for name, client in self.clients():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(client.get('/tasks/').status_code, 200)
+            counts[name] = len(ctx)
+        return counts
+
+    def test_list_queries_unchanged(self):
+        before = self.list_queries()
+        self.archive()
+        self.assertEqual(self.list_queries(), before)
+
+    def time_lists(self):
+        timings = {}
+        for name, client in self.clients():
+            started = time.perf_counter()
+            for _ in range(5):
+                self.assertEqual(client.get('/tasks/').status_code, 200)
+            timings[name] = (time.perf_counter() - started) / 5
+        return timings
+
+    @skipUnless('BENCHMARK_ARCHIVE_TASKS' in os.environ, 'set BENCHMARK_ARCHIVE_TASKS to time list pages')
+    def test_list_latency(self):
+        before = self.time_lists()
+        moved = self.archive()
+        after = self.time_lists()
+        print(f'\nfirst list page, {self.task_count} tasks, {moved} archived')
+        for name in self.users:
+            print(f'{name}: {before[name] * 1000:.2f} ms -> {after[name] * 1000:.2f} ms')
+
+
+def parse_metrics(text):
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            sample, _, value = line.rpartition(' ')
+            samples[sample] = float(value)
+    return samples
+
+
+@override_settings(METRICS_DIR=None)
+class RequestMetricsTest(CacheIsolationMixin, TestCase):
+    """
+    Set BENCHMARK_METRICS=1 to measure the middleware overhead against its budget.
+    """
+    overhead_budget_seconds = 100e-6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = create_user('staff')
+        User.objects.filter(pk=cls.staff.pk).update(is_staff=True)
+        cls.customer = create_user('customer', User.CUSTOMER)
+        Task.objects.create(customer=cls.customer)
+
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def test_records_requests(self):
+        client = self.client_for(self.customer)
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/tasks/')
+            client.get('/tasks/')
+        query_count = len(queries)
+        client.get('/tasks/999999/')
+        client.get('/missing/')
+
+        response = self.client_for(self.staff).get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram\n', text)
+        samples = parse_metrics(text)
+        task_list = 'route="task-list",method="GET"'
+        self.assertEqual(samples[f'http_requests_total{{{task_list},status="200"}}'], 2)
+        self.assertEqual(samples['http_requests_total{route="task-detail",method="GET",status="404"}'], 1)
+        self.assertEqual(samples['http_requests_total{route="unmatched",method="GET",status="404"}'], 1)
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{task_list}}}'], 2)
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{task_list},le="+Inf"}}'], 2)
+        self.assertEqual(samples[f'http_request_db_queries_sum{{{task_list}}}'], query_count)
+        self.assertGreater(samples[f'http_request_db_duration_seconds_total{{{task_list}}}'], 0)
+        self.assertGreater(samples[f'http_response_size_bytes_sum{{{task_list}}}'], 0)
+        buckets = [(line.split('le="')[1].split('"')[0], value) for line, value in samples.items()
+                   if line.startswith(f'http_request_db_queries_bucket{{{task_list}')]
+        self.assertEqual(buckets[-1][0], '+Inf')
+        self.assertEqual([value for _, value in buckets], sorted(value for _, value in buckets))
+
+    def test_staff_only(self):
+        self.assertEqual(APIClient().get('/metrics/').status_code, 401)
+        self.assertEqual(self.client_for(self.customer).get('/metrics/').status_code, 403)
+
+    def test_async_views_count_queries(self):
+        async def view(request):
+            await sync_to_async(Task.objects.count)()
+            return HttpResponse('ok')
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/tasks/')
+        request.resolver_match = resolve('/tasks/')
+        async_to_sync(middleware)(request)
+        samples = parse_metrics(metrics_registry.render())
+        self.assertEqual(samples['http_request_db_queries_sum{route="task-list",method="GET"}'], 1)
+        self.assertEqual(samples['http_response_size_bytes_sum{route="task-list",method="GET"}'], 2)
+
+    def test_workers_share_directory(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other_worker = MetricsRegistry()
+            for registry in (metrics_registry, other_worker):
+                registry.observe_request('task-list', 'GET', 200, 0.02, 3, 0.001, 100)
+            other_worker.flush()
+            Path(directory, 'metrics-1-broken.json').write_text('[')
+            samples = parse_metrics(metrics_registry.render())
+        self.assertEqual(samples['http_requests_total{route="task-list",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['http_request_duration_seconds_bucket{route="task-list",method="GET",le="0.01"}'], 0)
+        self.assertEqual(samples['http_request_duration_seconds_bucket{route="task-list",method="GET",le="0.025"}'], 2)
+        self.assertEqual(samples['http_request_db_queries_sum{route="task-list",method="GET"}'], 6)
+
+    def test_requests_stay_in_memory(self):
+        request = RequestFactory().get('/tasks/')
+        request.resolver_match = resolve('/tasks/')
+        response = HttpResponse('ok')
+        middleware = RequestMetricsMiddleware(lambda request: response)
+        metrics_registry.flushed_at = float('-inf')
+        # Only the first request of the flush interval writes the worker's file.
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory), \
+                mock.patch.object(metrics_registry, 'flush', wraps=metrics_registry.flush) as flush, \
+                self.assertNumQueries(0):
+            for _ in range(1000):
+                middleware(request)
+        self.assertEqual(flush.call_count, 1)
+
+    @skipUnless('BENCHMARK_METRICS' in os.environ, 'set BENCHMARK_METRICS to time the middleware')
+    def test_overhead_within_budget(self):
+        request = RequestFactory().get('/tasks/')
+        request.resolver_match = resolve('/tasks/')
+        response = HttpResponse('ok')
+        middleware = RequestMetricsMiddleware(lambda request: response)
+        iterations = 5000
+
+        def timed(handler):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                handler(request)
+            return (time.perf_counter() - started) / iterations
+        overhead = min(timed(middleware) - timed(lambda request: response) for _ in range(3))
+        print(f'\nmetrics middleware overhead: {overhead * 1e6:.1f} us per request')
+        self.assertLess(overhead, self.overhead_budget_seconds)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class SeedDataCommandTest(CacheIsolationMixin, TestCase):
+    def test_seeds_users_and_tasks(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('seed_data', customers=20, employees=5, managers=2, tasks=300, days=30, batch_size=70,
+                         stdout=io.StringIO())
+        # Each task is written once, with its history timestamps.
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "api_task"')])
+        self.assertEqual(User.customer.filter(username__startswith='seed_customer_').count(), 20)
+        self.assertEqual(User.employee.filter(username__startswith='seed_employee_').count(), 5)
+        self.assertEqual(Task.objects.count(), 300)
+        self.assertFalse(TaskEvent.objects.exists())
+        self.assertFalse(Task.objects.filter(closed_at__lt=F('created_at')).exists())
+        self.assertFalse(Task.objects.filter(status=Task.COMPLETED, closed_at=None).exists())
+        self.assertFalse(Task.objects.filter(status=Task.PENDING).exclude(employee=None).exists())
+        # The history is kept, and tasks created afterwards are stamped as usual.
+        self.assertTrue(Task.objects.filter(created_at__lt=timezone.now() - timedelta(days=20)).exists())
+        task = Task.objects.create(customer=User.customer.first())
+        self.assertGreater(task.created_at, timezone.now() - timedelta(minutes=1))
+
+        manager = User.objects.get(username='seed_manager_0')
+        self.assertTrue(manager.has_perm('api.can_view_all_tasks'))
+        self.assertTrue(User.objects.get(username='seed_customer_0').has_perm('api.can_view_employees'))
+        self.assertTrue(User.objects.get(username='seed_admin').is_superuser)
+        response = APIClient().post('/api/token/', {'username': 'seed_employee_0', 'password': SEED_PASSWORD})
+        self.assertEqual(response.status_code, 200)
+
+        def snapshot():
+            return [sorted(tuple(round(value, 3) if isinstance(value, float) else value for value in row)
+                           for row in model.objects.values_list())
+                    for model in (CustomerTaskStats, EmployeeTaskStats, DailyTaskStats)]
+        stats = snapshot()
+        rebuild_task_stats()
+        self.assertEqual(stats, snapshot())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_data', customers=1, tasks=0, stdout=io.StringIO())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS, METRICS_FLUSH_SECONDS=0)
+class BenchmarkCommandTest(CacheIsolationMixin, LiveServerTestCase):
+    def test_reports_every_operation(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', url=self.live_server_url, stdout=io.StringIO())
+        call_command('seed_data', customers=10, employees=3, managers=1, tasks=200, stdout=io.StringIO())
+        metrics_registry.reset()
+
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('benchmark', url=self.live_server_url, clients=1, duration=2, warmup=0,
+                         output=output.name, stdout=io.StringIO())
+            report = json.load(output)
+            stdout = io.StringIO()
+            call_command('benchmark', url=self.live_server_url, clients=1, duration=0.5, warmup=0,
+                         compare=output.name, stdout=stdout)
+
+        self.assertGreaterEqual(report['dataset']['tasks'], 200)
+        operations = report['operations']
+        self.assertLessEqual({'customer tasks.list', 'customer tasks.export', 'customer token.obtain',
+                              'employee tasks.claim', 'manager tasks.stats', 'admin metrics'}, set(operations))
+        for name, operation in operations.items():
+            self.assertFalse([status for status in operation['statuses'] if status.startswith('5')], name)
+            self.assertIn('p95_ms', operation)
+        self.assertEqual(operations['customer tasks.list']['route'], 'task-list')
+        self.assertGreater(operations['customer tasks.list']['queries_per_request'], 0)
+        self.assertIn('customer tasks.list: throughput', stdout.getvalue())
+
+
+class AdminScalabilityTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_superuser=True)
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.customers = [create_user(f'customer{i}', User.CUSTOMER) for i in range(30)]
+        cls.employee = create_user('worker', User.EMPLOYEE)
+        Task.objects.bulk_create([Task(customer=customer, report='printer fixed' if i % 2 else '')
+                                  for i, customer in enumerate(cls.customers)])
+        Task.objects.filter(report='printer fixed').update(status=Task.COMPLETED, employee=cls.employee)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.get(pk=self.admin.pk))
+
+    def changelist(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        _, queries = self.changelist('/admin/api/task/')
+        Task.objects.bulk_create([Task(customer=customer) for customer in self.customers])
+        response, more_queries = self.changelist('/admin/api/task/')
+        self.assertEqual(queries, more_queries)
+        self.assertContains(response, 'customer29')
+        self.assertEqual(response.context['cl'].result_count, 60)
+
+        _, queries = self.changelist('/admin/api/user/?role__exact=customer')
+        create_user('customer30', User.CUSTOMER)
+        response, more_queries = self.changelist('/admin/api/user/?role__exact=customer')
+        self.assertEqual(queries, more_queries)
+        self.assertEqual(response.context['cl'].result_count, 31)
+
+    def test_filters_and_search(self):
+        response, _ = self.changelist('/admin/api/task/?status__exact=completed')
+        self.assertEqual(response.context['cl'].result_count, 15)
+        task = Task.objects.earliest('pk')
+        response, _ = self.changelist(f'/admin/api/task/?q={task.pk}')
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [task.pk])
+        response, _ = self.changelist('/admin/api/task/?q=customer1')
+        self.assertEqual(response.context['cl'].result_count, 11)
+        response, _ = self.changelist('/admin/api/task/?q=worker')
+        self.assertEqual(response.context['cl'].result_count, 15)
+        response, _ = self.changelist('/admin/api/task/?q=printer')
+        self.assertEqual(response.context['cl'].result_count, 15)
+
+        response, _ = self.changelist('/admin/api/user/?q=customer2')
+        self.assertEqual({user.username for user in response.context['cl'].result_list},
+                         {'customer2'} | {f'customer2{i}' for i in range(10)})
+        response, _ = self.changelist(f'/admin/api/user/?{urlencode({"q": self.employee.phone})}')
+        self.assertEqual([user.pk for user in response.context['cl'].result_list], [self.employee.pk])
+
+    def test_change_form_uses_autocomplete(self):
+        task = Task.objects.earliest('pk')
+        response = self.client.get(f'/admin/api/task/{task.pk}/change/')
+        self.assertEqual(response.status_code, 200)
+        # Only the selected customer is rendered, not one option per user.
+        self.assertContains(response, f'<option value="{task.customer_id}" selected>')
+        self.assertNotContains(response, f'<option value="{self.customers[1].pk}"')
+        self.assertContains(response, 'admin-autocomplete')
+
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'api', 'model_name': 'task', 'field_name': 'employee', 'term': 'work'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['worker'])
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'api', 'model_name': 'task', 'field_name': 'customer', 'term': 'work'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_unfiltered_count_is_estimated(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '5000000 1' WHERE tbl = 'api_task'")
+        response, _ = self.changelist('/admin/api/task/')
+        self.assertEqual(response.context['cl'].result_count, 5000000)
+        response, _ = self.changelist('/admin/api/task/?status__exact=pending')
+        self.assertEqual(response.context['cl'].result_count, 15)
+
+
+class TaskDispatchTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_superuser=True)
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.customer = create_user('customer', User.CUSTOMER)
+        cls.employees = [create_user(f'employee{i}', User.EMPLOYEE) for i in range(3)]
+        cls.inactive = create_user('inactive', User.EMPLOYEE)
+        User.objects.filter(pk=cls.inactive.pk).update(is_active=False)
+        for employee, count in zip(cls.employees, (3, 0, 1)):
+            for _ in range(count):
+                Task.objects.create(customer=cls.customer, employee=employee, status=Task.IN_PROGRESS)
+
+    def open_tasks(self):
+        counted = {employee.pk: Task.objects.filter(employee=employee, status=Task.IN_PROGRESS).count()
+                   for employee in self.employees + [self.inactive]}
+        stored = dict(EmployeeTaskStats.objects.values_list('employee', 'in_progress'))
+        self.assertEqual(counted, {pk: stored.get(pk, 0) for pk in counted})
+        return [counted[employee.pk] for employee in self.employees]
+
+    def add_pending(self, count):
+        tasks = Task.objects.bulk_create([Task(customer=self.customer) for _ in range(count)])
+        return [task.pk for task in tasks]
+
+    def test_assigns_least_loaded_first(self):
+        pending = self.add_pending(7)
+        assigned = dispatch_tasks(batch_size=6)
+        self.assertEqual(sum(assigned.values()), 6)
+        self.assertEqual(self.open_tasks(), [4, 3, 3])
+        self.assertEqual(list(Task.objects.pending().values_list('pk', flat=True)), pending[-1:])
+        self.assertFalse(Task.objects.filter(employee=self.inactive).exists())
+
+        self.add_pending(4)
+        dispatch_tasks()
+        self.assertEqual(self.open_tasks(), [5, 5, 5])
+        self.assertEqual(dispatch_tasks(), {})
+
+    def test_max_open(self):
+        self.add_pending(6)
+        assigned = dispatch_tasks(max_open=2)
+        self.assertEqual(assigned, {self.employees[1].pk: 2, self.employees[2].pk: 1})
+        self.assertEqual(self.open_tasks(), [3, 2, 2])
+        self.assertEqual(Task.objects.pending().count(), 3)
+        self.assertEqual(dispatch_tasks(max_open=2), {})
+
+    def test_counters_follow_every_change(self):
+        self.add_pending(4)
+        dispatch_tasks()
+        client = APIClient()
+        client.force_authenticate(self.employees[0])
+        task = Task.objects.filter(employee=self.employees[0]).earliest('pk')
+        self.assertEqual(client.patch(f'/tasks/{task.pk}/complete/', {'report': 'done'}).status_code, 200)
+        self.add_pending(1)
+        self.assertEqual(client.post('/tasks/claim/').status_code, 200)
+
+        admin = Client()
+        admin.force_login(User.objects.get(pk=self.admin.pk))
+        task = Task.objects.filter(employee=self.employees[1], status=Task.IN_PROGRESS).earliest('pk')
+        response = admin.post(f'/admin/api/task/{task.pk}/change/', {
+            'customer': self.customer.pk, 'employee': self.employees[2].pk, 'status': Task.IN_PROGRESS,
+            'report': ''})
+        self.assertEqual(response.status_code, 302)
+        Task.objects.filter(employee=self.employees[2]).last().delete()
+        self.open_tasks()
+        self.assertEqual(least_loaded_employees(10), sorted(
+            (count, employee.pk) for count, employee in zip(self.open_tasks(), self.employees)))
+
+    def test_reads_the_load_index(self):
+        employees = User.objects.bulk_create(
+            User(username=f'idle{i}', role=User.EMPLOYEE, phone=f'+{next(phone_numbers)}') for i in range(1000))
+        EmployeeTaskStats.objects.bulk_create(EmployeeTaskStats(employee=employee) for employee in employees)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with CaptureQueriesContext(connection) as queries:
+            least_loaded_employees(2, max_open=5)
+        sql = queries.captured_queries[0]['sql']
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('employee_load_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_claim_each_skips_claimed_tasks(self):
+        first, second = self.add_pending(2)
+        Task.objects.filter(pk=first).claim(self.employees[0])
+        claimed = Task.objects.claim_each({first: self.employees[1].pk, second: self.employees[2].pk})
+        self.assertEqual(claimed, [second])
+        self.assertEqual(Task.objects.get(pk=first).employee, self.employees[0])
+        self.assertEqual(self.open_tasks(), [4, 0, 2])
+        self.assertEqual(TaskEvent.objects.filter(task_id=second, employee_id=self.employees[2].pk).count(), 1)
+
+    def test_claims_report_only_their_own_rows(self):
+        first, second = self.add_pending(2)
+        # Claims at the same instant by the same employee still tell their
+        # rows apart.
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            self.assertEqual(Task.objects.claim_each({first: self.employees[1].pk}), [first])
+            self.assertEqual(Task.objects.filter(pk=second).claim(self.employees[1]), 1)
+        self.assertEqual(self.open_tasks(), [3, 2, 1])
+        self.assertEqual(TaskEvent.objects.filter(task_id=first, kind=TaskEvent.ASSIGNED).count(), 1)
+
+    def test_round_queries_do_not_grow(self):
+        self.add_pending(10)
+        dispatch_tasks(batch_size=3)
+        with CaptureQueriesContext(connection) as queries:
+            dispatch_tasks(batch_size=3)
+        few = len(queries)
+        self.add_pending(300)
+        with CaptureQueriesContext(connection) as queries:
+            dispatch_tasks(batch_size=3)
+        self.assertEqual(len(queries), few)
+
+    def test_command(self):
+        self.add_pending(5)
+        stdout = io.StringIO()
+        call_command('dispatch_tasks', batch_size=2, once=True, stdout=stdout)
+        self.assertIn('Assigned 5 tasks.', stdout.getvalue())
+        self.assertFalse(Task.objects.pending().exists())
+
+
+class TaskBatchTransitionTest(CacheIsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer', User.CUSTOMER)
+        cls.employee = create_user('employee', User.EMPLOYEE)
+        cls.other = create_user('other', User.EMPLOYEE)
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.employee)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def add_pending(self, count):
+        return [task.pk for task in Task.objects.bulk_create([Task(customer=self.customer) for _ in range(count)])]
+
+    def results(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {item['id']: item['status'] for item in response.data}
+
+    def test_assign_many(self):
+        first, second, third = self.add_pending(3)
+        self.client_for(self.other).patch(f'/tasks/{second}/assign/')
+        response = self.client.post('/tasks/assign/', [{'id': third}, {'id': second}, {'id': first}, {'id': 0}],
+                                    format='json')
+        self.assertEqual([item['id'] for item in response.data], [third, second, first, 0])
+        self.assertEqual(self.results(response), {third: 200, second: 403, first: 200, 0: 404})
+        self.assertEqual(response.data[0]['task'], TaskSerializer(Task.objects.get(pk=third)).data)
+        response = self.client.post('/tasks/assign/', [{'id': first}], format='json')
+        self.assertEqual(response.data[0]['detail'], 'Task is not pending')
+        self.assertEqual(set(Task.objects.filter(employee=self.employee).values_list('pk', flat=True)),
+                         {first, third})
+        self.assertEqual(EmployeeTaskStats.objects.get(employee=self.employee).in_progress, 2)
+
+    def test_complete_many(self):
+        tasks = self.add_pending(5)
+        self.client.post('/tasks/assign/', [{'id': pk} for pk in tasks[:4]], format='json')
+        self.client_for(self.other).patch(f'/tasks/{tasks[4]}/assign/')
+        self.client.patch(f'/tasks/{tasks[3]}/complete/', {'report': 'early'})
+        response = self.client.post('/tasks/complete/', [
+            {'id': tasks[0], 'report': 'first'},
+            {'id': tasks[1], 'report': 'second'},
+            {'id': tasks[2], 'report': ''},
+            {'id': tasks[3], 'report': 'again'},
+            {'id': tasks[4], 'report': 'not mine'},
+            {'id': 0, 'report': 'missing'},
+        ], format='json')
+        self.assertEqual(self.results(response), {tasks[0]: 200, tasks[1]: 200, tasks[2]: 400, tasks[3]: 400,
+                                                  tasks[4]: 403, 0: 404})
+        self.assertEqual(response.data[2]['detail'], 'Report is required to complete the task')
+        self.assertEqual(response.data[3]['detail'], 'Task is not in progress')
+        self.assertEqual(response.data[1]['task']['report'], 'second')
+        completed = Task.objects.filter(status=Task.COMPLETED).order_by('pk')
+        self.assertEqual([(task.pk, task.report) for task in completed],
+                         [(tasks[0], 'first'), (tasks[1], 'second'), (tasks[3], 'early')])
+        self.assertTrue(all(task.closed_at for task in completed))
+        self.assertEqual(EmployeeTaskStats.objects.get(employee=self.employee).in_progress, 1)
+        self.assertEqual(TaskEvent.objects.filter(kind=TaskEvent.COMPLETED).count(), 3)
+        self.assertEqual(list(Task.objects.filter(report__in=['second']).values_list('pk', flat=True)), [tasks[1]])
+
+    def test_complete_many_loses_concurrent_changes(self):
+        first, second = self.add_pending(2)
+        self.client.post('/tasks/assign/', [{'id': first}, {'id': second}], format='json')
+        complete_each = TaskQuerySet.complete_each
+
+        def complete_one_first(reports):
+            Task.objects.filter(pk=second).update(status=Task.PENDING, employee=None)
+            return complete_each(Task.objects.all(), reports)
+
+        with mock.patch.object(TaskQuerySet, 'complete_each', side_effect=complete_one_first):
+            response = self.client.post('/tasks/complete/',
+                                        [{'id': first, 'report': 'a'}, {'id': second, 'report': 'b'}], format='json')
+        self.assertEqual(self.results(response), {first: 200, second: 409})
+
+    def test_invalid_batches(self):
+        pk, = self.add_pending(1)
+        for payload in ([], {'id': pk}, [{'id': pk}, {'id': pk}], [{'id': 'x'}],
+                        [{'id': pk}] * (TaskViewSet.max_bulk_transition + 1)):
+            self.assertEqual(self.client.post('/tasks/assign/', payload, format='json').status_code, 400)
+        customer = self.client_for(self.customer)
+        self.assertEqual(customer.post('/tasks/assign/', [{'id': pk}], format='json').status_code, 403)
+        self.assertEqual(customer.post('/tasks/complete/', [{'id': pk}], format='json').status_code, 403)
+        self.assertTrue(Task.objects.filter(pk=pk).pending().exists())
+
+    def test_queries_do_not_grow_per_task(self):
+        counts = []
+        # The first batch creates the employee's stats rows.
+        for size in (5, 5, 200):
+            pks = self.add_pending(size)
+            with CaptureQueriesContext(connection) as assign:
+                self.client.post('/tasks/assign/', [{'id': pk} for pk in pks], format='json')
+            with CaptureQueriesContext(connection) as complete:
+                response = self.client.post('/tasks/complete/', [{'id': pk, 'report': 'done'} for pk in pks],
+                                            format='json')
+            self.assertEqual(set(self.results(response).values()), {200})
+            counts.append((len(assign), len(complete)))
+        # Only the event INSERTs are split, into chunks sized by the backend's parameter limit.
+        self.assertLess(counts[2][0], counts[1][0] + 3)
+        self.assertLess(counts[2][1], counts[1][1] + 3)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTest(CacheIsolationMixin, TransactionTestCase):
+    """
+    The replica is a second SQLite file that only catches up with the
+    primary when the test calls `sync_replica()`, so stale reads show which
+    database served a request.
+    """
+    alias = 'replica'
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings[self.alias] = {
+            **connections.settings['default'], 'NAME': os.path.join(directory.name, 'replica.sqlite3'),
+        }
+        self.addCleanup(self.remove_alias)
+        self.customer = create_user('customer', User.CUSTOMER)
+        self.other_customer = create_user('other_customer', User.CUSTOMER)
+        self.employee = create_user('employee', User.EMPLOYEE)
+        self.task = Task.objects.create(customer=self.customer)
+        self.sync_replica()
+
+    def remove_alias(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+    def sync_replica(self):
+        for alias in ('default', self.alias):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections[self.alias].connection)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def task_ids(self, client, url='/tasks/'):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [task['id'] for task in response.data['results']]
+
+    def test_reads_go_to_replica(self):
+        new = Task.objects.create(customer=self.other_customer)
+        client = self.client_for(self.other_customer)
+        self.assertEqual(self.task_ids(client), [])
+        self.assertEqual(client.get(f'/tasks/{new.pk}/').status_code, 404)
+        self.sync_replica()
+        self.assertEqual(self.task_ids(client), [new.pk])
+        self.assertEqual(client.get(f'/tasks/{new.pk}/').status_code, 200)
+
+    def test_writers_read_their_writes(self):
+        customer = self.client_for(self.customer)
+        created = customer.post('/tasks/', {}).data['id']
+        self.assertEqual(customer.get(f'/tasks/{created}/').status_code, 200)
+        self.assertEqual(self.task_ids(customer), [self.task.pk, created])
+        # Other users are not pinned; the replica has not caught up yet.
+        self.assertEqual(self.client_for(self.employee).get(f'/tasks/{created}/').status_code, 404)
+
+        employee = self.client_for(self.employee)
+        self.assertEqual(employee.patch(f'/tasks/{created}/assign/').status_code, 200)
+        self.assertEqual(self.task_ids(employee, '/tasks/?status=in_progress'), [created])
+        self.assertEqual(employee.patch(f'/tasks/{created}/complete/', {'report': 'done'}).status_code, 200)
+        self.assertEqual(self.task_ids(employee, '/tasks/?status=completed'), [created])
+
+        # The pin cookie keeps the client on the primary, even on a worker
+        # whose cache lacks the pin; once both expire reads use the replica.
+        cache.clear()
+        self.assertEqual(self.task_ids(employee, '/tasks/?status=completed'), [created])
+        self.assertEqual(employee.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        employee.cookies.clear()
+        self.assertEqual(self.task_ids(employee, '/tasks/?status=completed'), [])
+        self.assertNotIn(PIN_COOKIE, employee.get('/tasks/').cookies)
+
+    def test_replicas_require_a_shared_cache(self):
+        env = {**os.environ, 'SECRET_KEY': 'x', 'DATABASE_REPLICAS': 'replica.sqlite3'}
+        env.pop('REDIS_URL', None)
+        result = subprocess.run([sys.executable, '-c', 'import django; django.setup()'], env=env,
+                                cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertIn('DATABASE_REPLICAS requires a shared cache', result.stderr)
+
+    def test_writes_go_to_primary(self):
+        token = read_database.set(self.alias)
+        try:
+            task = Task.objects.get(pk=self.task.pk)
+            self.assertEqual(task._state.db, self.alias)
+            task.report = 'edited'
+            task.save()
+            self.assertEqual(router.db_for_write(Task, instance=task), 'default')
+        finally:
+            read_database.reset(token)
+        self.assertEqual(Task.objects.using('default').get(pk=self.task.pk).report, 'edited')
+        self.assertEqual(Task.objects.using(self.alias).get(pk=self.task.pk).report, '')
+
+    def test_other_requests_use_primary(self):
+        new = Task.objects.create(customer=self.customer)
+        employee = self.client_for(self.employee)
+        # Authentication, and requests outside the replica views, read from
+        # the primary even right after a replica read on the same thread.
+        self.assertEqual(self.task_ids(employee), [self.task.pk])
+        self.assertEqual(employee.patch(f'/tasks/{new.pk}/assign/').status_code, 200)
+        self.assertEqual(Task.objects.filter(pk__in=[new.pk], status=Task.IN_PROGRESS).count(), 1)
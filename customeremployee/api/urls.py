@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CurrentUserView, TaskViewSet, CustomerRegisterView, EmployeeRegisterView, EmployeeListView
+from .views import (CurrentUserView, TaskViewSet, CustomerRegisterView, EmployeeRegisterView, EmployeeListView,
+                    MetricsView)
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+if settings.ASYNC_READ_VIEWS:
+    # Under ASGI the read endpoints are served by their async variants.
+    from .async_views import (AsyncCurrentUserView as CurrentUserView, AsyncEmployeeListView as EmployeeListView,
+                              AsyncTaskViewSet as TaskViewSet)
+
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
 
@@ -14,6 +21,7 @@ urlpatterns = [
     path('register/employee/', EmployeeRegisterView.as_view(), name='employee_register'),
     path('employees/', EmployeeListView.as_view(), name='employee-list'),
     path('me/', CurrentUserView.as_view(), name='current_user'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('tasks/<int:pk>/assign/', TaskViewSet.as_view({'patch': 'assign'}), name='task_assign'),
     path('tasks/<int:pk>/complete/', TaskViewSet.as_view({'patch': 'complete'}), name='task_complete'),
 ]
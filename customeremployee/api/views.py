@@ -1,69 +1,285 @@
+import hashlib
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from operator import itemgetter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import F, Max, Q, Sum
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import viewsets, permissions, generics, status
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import User, Task
+from .directory import directory_cache, directory_page_key
+from .events import event_data, task_event_bus
+from .filters import TaskFilterBackend
+from .metrics import metrics_registry
+from .models import ArchivedTask, CustomerTaskStats, DailyTaskStats, EmployeeTaskStats, User, Task, TaskEvent
+from .pagination import KeysetPagination, TaskPagination
 from .permissions import (IsCustomerOrSuperuser, IsEmployeeOrSuperuser, CanViewTask, CanAddCustomer, CanAddEmployee,
-                          CanViewEmployees)
-from .serializers import RegisterSerializer, UserSerializer, TaskSerializer
+                          CanViewAllTasks, CanViewEmployees)
+from .renderers import CSVRenderer, EventStreamRenderer, NDJSONRenderer, PrometheusRenderer
+from .routers import read_from_primary, read_from_replica
+from .serializers import (RegisterSerializer, UserSerializer, TaskSerializer, TaskReadSerializer, SparseFieldsMixin,
+                          TaskIdSerializer, TaskCompletionSerializer, TaskStatsQuerySerializer,
+                          EmployeeTaskStatsSerializer, CustomerTaskStatsSerializer, DailyTaskStatsSerializer)
 
 
-class CustomerRegisterView(generics.CreateAPIView):
-    queryset = User.objects.all()
-    serializer_class = RegisterSerializer
-    permission_classes = [IsAuthenticated, IsEmployeeOrSuperuser, CanAddCustomer]
+class BulkCreateMixin:
+    """
+    Lets `create` accept a list of up to `max_bulk_create` items, validated
+    and saved through the serializer's list serializer.
+    """
+    max_bulk_create = 1000
 
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False,
+                                         max_length=self.max_bulk_create)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ReadSerializerMixin:
+    """
+    Serializes responses with `get_read_serializer()`: `read_serializer_class`
+    when set, otherwise `serializer_class`, which still handles writes and the
+    browsable API's forms. Serializers with `SparseFieldsMixin` are narrowed
+    to the `?fields=` / `?expand=` selection, and `select_fields()` narrows a
+    queryset's columns and joins to match.
+    """
+    read_serializer_class = None
+
+    def get_field_selection(self):
+        if not hasattr(self, '_field_selection'):
+            serializer_class = self.get_serializer_class()
+            self._field_selection = None
+            if issubclass(serializer_class, SparseFieldsMixin):
+                self._field_selection = serializer_class.parse_field_selection(self.request.query_params)
+        return self._field_selection
+
+    def get_read_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', {**self.get_serializer_context(),
+                                      'field_selection': self.get_field_selection()})
+        return (self.read_serializer_class or self.get_serializer_class())(*args, **kwargs)
+
+    def get_field_paths(self):
+        selection = self.get_field_selection()
+        if selection is None:
+            return None
+        return self.get_serializer_class()(context={'field_selection': selection}).get_field_paths()
+
+    def select_fields(self, queryset):
+        paths = self.get_field_paths()
+        if paths is None:
+            return queryset
+        only, related = paths
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        # The paginator positions its cursors on the ordering fields.
+        return queryset.only(*only, *getattr(self.paginator, 'ordering', ()))
+
+
+class ConditionalGetMixin:
+    """
+    Answers GET requests whose If-None-Match / If-Modified-Since still match
+    with 304 Not Modified before anything is serialized.
+
+    `list` fingerprints the requested page with the values of `pk`, the
+    ordering fields and `list_fingerprint_fields`, which must change whenever
+    a listed row's representation does. Pages are serialized with
+    `get_read_serializer()` from `ReadSerializerMixin`.
+    """
+    list_fingerprint_fields = ()
+
+    @staticmethod
+    def fingerprint(*parts):
+        return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+    def not_modified(self, request, etag, last_modified=None):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return get_conditional_response(request, etag=quote_etag(etag), last_modified=timestamp)
+
+    def set_validators(self, response, etag, last_modified=None):
+        response.headers.setdefault('ETag', quote_etag(etag))
+        if last_modified:
+            response.headers.setdefault('Last-Modified', http_date(int(last_modified.timestamp())))
         return response
 
+    def conditional_response(self, request, respond, etag, last_modified=None):
+        response = self.not_modified(request, etag, last_modified) or respond()
+        return self.set_validators(response, etag, last_modified)
+
+    def get_list_fingerprint_fields(self):
+        return self.list_fingerprint_fields
+
+    def fingerprint_values(self, queryset):
+        return queryset.values('pk', *self.paginator.ordering, *self.get_list_fingerprint_fields())
+
+    def list_etag(self, request, rows):
+        return self.fingerprint(request.get_full_path(), rows,
+                                self.paginator.get_next_link(), self.paginator.get_previous_link())
+
+    def list(self, request, *args, **kwargs):
+        # The page is read as a values() query over the same index range as
+        # the real one, so validating costs one narrow query and no COUNT(*).
+        # Rows can leave a page without any timestamp moving, so lists only
+        # get an ETag, never a Last-Modified.
+        queryset = self.fingerprint_values(self.filter_queryset(self.get_queryset()))
+        rows = self.paginate_queryset(queryset)
+        if rows is None:
+            rows = list(queryset)
+        etag = self.list_etag(request, rows)
+        return self.conditional_response(request, partial(self.page_response, request), etag)
+
+    def page_response(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.get_read_serializer(queryset, many=True).data)
+        return self.get_paginated_response(self.get_read_serializer(page, many=True).data)
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe requests from a read replica, if there are any, once the
+    user is authenticated and allowed in: authentication and permission
+    checks read from the primary, as do users pinned there after a write.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS:
+            read_from_replica(request)
+
+
+class RegisterViewMixin(BulkCreateMixin):
+    # Every user costs a full password hash, which bounds the batch size.
+    max_bulk_create = 100
+    password_executor = None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['password_executor'] = self.password_executor
+        return context
+
+    def create(self, request, *args, **kwargs):
+        # A single user is hashed inline; only batches pay for the pool.
+        if not isinstance(request.data, list) or len(request.data) < 2:
+            return super().create(request, *args, **kwargs)
+        with ThreadPoolExecutor() as self.password_executor:
+            return super().create(request, *args, **kwargs)
+
+
+class CustomerRegisterView(RegisterViewMixin, generics.CreateAPIView):
+    queryset = User.objects.all()
+    serializer_class = RegisterSerializer
+    permission_classes = [IsAuthenticated, IsEmployeeOrSuperuser, CanAddCustomer]
+
     def perform_create(self, serializer):
         serializer.save(role=User.CUSTOMER)
 
 
-class EmployeeRegisterView(generics.CreateAPIView):
+class EmployeeRegisterView(RegisterViewMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
     permission_classes = [IsAuthenticated, IsEmployeeOrSuperuser, CanAddEmployee]
 
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        return response
-
     def perform_create(self, serializer):
         serializer.save(role=User.EMPLOYEE)
 
 
-class EmployeeListView(generics.ListAPIView):
+class EmployeeListView(ReplicaReadMixin, ReadSerializerMixin, ConditionalGetMixin, generics.ListAPIView):
+    """
+    Serves serialized pages from the employee directory cache, which the
+    receivers in `signals.py` invalidate whenever an employee changes.
+    """
     queryset = User.employee.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsCustomerOrSuperuser, CanViewEmployees]
+    pagination_class = KeysetPagination
+    # The only query parameters that change a page; requests differing in
+    # others share its cache entry.
+    page_params = (KeysetPagination.cursor_query_param, KeysetPagination.page_size_query_param, 'fields', 'expand')
 
+    def get_queryset(self):
+        return self.select_fields(super().get_queryset())
+
+    def page_url(self, request):
+        query = urlencode([(name, request.query_params[name]) for name in self.page_params
+                           if name in request.query_params])
+        return request.build_absolute_uri(f'{request.path}?{query}')
+
+    def list(self, request, *args, **kwargs):
+        cache = directory_cache()
+        key = directory_page_key(self.page_url(request))
+        entry = cache.get(key)
+        if entry is None:
+            # Filled from the primary: a lagging replica could put a page in
+            # the cache after the change that invalidated it.
+            with read_from_primary():
+                data = self.page_response(request).data
+            entry = (self.fingerprint(data), data)
+            cache.set(key, entry, settings.EMPLOYEE_DIRECTORY_CACHE_TIMEOUT)
+        etag, data = entry
+        return self.conditional_response(request, lambda: Response(data), etag)
 
-class CurrentUserView(APIView):
+
+class CurrentUserView(ReplicaReadMixin, ReadSerializerMixin, ConditionalGetMixin, generics.GenericAPIView):
+    serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
-        return Response(serializer.data)
+        etag = self.fingerprint(request.user.pk, request.user.token_version, self.get_field_selection())
+        return self.conditional_response(request, lambda: Response(self.get_read_serializer(request.user).data),
+                                         etag)
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(ReplicaReadMixin, ReadSerializerMixin, ConditionalGetMixin, BulkCreateMixin,
+                  viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    read_serializer_class = TaskReadSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TaskPagination
+    filter_backends = [TaskFilterBackend]
+    lookup_value_regex = r'\d+'
+    claim_candidates = 10
+    max_bulk_create = 5000
+    max_bulk_transition = 500
+    export_chunk_size = 2000
+    export_fields = ('id', 'status', 'customer_id', 'customer__username', 'employee_id', 'employee__username',
+                     'created_at', 'updated_at', 'closed_at', 'report')
+    list_fingerprint_fields = ('updated_at', 'customer__token_version', 'employee__token_version')
+    events_batch_size = 100
+    events_poll_seconds = 15
+    events_stream_seconds = 300
+    events_long_poll_seconds = 10
+    events_retry_milliseconds = 2000
 
     def get_permissions(self):
         if self.action == 'create':
             if self.request.user.has_perm('api.can_create_task'):
                 return [permissions.IsAuthenticated()]
             return [permissions.IsAuthenticated(), IsCustomerOrSuperuser()]
-        elif self.action in ['assign', 'complete']:
+        elif self.action in ['assign', 'assign_many', 'claim', 'complete', 'complete_many']:
             return [permissions.IsAuthenticated(), IsEmployeeOrSuperuser()]
+        elif self.action == 'stats':
+            return [permissions.IsAuthenticated(), CanViewAllTasks()]
         elif self.action == 'retrieve':
             if self.request.user.has_perm('api.can_view_all_tasks'):
                 return [permissions.IsAuthenticated()]
@@ -71,25 +287,188 @@ class TaskViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
+        queryset = Task.objects.select_related('customer', 'employee')
         if self.action == 'list':
-            user = self.request.user
-            if user.has_perm('api.can_view_all_tasks'):
-                return Task.objects.all()
-            elif user.role == User.EMPLOYEE:
-                return Task.objects.filter(employee=user) | Task.objects.filter(employee=None)
-            elif user.role == User.CUSTOMER:
-                return Task.objects.filter(customer=user)
-        return Task.objects.all()
+            queryset = self.select_fields(queryset)
+        if self.action in ('list', 'export'):
+            return self.scope_queryset(queryset)
+        return queryset
+
+    def scope_queryset(self, queryset):
+        user = self.request.user
+        if user.has_perm('api.can_view_all_tasks'):
+            return queryset
+        elif user.role == User.EMPLOYEE:
+            return queryset.filter(Q(employee=user) | Q(employee=None))
+        elif user.role == User.CUSTOMER:
+            return queryset.filter(customer=user)
+        return queryset
+
+    def get_archived_object(self):
+        task = get_object_or_404(ArchivedTask.objects.select_related('customer', 'employee'),
+                                 pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        self.check_object_permissions(self.request, task)
+        return task
+
+    def get_list_fingerprint_fields(self):
+        # Related users only matter to the page when they are rendered.
+        paths = self.get_field_paths()
+        if paths is None:
+            return self.list_fingerprint_fields
+        return [field for field in self.list_fingerprint_fields
+                if '__' not in field or field.partition('__')[0] in paths[1]]
+
+    def task_etag(self, task):
+        return self.fingerprint(task.pk, task.updated_at, task.customer.token_version,
+                                getattr(task.employee, 'token_version', None), self.get_field_selection())
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            task = self.get_object()
+        except Http404:
+            # Completed tasks may have been moved to the archive.
+            task = self.get_archived_object()
+        return self.conditional_response(request, lambda: Response(self.get_read_serializer(task).data),
+                                         self.task_etag(task), task.updated_at)
+
+    def export_columns(self):
+        return [field.replace('__', '_') for field in self.export_fields]
+
+    def export_querysets(self):
+        # Exports include archived tasks, scoped and filtered the same way.
+        return [self.filter_queryset(self.get_queryset()),
+                self.filter_queryset(self.scope_queryset(ArchivedTask.objects.all()))]
+
+    def export_rows(self, queryset):
+        # values_list() skips model instances and serializers; iterating it in
+        # chunks keeps memory flat however many tasks are exported.
+        return queryset.order_by('created_at', 'id').values_list(*self.export_fields)
+
+    def export_key(self):
+        # Both tables are read in the same order and merged on it.
+        return itemgetter(self.export_fields.index('created_at'), self.export_fields.index('id'))
+
+    def export_response(self, request, content):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="tasks.{renderer.format}"'
+        return response
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        rows = heapq.merge(*(self.export_rows(queryset).iterator(chunk_size=self.export_chunk_size)
+                             for queryset in self.export_querysets()), key=self.export_key())
+        return self.export_response(request, request.accepted_renderer.stream(self.export_columns(), rows))
+
+    def events_start(self, request):
+        # Resumes after Last-Event-ID (EventSource sends it on reconnect) or
+        # ?last_event_id=; a new stream starts at the latest event.
+        value = request.headers.get('Last-Event-ID', request.query_params.get('last_event_id'))
+        if value is None:
+            return TaskEvent.objects.streamed().aggregate(last=Max('stream_id'))['last'] or 0
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            raise ValidationError({'last_event_id': ['A valid integer is required.']})
+
+    def events_batch(self, events, last_id):
+        return list(events.filter(stream_id__gt=last_id).order_by('stream_id')[:self.events_batch_size])
+
+    def events_reset_id(self, last_id):
+        # Events after `last_id` were pruned, so the client must refetch its
+        # tasks and resume from just before the oldest event kept.
+        oldest = TaskEvent.objects.streamed().order_by('stream_id').values_list('stream_id', flat=True).first()
+        if last_id and oldest is not None and oldest > last_id + 1:
+            return oldest - 1
+        return None
+
+    def events_response(self, content):
+        response = StreamingHttpResponse(content, content_type='text/event-stream; charset=utf-8')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def event_stream(self, renderer, events, last_id):
+        # A sync worker is held for as long as the response streams, so this
+        # is a long poll: it ends once it has sent events, or after
+        # `events_long_poll_seconds`, well within the worker timeout, and
+        # EventSource reconnects with Last-Event-ID. `aevent_stream()` keeps
+        # streams open on the event loop instead.
+        deadline = time.monotonic() + self.events_long_poll_seconds
+        yield renderer.retry(self.events_retry_milliseconds)
+        reset_id = self.events_reset_id(last_id)
+        if reset_id is not None:
+            last_id = reset_id
+            yield renderer.event(last_id, 'reset', {})
+        while True:
+            version = task_event_bus.version
+            batch = self.events_batch(events, last_id)
+            for event in batch:
+                yield renderer.event(event.stream_id, event.kind, event_data(event))
+            if batch:
+                last_id = batch[-1].stream_id
+            if len(batch) == self.events_batch_size:
+                continue
+            remaining = deadline - time.monotonic()
+            if batch or reset_id is not None or remaining <= 0:
+                return
+            task_event_bus.wait(version, remaining)
+
+    @action(detail=False, renderer_classes=[EventStreamRenderer])
+    def events(self, request):
+        """
+        Streams task changes the user may see as Server-Sent Events. Each
+        stream ends after `events_stream_seconds` under ASGI, or sooner as a
+        long poll under WSGI, and the client reconnects with Last-Event-ID.
+        """
+        last_id = self.events_start(request)
+        events = TaskEvent.objects.visible_to(request.user).streamed()
+        return self.events_response(self.event_stream(request.accepted_renderer, events, last_id))
+
+    @action(detail=False)
+    def stats(self, request):
+        query = TaskStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        days, limit = query.validated_data['days'], query.validated_data['limit']
+
+        # Served from the summary tables kept by `stats.apply_task_changes`,
+        # never from aggregates over the task table.
+        totals = CustomerTaskStats.objects.aggregate(
+            **{field: Sum(field) for field in ('pending', 'in_progress', 'completed', 'completion_count',
+                                               'completion_seconds')})
+        employees = EmployeeTaskStats.objects.select_related('employee').order_by('-completed', 'pk')[:limit]
+        customers = (CustomerTaskStats.objects.select_related('customer')
+                     .order_by((F('pending') + F('in_progress')).desc(), 'pk')[:limit])
+        daily = DailyTaskStats.objects.filter(date__gt=timezone.localdate() - timedelta(days=days)).order_by('date')
+        return Response({
+            'status_counts': {status: totals[status] or 0 for status in (Task.PENDING, Task.IN_PROGRESS,
+                                                                         Task.COMPLETED)},
+            'mean_completion_seconds': (totals['completion_seconds'] / totals['completion_count']
+                                        if totals['completion_count'] else None),
+            'employees': EmployeeTaskStatsSerializer(employees, many=True).data,
+            'customers': CustomerTaskStatsSerializer(customers, many=True).data,
+            'daily': DailyTaskStatsSerializer(daily, many=True).data,
+        })
 
     @action(detail=True, methods=['patch'])
     def assign(self, request, pk=None):
-        task = self.get_object()
-        if task.status != Task.PENDING:
-            return Response({'detail': 'Task is not pending'}, status=status.HTTP_400_BAD_REQUEST)
-        task.employee = request.user
-        task.status = Task.IN_PROGRESS
-        task.save()
-        return Response(TaskSerializer(task).data)
+        if not Task.objects.filter(pk=pk).claim(request.user):
+            if not Task.objects.filter(pk=pk).exists():
+                raise Http404
+            return Response({'detail': 'Task is not pending'}, status=status.HTTP_409_CONFLICT)
+        return Response(TaskSerializer(self.get_object()).data)
+
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        candidates = list(Task.objects.pending().order_by('created_at', 'id')
+                          .values_list('pk', flat=True)[:self.claim_candidates])
+        if not candidates:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        for pk in candidates:
+            if Task.objects.filter(pk=pk).claim(request.user):
+                return Response(TaskSerializer(self.get_queryset().get(pk=pk)).data)
+        return Response({'detail': 'Pending tasks were claimed concurrently, try again'},
+                        status=status.HTTP_409_CONFLICT)
 
     @action(detail=True, methods=['patch'])
     def complete(self, request, pk=None):
@@ -101,12 +480,87 @@ class TaskViewSet(viewsets.ModelViewSet):
         if 'report' not in request.data or not request.data['report']:
             return Response({'detail': 'Report is required to complete the task'}, status=status.HTTP_400_BAD_REQUEST)
 
-        task.status = Task.COMPLETED
-        task.report = request.data['report']
-        task.closed_at = timezone.now()
-        task.save()
+        # Completed only if nobody completed or reassigned it since the read.
+        now = Task.objects.filter(pk=task.pk).complete(task.employee_id, request.data['report'])
+        if now is None:
+            return Response({'detail': 'Task was changed concurrently'}, status=status.HTTP_409_CONFLICT)
+        task.status, task.report, task.closed_at, task.updated_at = Task.COMPLETED, request.data['report'], now, now
 
         return Response(TaskSerializer(task).data)
 
+    def get_batch(self, serializer_class):
+        serializer = serializer_class(data=self.request.data, many=True, allow_empty=False,
+                                      max_length=self.max_bulk_transition)
+        serializer.is_valid(raise_exception=True)
+        items = {item['id']: item for item in serializer.validated_data}
+        if len(items) < len(serializer.validated_data):
+            raise ValidationError('Each task may only be listed once.')
+        return items
+
+    def get_batch_objects(self, pks):
+        """
+        The tasks of `pks` the user may change, by pk, and the results of the
+        others: what `get_object()` would have answered for them.
+        """
+        tasks = self.get_queryset().in_bulk(pks)
+        checks = self.get_permissions()
+        results = {}
+        for pk in pks:
+            if pk not in tasks:
+                results[pk] = (status.HTTP_404_NOT_FOUND, NotFound.default_detail)
+            elif not all(permission.has_object_permission(self.request, self, tasks[pk]) for permission in checks):
+                results[pk] = (status.HTTP_403_FORBIDDEN, PermissionDenied.default_detail)
+                del tasks[pk]
+        return tasks, results
+
+    def batch_response(self, pks, changed, results):
+        """
+        One result per task, in request order: the task as the single
+        endpoints return it for the `changed` ones, the status code and detail
+        the single endpoints would have responded with for the others.
+        """
+        tasks = self.get_queryset().in_bulk(changed)
+        data = dict(zip(tasks, self.get_read_serializer(list(tasks.values()), many=True).data))
+        return Response([{'id': pk, 'status': status.HTTP_200_OK, 'task': data[pk]} if pk in data
+                         else {'id': pk, 'status': results[pk][0], 'detail': results[pk][1]} for pk in pks])
+
+    @action(detail=False, methods=['post'], url_path='assign')
+    def assign_many(self, request):
+        pks = list(self.get_batch(TaskIdSerializer))
+        tasks, results = self.get_batch_objects(pks)
+        pending = [pk for pk, task in tasks.items() if task.status == Task.PENDING and task.employee_id is None]
+        claimed = Task.objects.claim_each(dict.fromkeys(pending, request.user.pk)) if pending else []
+        for pk in tasks.keys() - set(claimed):
+            results[pk] = (status.HTTP_409_CONFLICT, 'Task is not pending')
+        return self.batch_response(pks, claimed, results)
+
+    @action(detail=False, methods=['post'], url_path='complete')
+    def complete_many(self, request):
+        items = self.get_batch(TaskCompletionSerializer)
+        tasks, results = self.get_batch_objects(list(items))
+        reports = {}
+        for pk, task in tasks.items():
+            if task.status != Task.IN_PROGRESS:
+                results[pk] = (status.HTTP_400_BAD_REQUEST, 'Task is not in progress')
+            elif not items[pk].get('report'):
+                results[pk] = (status.HTTP_400_BAD_REQUEST, 'Report is required to complete the task')
+            else:
+                reports[pk] = items[pk]['report']
+        completed = Task.objects.complete_each(reports) if reports else []
+        for pk in reports.keys() - set(completed):
+            results[pk] = (status.HTTP_409_CONFLICT, 'Task was changed concurrently, try again')
+        return self.batch_response(list(items), completed, results)
+
     def destroy(self, request, *args, **kwargs):
         raise PermissionDenied("Deleting tasks is not allowed.")
+
+
+class MetricsView(APIView):
+    """
+    Request metrics of every worker in the Prometheus text format.
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -13,6 +13,8 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,27 +47,37 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = 'api.User'
 
+AUTHENTICATION_BACKENDS = [
+    'customeremployee.api.backends.CachedModelBackend',
+]
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'customeremployee.api.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'customeremployee.api.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=10),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'TOKEN_OBTAIN_SERIALIZER': 'customeremployee.api.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'customeremployee.api.serializers.ClaimsTokenRefreshSerializer',
 }
 
 
 MIDDLEWARE = [
+    'customeremployee.api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'customeremployee.api.middleware.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -90,18 +102,108 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'customeremployee.wsgi.application'
 
+# Serve the read endpoints from the async views in `api/async_views.py`;
+# `asgi.py` turns this on, since under WSGI every async view costs an
+# event loop per request.
+ASYNC_READ_VIEWS = bool(os.environ.get('ASYNC_READ_VIEWS'))
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# SQLite by default; set POSTGRES_DB (with POSTGRES_USER, POSTGRES_PASSWORD,
+# POSTGRES_HOST and POSTGRES_PORT) to use PostgreSQL. Connections are kept open
+# for CONN_MAX_AGE seconds and reused across requests.
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+            # A file rather than the default in-memory database, so that tests can
+            # exercise concurrent connections from several threads.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Read replicas: set DATABASE_REPLICAS to comma-separated replica hosts under
+# PostgreSQL, or database files under SQLite, kept in sync with the primary
+# by replication. Safe requests to the task, employee and current user views
+# read from a random replica, except for users who wrote through the API in
+# the last REPLICA_PIN_SECONDS, who read their own writes from the primary.
+
+for number, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST' if os.environ.get('POSTGRES_DB') else 'NAME': replica.strip(),
+        # Tests read the test database through replica aliases.
+        'TEST': {'MIRROR': 'default'},
     }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+DATABASE_ROUTERS = ['customeremployee.api.routers.ReplicaRouter']
+
+# Applied to every new SQLite connection: writers wait up to busy_timeout ms
+# for the lock instead of failing with "database is locked". WAL, which lets
+# readers run alongside a writer, is stored in the database file and set once
+# by the api.0010_sqlite_wal migration.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Process-local by default; set REDIS_URL to share the cache between workers.
+# PERMISSION_CACHE_TIMEOUT is how many seconds a user's permission set stays
+# cached. Changes invalidate it earlier, but only in the cache of the worker
+# that made them, so a process-local cache keeps it short.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+    PERMISSION_CACHE_TIMEOUT = 60 * 60
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    PERMISSION_CACHE_TIMEOUT = 30
+
+if REPLICA_DATABASES and CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+    # Pins to the primary are kept in the cache, which every worker must see.
+    raise ImproperlyConfigured('DATABASE_REPLICAS requires a shared cache: set REDIS_URL.')
+
+# Request metrics served at /metrics/. Set METRICS_DIR to a directory shared by
+# the workers of a host so that every worker reports their sum; each worker
+# writes its counts there at most every METRICS_FLUSH_SECONDS.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = 1
+
+# Cache alias and lifetime of the serialized /employees/ pages.
+EMPLOYEE_DIRECTORY_CACHE = 'default'
+EMPLOYEE_DIRECTORY_CACHE_TIMEOUT = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 